@@ -0,0 +1,176 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+from hp_oscilloscope.serial_transport import SerialTransport
+
+
+class Sample(NamedTuple):
+    instrument: str
+    started: float  # shared clock time when the read was issued
+    timestamp: float  # shared clock time when the reading arrived
+    value: Any
+
+
+class SharedClock:
+    """
+    monotonic clock common to all the sessions, counting seconds from its creation
+    """
+    def __init__(self):
+        self.origin = time.monotonic()
+
+    def now(self) -> float:
+        return time.monotonic() - self.origin
+
+
+class InstrumentSession:
+    """
+    asyncio wrapper around a blocking instrument read
+
+    every session owns a single-thread executor, so a blocking read of one instrument never
+    waits for the read of another one, while the reads of the same instrument stay in order
+    (transports are not thread-safe)
+    """
+    def __init__(
+        self, name: str, acquire: Callable[[], Any], clock: Optional[SharedClock] = None,
+        close: Optional[Callable[[], None]] = None
+    ):
+        """
+        :param name: label of the samples produced by the session
+        :param acquire: blocking call returning a single reading
+        :param clock: clock shared with the other sessions, new one if omitted
+        :param close: called when the session is closed, to release the transport
+        """
+        self.name = name
+        self.acquire = acquire
+        self.clock = clock or SharedClock()
+        self._close = close
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+
+    def _timed_acquire(self) -> Sample:
+        started = self.clock.now()
+        value = self.acquire()
+        return Sample(self.name, started, self.clock.now(), value)
+
+    async def read(self) -> Sample:
+        """
+        take a single reading without blocking the event loop
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._timed_acquire)
+
+    async def stream(
+        self, queue: asyncio.Queue, count: Optional[int] = None,
+        stop: Optional[asyncio.Event] = None
+    ):
+        """
+        keep reading and putting samples into the queue
+        :param queue: destination of the samples
+        :param count: amount of readings, unlimited if omitted
+        :param stop: event that ends the stream after the current reading
+        """
+        taken = 0
+        while (count is None or taken < count) and not (stop is not None and stop.is_set()):
+            await queue.put(await self.read())
+            taken += 1
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        if self._close is not None:
+            self._close()
+
+
+class ScopeSession(InstrumentSession):
+    """
+    session digitizing and downloading waveforms from the HP54645D
+    """
+    def __init__(
+        self, transport: SerialTransport, clock: Optional[SharedClock] = None,
+        name: str = 'HP54645D', digitize_command: bytes = b':DIGITIZE CHANNEL1'
+    ):
+        self.transport = transport
+        self.digitize_command = digitize_command
+        super().__init__(name, self.capture, clock, close=transport.close)
+
+    def capture(self):
+        self.transport.write(self.digitize_command)
+        return self.transport.query_block(b':WAVEFORM:DATA?')
+
+
+class DmmSession(InstrumentSession):
+    """
+    session taking single readings from a VISA multimeter, like the Agilent 34410A
+    """
+    def __init__(
+        self, resource, clock: Optional[SharedClock] = None, name: str = '34410A',
+        query: str = 'READ?'
+    ):
+        """
+        :param resource: opened pyvisa resource (or anything with the same 'query' method)
+        """
+        self.resource = resource
+        self.query = query
+        super().__init__(name, self.reading, clock, close=resource.close)
+
+    def reading(self) -> float:
+        return float(self.resource.query(self.query))
+
+
+class SessionGroup:
+    """
+    several instrument sessions streaming at the same time, all timestamped with one clock
+    """
+    def __init__(self, sessions: Sequence[InstrumentSession]):
+        self.sessions = list(sessions)
+        self.clock = self.sessions[0].clock if self.sessions else SharedClock()
+        for session in self.sessions:
+            session.clock = self.clock
+
+    async def stream(
+        self, duration: Optional[float] = None, count: Optional[int] = None,
+        queue_size: int = 256
+    ) -> AsyncIterator[Sample]:
+        """
+        readings of all the instruments, in the order they arrive
+        :param duration: stop issuing new reads after this many seconds
+        :param count: amount of readings per instrument
+        :param queue_size: readings that may wait for the consumer before the reads pause
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        stop = asyncio.Event()
+        producers = [
+            asyncio.create_task(session.stream(queue, count, stop)) for session in self.sessions
+        ]
+        if duration is not None:
+            asyncio.get_running_loop().call_later(duration, stop.set)
+        finished = asyncio.gather(*producers)
+        try:
+            while not (finished.done() and queue.empty()):
+                getter = asyncio.ensure_future(queue.get())
+                await asyncio.wait({getter, finished}, return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    yield getter.result()
+                else:
+                    getter.cancel()
+            # surface the errors of the producers, if there were any
+            await finished
+        finally:
+            stop.set()
+            for producer in producers:
+                producer.cancel()
+
+    async def collect(
+        self, duration: Optional[float] = None, count: Optional[int] = None
+    ) -> Dict[str, List[Sample]]:
+        """
+        gather all the readings of the stream, grouped by the instrument
+        """
+        samples: Dict[str, List[Sample]] = {session.name: [] for session in self.sessions}
+        async for sample in self.stream(duration, count):
+            samples[sample.instrument].append(sample)
+        return samples
+
+    def close(self):
+        for session in self.sessions:
+            session.close()
@@ -0,0 +1,114 @@
+import time
+from typing import Tuple
+
+import numpy as np
+
+# the meter keeps up to 1M readings (50k without the memory option) in its reading memory
+MAX_READINGS = 1000000
+# amount of readings taken out of the reading memory with a single DATA:REMove? query
+DEFAULT_CHUNK_SIZE = 50000
+# integration times the meter supports, in power line cycles; others are rounded up by it
+NPLC_VALUES = (0.006, 0.02, 0.06, 0.2, 1., 2., 10., 100.)
+
+
+class BurstAcquisition:
+    """
+    buffered acquisition with the Agilent 34410A
+
+    the meter is configured to take the whole series of readings on its own, paced by its
+    sample timer, and the readings are taken out of its reading memory in big binary
+    blocks (FORMat:DATA REAL,64) instead of one READ? query per reading. Timestamps come
+    from the sample timer as well, not from the clock of the host
+
+    resource is an opened pyvisa resource, or anything with 'write', 'query' and
+    'query_binary_values' methods, like the simulated meter from 'simulated_dmm'
+    """
+    def __init__(
+        self, resource, sample_count: int, sample_interval: float = 0.001, nplc: float = 0.02,
+        voltage_range: float = 10., line_frequency: float = 50.,
+        chunk_size: int = DEFAULT_CHUNK_SIZE, poll_interval: float = 0.05
+    ):
+        """
+        :param resource: connection to the meter
+        :param sample_count: amount of readings in the burst
+        :param sample_interval: time between the readings, in seconds
+        :param nplc: integration time, in power line cycles, one of NPLC_VALUES
+        :param voltage_range: DC voltage range, in volts
+        :param line_frequency: power line frequency, used to check the integration time
+        :param chunk_size: maximum amount of readings transferred at once
+        :param poll_interval: pause between the checks of the reading memory, in seconds
+        """
+        if not 0 < sample_count <= MAX_READINGS:
+            raise ValueError(f'sample count has to be between 1 and {MAX_READINGS}')
+        if nplc not in NPLC_VALUES:
+            raise ValueError(f'integration time has to be one of {NPLC_VALUES} PLC')
+        if sample_interval <= nplc / line_frequency:
+            raise ValueError(
+                f'sample interval of {sample_interval} s is shorter than the integration time '
+                f'of {nplc} PLC'
+            )
+        self.resource = resource
+        self.sample_count = sample_count
+        self.sample_interval = sample_interval
+        self.nplc = nplc
+        self.voltage_range = voltage_range
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+
+    def configure(self):
+        """
+        set up the measurement, triggering, sample timer and binary data format
+        """
+        for command in (
+            f'CONF:VOLT:DC {self.voltage_range}',
+            f'VOLT:DC:NPLC {self.nplc}',
+            'TRIG:SOUR IMM',
+            'TRIG:COUN 1',
+            f'SAMP:COUN {self.sample_count}',
+            'SAMP:SOUR TIM',
+            f'SAMP:TIM {self.sample_interval}',
+            'FORM:DATA REAL,64',
+            'FORM:BORD NORM',
+        ):
+            self.resource.write(command)
+
+    def arm(self):
+        """
+        start the burst, the meter begins to fill its reading memory
+        """
+        self.resource.write('INIT')
+
+    def fetch(self) -> np.ndarray:
+        """
+        take the readings out of the reading memory as they come, until the burst is complete
+        :return: array of all the readings of the burst
+        """
+        readings = np.empty(self.sample_count, dtype=np.float64)
+        received = 0
+        while received < self.sample_count:
+            available = int(float(self.resource.query('DATA:POIN?')))
+            if not available:
+                time.sleep(self.poll_interval)
+                continue
+            count = min(available, self.chunk_size, self.sample_count - received)
+            # REAL,64 block in normal (big-endian) byte order
+            block = self.resource.query_binary_values(
+                f'DATA:REM? {count}', datatype='d', is_big_endian=True, container=np.array)
+            readings[received:received + len(block)] = block
+            received += len(block)
+        return readings
+
+    def timestamps(self) -> np.ndarray:
+        """
+        time of each reading since the start of the burst, as paced by the sample timer
+        """
+        return np.arange(self.sample_count) * self.sample_interval
+
+    def acquire(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        configure the meter, take the whole burst and read it out
+        :return: timestamps and readings
+        """
+        self.configure()
+        self.arm()
+        return self.timestamps(), self.fetch()
@@ -0,0 +1,116 @@
+import time
+from typing import List, Optional
+
+import numpy as np
+
+from .burst_acquisition import NPLC_VALUES
+
+
+class SimulatedAgilent34410A:
+    """
+    local stand-in for the Agilent 34410A with the pyvisa resource interface
+    ('write', 'read', 'read_raw', 'query', 'query_binary_values', 'close')
+
+    readings are a slowly drifting DC level with some noise. After INIT the reading memory
+    fills up at the pace of the sample timer (measured with the host clock), so fetching
+    behaves like with the real meter; single READ? queries take one integration time,
+    rounded up to the nearest one the meter supports
+    """
+    IDENTITY = 'Agilent Technologies,34410A,MY00000000,2.35-2.35-0.09-46-09'
+
+    def __init__(self, level: float = 1.2345, noise: float = 0.0005, seed: int = 0,
+                 line_frequency: float = 50.):
+        self.level = level
+        self.noise = noise
+        self.line_frequency = line_frequency
+        self.rng = np.random.default_rng(seed)
+        self.nplc = 10.
+        self.sample_count = 1
+        self.sample_interval = 0.001
+        self.binary = False
+        self.big_endian = True
+        self.armed_at: Optional[float] = None
+        self.removed = 0
+        self._replies: List[bytes] = []
+
+    def _readings(self, first: int, count: int) -> np.ndarray:
+        t = (first + np.arange(count)) * self.sample_interval
+        return self.level + 0.01 * np.sin(2 * np.pi * 0.5 * t) \
+            + self.rng.normal(0, self.noise, count)
+
+    def _available(self) -> int:
+        if self.armed_at is None:
+            return 0
+        taken = int((time.monotonic() - self.armed_at) / self.sample_interval) + 1
+        return min(taken, self.sample_count) - self.removed
+
+    def _block(self, readings: np.ndarray) -> bytes:
+        payload = readings.astype('>f8' if self.big_endian else '<f8').tobytes()
+        length = str(len(payload)).encode('ASCII')
+        return b'#' + str(len(length)).encode('ASCII') + length + payload + b'\n'
+
+    def write(self, message: str):
+        for command in message.strip().split(';'):
+            header, _, argument = command.strip().partition(' ')
+            header = header.upper()
+            if header == 'VOLT:DC:NPLC':
+                self.nplc = min(value for value in NPLC_VALUES if value >= float(argument))
+            elif header == 'SAMP:COUN':
+                self.sample_count = int(argument)
+            elif header == 'SAMP:TIM':
+                self.sample_interval = float(argument)
+            elif header == 'FORM:DATA':
+                self.binary = argument.upper().startswith('REAL')
+            elif header == 'FORM:BORD':
+                self.big_endian = argument.upper().startswith('NORM')
+            elif header == 'INIT':
+                self.armed_at = time.monotonic()
+                self.removed = 0
+            elif header == '*IDN?':
+                self._replies.append(self.IDENTITY.encode('ASCII') + b'\n')
+            elif header == 'DATA:POIN?':
+                self._replies.append(f'{self._available()}\n'.encode('ASCII'))
+            elif header == 'DATA:REM?':
+                count = int(argument)
+                # the real meter waits for the readings to be taken
+                while self._available() < count:
+                    time.sleep(self.sample_interval)
+                readings = self._readings(self.removed, count)
+                self.removed += count
+                self._replies.append(
+                    self._block(readings) if self.binary
+                    else (','.join(f'{value:+.9E}' for value in readings) + '\n').encode('ASCII')
+                )
+            elif header == 'READ?':
+                time.sleep(self.nplc / self.line_frequency)
+                self._replies.append(f'{self._readings(0, 1)[0]:+.9E}\n'.encode('ASCII'))
+
+    def read_raw(self) -> bytes:
+        if not self._replies:
+            raise TimeoutError('no reply waiting')
+        return self._replies.pop(0)
+
+    def read(self) -> str:
+        return self.read_raw().decode('ASCII').rstrip('\n')
+
+    def query(self, message: str) -> str:
+        self.write(message)
+        return self.read()
+
+    def query_binary_values(
+        self, message: str, datatype: str = 'f', is_big_endian: bool = False, container=list
+    ):
+        """
+        the definite-length block answering the query, as pyvisa decodes it
+        """
+        self.write(message)
+        reply = self.read_raw()
+        start = reply.index(b'#')
+        length_digits = int(reply[start + 1:start + 2])
+        length = int(reply[start + 2:start + 2 + length_digits])
+        payload = reply[start + 2 + length_digits:start + 2 + length_digits + length]
+        values = np.frombuffer(payload, dtype=('>' if is_big_endian else '<') + datatype)
+        return container(values)
+
+    def close(self):
+        self.armed_at = None
@@ -3,12 +3,14 @@ from typing import List, Optional
 import numpy
 from matplotlib import pyplot as plt
 from matplotlib import animation
-from matplotlib.animation import FuncAnimation, PillowWriter    # noqa
+from matplotlib.animation import FuncAnimation    # noqa
 from matplotlib.axes import Axes
 from matplotlib.artist import Artist
 from matplotlib.figure import Figure
 from matplotlib.lines import Line2D
 
+from hp_oscilloscope.animated_image import AnimatedImageWriter
+
 
 def rgb_to_matlab(r, g, b):
     return r/255., g/255., b/255.
@@ -139,7 +141,7 @@ class SimpleAnimation2:
             init_func=self.init_moving_dots,
             interval=self.interval, repeat_delay=1000
         )
-        movie_writer = PillowWriter(fps=self.fps)
+        movie_writer = AnimatedImageWriter(fps=self.fps)
         simple_anim2.anim.save('my_movie2.gif', dpi=125, writer=movie_writer)  # noqa
 
 
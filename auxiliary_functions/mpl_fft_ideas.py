@@ -1,16 +1,19 @@
-from typing import List
-from math import sqrt, pow, log
+from typing import List, NamedTuple, TYPE_CHECKING
+from math import sqrt, pow
 from copy import deepcopy
+from functools import lru_cache
 
 import numpy
-from matplotlib import pyplot as plt
-from matplotlib import animation
-from matplotlib.animation import FuncAnimation, PillowWriter    # noqa
-from matplotlib.axes import Axes
-from matplotlib.figure import Figure, SubFigure
 
+from hp_oscilloscope.lazy_pyplot import pyplot
+from hp_oscilloscope.oscilloscope_auxiliary import parse_block
+from hp_oscilloscope.spectral_band import SpectralBand, band_spectrum
+from hp_oscilloscope.spectral_engine import power_db
 
-from .bin_data_file_1 import bin_data
+if TYPE_CHECKING:
+    from matplotlib.animation import Animation, FuncAnimation, PillowWriter    # noqa
+    from matplotlib.axes import Axes
+    from matplotlib.figure import Figure, SubFigure
 
 
 def norm(z: complex):
@@ -21,76 +24,110 @@ def norm(z: complex):
 arr = numpy.array([[1, 2, 3], [4, 5, 6]])
 arr2 = numpy.ndarray([15, 15], numpy.float64)
 arr2[::2, ::2] = 0
+anim: 'Animation'
 
-pseudo_pointlist: bytearray = bytearray([int(b) for b in bin_data])
-pseudo_pointlist = pseudo_pointlist[10:-1]
-
-waveform = numpy.array([float(b) for b in pseudo_pointlist])
-x = numpy.array(list([float(i) for i in range(len(pseudo_pointlist))]))
-pruned = deepcopy(waveform)
-pruned[:850] = 120.
-# waveform.dtype = numpy.int
-print(waveform.shape, waveform.dtype, waveform.base)
-print(x.shape, x.dtype, x.base)
-print(waveform)
-
-num_samples = 4000
-total_recorded_timewindow = 0.0005  # in seconds
-timebase_divisor = total_recorded_timewindow/num_samples
-
-waveform[:] -= 120
-pruned[:] -= 120
-waveform[:] /= 120
-pruned[:] /= 120
-# x[:] /= timebase_divisor  # div by 1 milion = miliseconds (from 'range' perspective)
-x[:] *= timebase_divisor  # "div" by 1 milion = miliseconds (from 'range' perspective)
-
-f = numpy.fft.rfft(waveform, len(waveform))
-normalized_fft = [log(norm(z), 10)*10 for z in f]
-pruned_f = numpy.fft.rfft(pruned, len(pruned))
-normalized_pruned_fft = [log(norm(z), 10)*10 for z in pruned_f]
-
-fft_diff = [(a - b) for a, b in zip(normalized_fft, normalized_pruned_fft)]
-# freq_content = numpy.fft.fftfreq(len(x), d=1/timebase_divisor)
-freq_content = numpy.fft.fftfreq(len(x), d=timebase_divisor)
-X = [z.real for z in f]
-Y = [z.imag for z in f]
-print(waveform)
-
-figure, axes = plt.subplots(3, 2)
-axes: List[List[Axes]]
-axes2: Axes
-figure: Figure
-anim: animation.Animation
-
-# axes[1].plot(freq_content[:int(len(freq_content)/16)], normalized_fft[:int(len(freq_content)/16)])
-# axes[1].set_xlabel('frequency')
-axes[0][0].plot(x, waveform)
-axes[1][0].plot(x, pruned)
-axes[0][1].plot(
-    freq_content[:int(len(freq_content)/4)], normalized_fft[:int(len(freq_content)/4)])
-axes[1][1].plot(
-    freq_content[:int(len(freq_content)/4)], normalized_pruned_fft[:int(len(freq_content)/4)])
-axes[0][1].set_xlabel('frequency')
-axes[1][1].set_xlabel('frequency')
-axes[0][1].grid(True, linestyle='-.')
-axes[1][1].grid(True, linestyle='-.')
-axes[0][1].tick_params(labelcolor='b', labelsize='medium', width=3)
-axes[1][1].tick_params(labelcolor='b', labelsize='medium', width=3)
-axes[2][0].plot(freq_content[:int(len(freq_content)/4)], fft_diff[:int(len(freq_content)/4)])
-plt.show()
-
-figure2, axes2 = plt.subplots()
-figure2: Figure
-axes2: Axes
-figure2.set(constrained_layout=True)
-figure2.set_figwidth(8)
-figure2.set_figheight(6)
-axes2.scatter(X, Y)
-axes2.set_xlabel('Re')
-axes2.set_ylabel('Im')
-plt.show()
 
+class SampleSpectra(NamedTuple):
+    """
+    the sample waveform, its copy with the beginning cut off, and spectra of both
+    """
+    x: numpy.ndarray
+    waveform: numpy.ndarray
+    pruned: numpy.ndarray
+    timebase_divisor: float
+    f: numpy.ndarray
+    freq_content: numpy.ndarray
+    normalized_fft: numpy.ndarray
+    normalized_pruned_fft: numpy.ndarray
+    fft_diff: list
+
+
+@lru_cache(maxsize=None)
+def sample_spectra() -> SampleSpectra:
+    """
+    analysis of the sample capture, done on the first call only - the sample data is
+    big, so it is not even imported before it is needed
+    """
+    from .bin_data_file_1 import bin_data
+    samples = parse_block(bin_data)
+
+    waveform = samples.astype(numpy.float64)
+    x = numpy.arange(len(samples), dtype=numpy.float64)
+    pruned = deepcopy(waveform)
+    pruned[:850] = 120.
+    # waveform.dtype = numpy.int
+
+    num_samples = 4000
+    total_recorded_timewindow = 0.0005  # in seconds
+    timebase_divisor = total_recorded_timewindow/num_samples
+
+    waveform[:] -= 120
+    pruned[:] -= 120
+    waveform[:] /= 120
+    pruned[:] /= 120
+    # x[:] /= timebase_divisor  # div by 1 milion = miliseconds (from 'range' perspective)
+    x[:] *= timebase_divisor  # "div" by 1 milion = miliseconds (from 'range' perspective)
+
+    f = numpy.fft.rfft(waveform, len(waveform))
+    # only the lowest quarter of the spectrum is plotted, so power is computed only for that band
+    displayed_band = SpectralBand.displayed(len(waveform), timebase_divisor)
+    normalized_fft = power_db(displayed_band.transform(waveform[numpy.newaxis])[0])
+    normalized_pruned_fft = power_db(displayed_band.transform(pruned[numpy.newaxis])[0])
+
+    fft_diff = [(a - b) for a, b in zip(normalized_fft, normalized_pruned_fft)]
+    # freq_content = numpy.fft.fftfreq(len(x), d=1/timebase_divisor)
+    freq_content = numpy.fft.fftfreq(len(x), d=timebase_divisor)
+    return SampleSpectra(
+        x, waveform, pruned, timebase_divisor, f, freq_content,
+        normalized_fft, normalized_pruned_fft, fft_diff,
+    )
+
+
+def spectra_overview():
+    """
+    signals, their spectra and the difference between the spectra, then the raw FFT
+    on the complex plane
+    """
+    sample = sample_spectra()
+    x, waveform, pruned = sample.x, sample.waveform, sample.pruned
+    freq_content, fft_diff = sample.freq_content, sample.fft_diff
+    normalized_fft, normalized_pruned_fft = sample.normalized_fft, sample.normalized_pruned_fft
+    X = [z.real for z in sample.f]
+    Y = [z.imag for z in sample.f]
+
+    plt = pyplot()
+    figure, axes = plt.subplots(3, 2)
+    axes: List[List[Axes]]
+    figure: Figure
+
+    # axes[1].plot(
+    #     freq_content[:int(len(freq_content)/16)], normalized_fft[:int(len(freq_content)/16)])
+    # axes[1].set_xlabel('frequency')
+    axes[0][0].plot(x, waveform)
+    axes[1][0].plot(x, pruned)
+    axes[0][1].plot(
+        freq_content[:int(len(freq_content)/4)], normalized_fft[:int(len(freq_content)/4)])
+    axes[1][1].plot(
+        freq_content[:int(len(freq_content)/4)], normalized_pruned_fft[:int(len(freq_content)/4)])
+    axes[0][1].set_xlabel('frequency')
+    axes[1][1].set_xlabel('frequency')
+    axes[0][1].grid(True, linestyle='-.')
+    axes[1][1].grid(True, linestyle='-.')
+    axes[0][1].tick_params(labelcolor='b', labelsize='medium', width=3)
+    axes[1][1].tick_params(labelcolor='b', labelsize='medium', width=3)
+    axes[2][0].plot(freq_content[:int(len(freq_content)/4)], fft_diff[:int(len(freq_content)/4)])
+    plt.show()
+
+    figure2, axes2 = plt.subplots()
+    figure2: Figure
+    axes2: Axes
+    figure2.set(constrained_layout=True)
+    figure2.set_figwidth(8)
+    figure2.set_figheight(6)
+    axes2.scatter(X, Y)
+    axes2.set_xlabel('Re')
+    axes2.set_ylabel('Im')
+    plt.show()
 
 
 def subfigure_split():
@@ -99,6 +136,11 @@ def subfigure_split():
     figure into Subfigure instances
     """
     # split figure into subfigures
+    sample = sample_spectra()
+    x, waveform, pruned = sample.x, sample.waveform, sample.pruned
+    freq_content, fft_diff = sample.freq_content, sample.fft_diff
+    normalized_fft, normalized_pruned_fft = sample.normalized_fft, sample.normalized_pruned_fft
+    plt = pyplot()
     figure3: Figure = plt.figure(constrained_layout=True, figsize=(12., 9.))
     subfigures: List[SubFigure] = figure3.subfigures(
         nrows=2, ncols=1, hspace=0.05, height_ratios=[2./3., 1./3.])
@@ -147,3 +189,35 @@ def subfigure_split():
     plt.show()
 
 
+def zoomed_difference(zoom: int = 8):
+    """
+    difference between FFT's in the lowest 1/16 of the spectrum, sampled zoom times more
+    densely than the FFT bins (chirp-z transform of the band only)
+    """
+    sample = sample_spectra()
+    freq_content, fft_diff = sample.freq_content, sample.fft_diff
+    freq_range = (0., freq_content[int(len(freq_content)/16)])
+    band_freqs, zoomed_fft = band_spectrum(
+        sample.waveform, sample.timebase_divisor, freq_range, zoom)
+    _, zoomed_pruned_fft = band_spectrum(
+        sample.pruned, sample.timebase_divisor, freq_range, zoom)
+
+    plt = pyplot()
+    figure4, axes4 = plt.subplots()
+    figure4: Figure
+    axes4: Axes
+    axes4.plot(band_freqs, power_db(zoomed_fft) - power_db(zoomed_pruned_fft))
+    axes4.plot(
+        freq_content[:int(len(freq_content)/16)], fft_diff[:int(len(freq_content)/16)],
+        linestyle='', marker='o', markersize=3)
+    axes4.set_xlabel('frequency')
+    axes4.grid(True, linestyle='-.')
+    plt.show()
+
+
+def main():
+    spectra_overview()
+
+
+if __name__ == '__main__':
+    main()
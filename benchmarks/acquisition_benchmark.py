@@ -0,0 +1,145 @@
+# throughput and latency of the acquisition code, measured against the simulated instruments
+# (or the real ones, when the port / VISA resource is given), e.g.:
+#   python -m benchmarks.acquisition_benchmark --backend pty --baudrate 19200 --output results.json
+import argparse
+import json
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from agilent_dmm.burst_acquisition import NPLC_VALUES, BurstAcquisition
+from agilent_dmm.simulated_dmm import SimulatedAgilent34410A
+from hp_oscilloscope.oscilloscope_auxiliary import BAUDRATE_FAST
+from hp_oscilloscope.serial_transport import SerialTransport
+from hp_oscilloscope.simulated_instrument import (
+    LoopbackSerial, PtyHP54645D, SimulatedHP54645D
+)
+
+# queries answered with short text replies, taken from 'connection_test.commands'
+TEXT_QUERIES = [b'*IDN?', b':ANAL1:RANG?', b':WAVEFORM:PREAMBLE?']
+
+
+def latency_statistics(latencies: List[float]) -> Dict[str, float]:
+    latencies = np.array(latencies)
+    return {
+        'count': len(latencies),
+        'mean_s': float(np.mean(latencies)),
+        'p50_s': float(np.percentile(latencies, 50)),
+        'p95_s': float(np.percentile(latencies, 95)),
+        'max_s': float(np.max(latencies)),
+    }
+
+
+def time_calls(call: Callable[[], object], repeats: int) -> List[float]:
+    latencies = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def benchmark_scope(transport: SerialTransport, repeats: int, block_repeats: int) -> dict:
+    """
+    command round trips and waveform block transfers of the oscilloscope
+    """
+    text_latencies = []
+    for query in TEXT_QUERIES:
+        text_latencies += time_calls(lambda: transport.query(query), repeats)
+    transport.write(b':DIGITIZE')
+    block_size = len(transport.query_block(b':WAVEFORM:DATA?'))
+    block_latencies = time_calls(
+        lambda: transport.query_block(b':WAVEFORM:DATA?'), block_repeats)
+    return {
+        'commands_per_s': len(text_latencies) / sum(text_latencies),
+        'command_latency': latency_statistics(text_latencies),
+        'block_points': block_size,
+        'block_bytes_per_s': block_size * block_repeats / sum(block_latencies),
+        'block_latency': latency_statistics(block_latencies),
+    }
+
+
+def benchmark_dmm(resource, readings: int, sample_interval: float, nplc: float) -> dict:
+    """
+    buffered burst against single READ? queries of the multimeter
+    """
+    burst = BurstAcquisition(resource, readings, sample_interval=sample_interval, nplc=nplc)
+    started = time.perf_counter()
+    burst.acquire()
+    burst_time = time.perf_counter() - started
+    polling_latencies = time_calls(lambda: float(resource.query('READ?')), min(readings, 50))
+    return {
+        'burst_readings': readings,
+        'burst_readings_per_s': readings / burst_time,
+        'polling_readings_per_s': len(polling_latencies) / sum(polling_latencies),
+        'polling_latency': latency_statistics(polling_latencies),
+    }
+
+
+def run(arguments: argparse.Namespace) -> dict:
+    results = {'backend': arguments.backend, 'baudrate': arguments.baudrate}
+    simulator: Optional[PtyHP54645D] = None
+    if arguments.port:
+        transport = SerialTransport.open(port=arguments.port, baudrate=arguments.baudrate)
+    elif arguments.backend == 'pty':
+        simulator = PtyHP54645D(
+            SimulatedHP54645D(points=arguments.points), baudrate=arguments.baudrate).start()
+        transport = SerialTransport.open(port=simulator.port, baudrate=arguments.baudrate)
+    else:
+        transport = SerialTransport(LoopbackSerial(
+            SimulatedHP54645D(points=arguments.points), baudrate=arguments.baudrate))
+    try:
+        results['scope'] = benchmark_scope(transport, arguments.repeats, arguments.block_repeats)
+    finally:
+        transport.close()
+        if simulator is not None:
+            simulator.stop()
+
+    if arguments.visa_resource:
+        import pyvisa
+        resource = pyvisa.ResourceManager().open_resource(arguments.visa_resource)
+    else:
+        resource = SimulatedAgilent34410A()
+    try:
+        results['dmm'] = benchmark_dmm(
+            resource, arguments.readings, arguments.sample_interval, arguments.nplc)
+    finally:
+        resource.close()
+    return results
+
+
+def parse_arguments(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='acquisition throughput benchmark')
+    parser.add_argument(
+        '--backend', choices=['loopback', 'pty'], default='pty',
+        help='simulated oscilloscope connection: in-process loopback or pseudo-terminal')
+    parser.add_argument('--port', help='serial port of a real HP54645D, instead of the simulator')
+    parser.add_argument('--visa-resource', help='VISA resource of a real 34410A')
+    parser.add_argument('--baudrate', type=int, default=BAUDRATE_FAST)
+    parser.add_argument('--points', type=int, default=4000, help='simulated record length')
+    parser.add_argument('--repeats', type=int, default=20, help='round trips per text query')
+    parser.add_argument('--block-repeats', type=int, default=3, help='waveform transfers')
+    parser.add_argument('--readings', type=int, default=10000, help='DMM burst length')
+    parser.add_argument('--sample-interval', type=float, default=0.0002)
+    parser.add_argument(
+        '--nplc', type=float, default=0.006, choices=NPLC_VALUES,
+        help='integration time, in power line cycles')
+    parser.add_argument('--output', help='JSON file for the results, printed if omitted')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    arguments = parse_arguments(argv)
+    results = run(arguments)
+    if arguments.output:
+        with open(arguments.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+# stage timings and peak memory of the FFTAnimation pipeline over synthetic captures of
+# different lengths, e.g.:
+#   python -m benchmarks.fft_animation_benchmark --output baseline.json
+#   python -m benchmarks.fft_animation_benchmark --baseline baseline.json --threshold 0.15
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np  # noqa: E402
+from matplotlib import pyplot as plt  # noqa: E402
+
+from hp_oscilloscope.capture_file import open_capture, write_capture  # noqa: E402
+from hp_oscilloscope.oscilloscope_fft_processing import FFTAnimation  # noqa: E402
+from hp_oscilloscope.simulated_instrument import synthetic_record  # noqa: E402
+
+DEFAULT_SIZES = [4000, 65536, 1048576]
+# fps:total_time:split_factor
+DEFAULT_SETTINGS = ['30:2:2', '60:4:8']
+# relative slowdown (or memory growth) over the baseline reported as a regression
+DEFAULT_THRESHOLD = 0.2
+# metrics compared against the baseline, all of them "lower is better"
+COMPARED_METRICS = [
+    'pre_calculate_frames_s', 'prepare_charts_s', 'start_rendering_s',
+    'render_frame_s', 'file_output_s', 'peak_memory_bytes',
+]
+
+
+def parse_setting(setting: str) -> Tuple[int, int, int]:
+    fps, total_time, split_factor = (int(value) for value in setting.split(':'))
+    return fps, total_time, split_factor
+
+
+def case_name(points: int, fps: int, total_time: int, split_factor: int) -> str:
+    return f'{points}pts_{fps}fps_{total_time}s_split{split_factor}'
+
+
+def peak_rss() -> Optional[int]:
+    """
+    peak resident memory of the process in bytes, 'None' where 'resource' is not available
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class StageTimer:
+    """
+    wall time of consecutive stages of a single case, and their traced peak memory
+    when tracemalloc is running
+    """
+    def __init__(self):
+        self.results: Dict[str, float] = {}
+        self.peak_memory = 0
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+        started = time.perf_counter()
+        yield
+        self.results[f'{name}_s'] = time.perf_counter() - started
+        if tracing:
+            peak = tracemalloc.get_traced_memory()[1]
+            self.results[f'{name}_peak_bytes'] = peak
+            self.peak_memory = max(self.peak_memory, peak)
+
+
+def sampled_frames(frame_info: List[List[int]], count: int) -> List[List[int]]:
+    """
+    frames spread evenly over the whole animation
+    """
+    count = min(count, len(frame_info))
+    indices = np.unique(np.linspace(0, len(frame_info) - 1, count).astype(int))
+    return [frame_info[i] for i in indices]
+
+
+def benchmark_case(
+    capture_path: str, fps: int, total_time: int, split_factor: int, dpi: int,
+    render_frames: int, output_dir: str, memory: str = 'rss', spectrum_method: str = 'auto',
+    freq_range: Optional[str] = None
+) -> Dict[str, float]:
+    """
+    run the pipeline once over the capture, timing each stage on its own; meant to be run
+    in a fresh process, so peak memory of one case does not hide the one of the next
+    :param memory: 'rss' for growth of the peak resident memory, 'tracemalloc' for traced
+        peaks of every stage (much slower, timings are not comparable), 'none' to skip
+    """
+    timer = StageTimer()
+    rss_before = peak_rss() if memory == 'rss' else None
+    if memory == 'tracemalloc':
+        tracemalloc.start()
+    try:
+        animation = FFTAnimation.from_capture(
+            open_capture(capture_path), fps=fps, total_time=total_time, split_factor=split_factor,
+            spectrum_method=spectrum_method, freq_range=freq_range)
+        with timer.stage('pre_calculate_frames'):
+            animation.pre_calculate_frames()
+        with timer.stage('prepare_charts'):
+            animation.prepare_charts()
+        with timer.stage('start_rendering'):
+            animation.start_rendering(dpi)
+
+        render_times = []
+        output_times = []
+        for frame_data in sampled_frames(animation.frame_info, render_frames):
+            started = time.perf_counter()
+            rgba = animation.render_frame(frame_data)
+            rendered = time.perf_counter()
+            animation.write_frame_image(rgba, frame_data[0], output_dir)
+            render_times.append(rendered - started)
+            output_times.append(time.perf_counter() - rendered)
+    finally:
+        if memory == 'tracemalloc':
+            tracemalloc.stop()
+    plt.close(animation.animation_figure)
+
+    results = dict(timer.results)
+    results.update({
+        'frames': len(animation.frame_info),
+        'window_span': animation.time_window_span,
+        'spectra_bytes': animation.spectra.nbytes,
+        'rendered_frames': len(render_times),
+        'render_frame_s': float(np.median(render_times)),
+        'file_output_s': float(np.median(output_times)),
+    })
+    if memory == 'tracemalloc':
+        results['peak_memory_bytes'] = timer.peak_memory
+    elif rss_before is not None:
+        results['peak_memory_bytes'] = peak_rss() - rss_before
+    # time of rendering and saving every frame of the animation, estimated from the sample
+    results['estimated_total_s'] = \
+        results['pre_calculate_frames_s'] + results['prepare_charts_s'] \
+        + results['start_rendering_s'] \
+        + results['frames'] * (results['render_frame_s'] + results['file_output_s'])
+    return results
+
+
+def run(arguments: argparse.Namespace) -> dict:
+    results = {
+        'environment': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'matplotlib': matplotlib.__version__,
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+        },
+        'dpi': arguments.dpi,
+        'memory': arguments.memory,
+        'spectrum_method': arguments.spectrum_method,
+        'freq_range': arguments.freq_range,
+        'cases': {},
+    }
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory(prefix='fft_benchmark_') as directory:
+        for points in arguments.sizes:
+            capture_path = os.path.join(directory, f'synthetic_{points}.hpcap')
+            write_capture(capture_path, synthetic_record(points, seed=points))
+            for setting in arguments.settings:
+                fps, total_time, split_factor = parse_setting(setting)
+                name = case_name(points, fps, total_time, split_factor)
+                print(f'running {name}', file=sys.stderr)
+                # every case in its own interpreter, like a real rendering job
+                with context.Pool(1) as pool:
+                    results['cases'][name] = pool.apply(benchmark_case, (
+                        capture_path, fps, total_time, split_factor, arguments.dpi,
+                        arguments.render_frames, directory, arguments.memory,
+                        arguments.spectrum_method, arguments.freq_range
+                    ))
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> List[str]:
+    """
+    find the metrics that got worse than the baseline by more than the threshold
+    :return: human-readable descriptions of the regressions
+    """
+    regressions = []
+    for name, case in results['cases'].items():
+        reference = baseline['cases'].get(name)
+        if reference is None:
+            continue
+        for metric in COMPARED_METRICS:
+            if metric not in case or not reference.get(metric):
+                continue
+            change = case[metric] / reference[metric] - 1.
+            if change > threshold:
+                regressions.append(
+                    f'{name} {metric}: {reference[metric]:.4g} -> {case[metric]:.4g} '
+                    f'(+{100 * change:.1f}%)'
+                )
+    return regressions
+
+
+def parse_arguments(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='FFTAnimation pipeline benchmark')
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='capture lengths in samples')
+    parser.add_argument(
+        '--settings', nargs='+', default=DEFAULT_SETTINGS,
+        help='animation settings as fps:total_time:split_factor')
+    parser.add_argument('--dpi', type=int, default=100)
+    parser.add_argument(
+        '--render-frames', type=int, default=10,
+        help='frames rendered and saved per case, spread over the whole animation')
+    parser.add_argument(
+        '--memory', choices=['rss', 'tracemalloc', 'none'], default='rss',
+        help="peak memory measurement, 'tracemalloc' gives per-stage peaks but slows "
+             "the stages down a lot")
+    parser.add_argument(
+        '--spectrum-method', choices=['fft', 'sliding', 'auto'], default='auto',
+        help='how FFTAnimation computes the spectra of consecutive frames')
+    parser.add_argument(
+        '--freq-range', choices=['displayed'],
+        help="compute and store only the displayed band of the spectra, whole half-spectrum "
+             "if omitted")
+    parser.add_argument('--output', help='JSON file for the results, printed if omitted')
+    parser.add_argument(
+        '--results', help='compare previously saved results instead of running the benchmark')
+    parser.add_argument('--baseline', help='JSON results to compare against')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    arguments = parse_arguments(argv)
+    if arguments.results:
+        with open(arguments.results, 'r') as results_file:
+            results = json.load(results_file)
+    else:
+        results = run(arguments)
+        if arguments.output:
+            with open(arguments.output, 'w') as output_file:
+                json.dump(results, output_file, indent=2)
+        else:
+            json.dump(results, sys.stdout, indent=2)
+            print()
+
+    if arguments.baseline:
+        with open(arguments.baseline, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(results, baseline, arguments.threshold)
+        for regression in regressions:
+            print('REGRESSION', regression, file=sys.stderr)
+        if regressions:
+            return 1
+        print('no regressions above', f'{100 * arguments.threshold:.0f}%', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,122 @@
+# import time of the modules of the package, each one in a fresh interpreter, checked against
+# the budgets below; exits with 1 when a module is over its budget or loads matplotlib, e.g.:
+#   python -m benchmarks.import_time_benchmark
+#   python -m benchmarks.import_time_benchmark --budget-scale 2 --output imports.json
+import argparse
+import json
+import subprocess
+import sys
+from typing import Dict, List, Optional, Tuple
+
+# numpy is imported first and timed separately, budgets cover only what the module adds on
+# top of it, in milliseconds (best of the repeats)
+CORE_BUDGET = 20.
+IMPORT_BUDGETS: Dict[str, float] = {
+    'hp_oscilloscope.oscilloscope_auxiliary': CORE_BUDGET,
+    'hp_oscilloscope.spectral_engine': CORE_BUDGET,
+    'hp_oscilloscope.spectral_store': CORE_BUDGET,
+    'hp_oscilloscope.spectral_band': CORE_BUDGET,
+    'hp_oscilloscope.spectral_cache': CORE_BUDGET,
+    'hp_oscilloscope.capture_file': CORE_BUDGET,
+    'hp_oscilloscope.capture_archive': CORE_BUDGET,
+    'hp_oscilloscope.decimation': CORE_BUDGET,
+    'hp_oscilloscope.frame_pipeline': CORE_BUDGET,
+    # modules that draw, but only once an animation is created
+    'hp_oscilloscope.oscilloscope_fft_processing': 60.,
+    'hp_oscilloscope.parallel_render': 60.,
+    'hp_oscilloscope.batch_render': 60.,
+    # pyserial on top
+    'hp_oscilloscope.live_view': 100.,
+    # plotting sketches, they load the sample data and pyplot when called
+    'auxiliary_functions.mpl_fft_ideas': CORE_BUDGET,
+}
+# none of the modules above may load these on import
+FORBIDDEN_MODULES = ['matplotlib', 'PIL']
+DEFAULT_REPEATS = 5
+
+_MEASURE = '''
+import json, sys, time
+started = time.perf_counter()
+import numpy
+numpy_imported = time.perf_counter()
+import {module}
+finished = time.perf_counter()
+print(json.dumps({{
+    'numpy_ms': 1000. * (numpy_imported - started),
+    'module_ms': 1000. * (finished - numpy_imported),
+    'loaded': [name for name in {forbidden!r} if name in sys.modules],
+}}))
+'''
+
+
+def measure_import(module: str) -> dict:
+    """
+    import time of the module in a new interpreter, along with the forbidden modules it loaded
+    """
+    completed = subprocess.run(
+        [sys.executable, '-c', _MEASURE.format(module=module, forbidden=FORBIDDEN_MODULES)],
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(completed.stdout)
+
+
+def run(repeats: int, budget_scale: float) -> Tuple[dict, List[str]]:
+    """
+    :return: results for every module and the list of the broken budgets
+    """
+    results = {}
+    failures = []
+    for module, budget in IMPORT_BUDGETS.items():
+        measurements = [measure_import(module) for _ in range(repeats)]
+        best = min(measurement['module_ms'] for measurement in measurements)
+        loaded = sorted({name for measurement in measurements for name in measurement['loaded']})
+        results[module] = {
+            'module_ms': best,
+            'numpy_ms': min(measurement['numpy_ms'] for measurement in measurements),
+            'budget_ms': budget * budget_scale,
+            'loaded': loaded,
+        }
+        if best > results[module]['budget_ms']:
+            failures.append(
+                f'{module}: {best:.1f} ms over the budget of {results[module]["budget_ms"]:.1f} ms')
+        if loaded:
+            failures.append(f'{module}: loads {", ".join(loaded)} on import')
+    return results, failures
+
+
+def print_results(results: dict):
+    for module, result in results.items():
+        status = 'ok' if result['module_ms'] <= result['budget_ms'] and not result['loaded'] \
+            else 'OVER'
+        print(
+            f'{module:45s} {result["module_ms"]:7.1f} ms '
+            f'(budget {result["budget_ms"]:6.1f} ms, numpy {result["numpy_ms"]:6.1f} ms) {status}'
+        )
+
+
+def parse_arguments(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='import time budgets of the package')
+    parser.add_argument(
+        '--repeats', type=int, default=DEFAULT_REPEATS,
+        help='fresh interpreters per module, the best time is compared')
+    parser.add_argument(
+        '--budget-scale', type=float, default=1.,
+        help='multiplier of all the budgets, for slower machines')
+    parser.add_argument('--output', help='JSON file for the results')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    arguments = parse_arguments(argv)
+    results, failures = run(arguments.repeats, arguments.budget_scale)
+    print_results(results)
+    if arguments.output:
+        with open(arguments.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+    for failure in failures:
+        print(failure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
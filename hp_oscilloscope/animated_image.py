@@ -0,0 +1,276 @@
+import io
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Deque, List, Optional, Tuple
+
+import numpy as np
+from matplotlib.animation import AbstractMovieWriter
+from PIL import Image
+
+IMAGE_FORMATS = ('gif', 'apng')
+# frames sampled for the palette before anything is encoded
+DEFAULT_PALETTE_FRAMES = 4
+# frames drawn ahead of the ones already written to the file
+DEFAULT_QUEUE_SIZE = 16
+# browsers slow down GIF delays below 2/100 s to 1/10 s, so faster animations are capped
+GIF_MIN_DELAY = 2
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# (top, bottom, left, right) of the changed part of the frame, bottom and right excluded
+Box = Tuple[int, int, int, int]
+
+
+def changed_box(previous: Optional[np.ndarray], current: np.ndarray) -> Box:
+    """
+    smallest rectangle holding every pixel that differs between the indexed frames, a single
+    pixel when nothing changed (formats need at least one pixel per frame)
+    """
+    if previous is None:
+        return 0, current.shape[0], 0, current.shape[1]
+    changed = previous != current
+    rows = np.flatnonzero(changed.any(axis=1))
+    if not len(rows):
+        return 0, 1, 0, 1
+    columns = np.flatnonzero(changed[rows[0]:rows[-1] + 1].any(axis=0))
+    return int(rows[0]), int(rows[-1]) + 1, int(columns[0]), int(columns[-1]) + 1
+
+
+def _gif_image_data(encoded: bytes) -> bytes:
+    """
+    LZW-compressed pixels (minimal code size and the data sub-blocks) of the single-image GIF
+    """
+    position = 13
+    if encoded[10] & 0x80:
+        position += 3 << ((encoded[10] & 0x07) + 1)
+    while encoded[position] == 0x21:
+        # extension blocks: introducer, label, then sub-blocks up to an empty one
+        position += 2
+        while encoded[position]:
+            position += encoded[position] + 1
+        position += 1
+    # neither a local colour table nor interlacing, the frame header is written anew
+    if encoded[position] != 0x2C or encoded[position + 9] & 0xC0:
+        raise ValueError('unexpected layout of the encoded GIF image')
+    start = position = position + 10
+    position += 1
+    while encoded[position]:
+        position += encoded[position] + 1
+    return encoded[start:position + 1]
+
+
+def _png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return struct.pack('>I', len(data)) + chunk_type + data + \
+        struct.pack('>I', zlib.crc32(chunk_type + data))
+
+
+def _png_image_data(encoded: bytes) -> bytes:
+    """
+    zlib stream of the pixels (all IDAT chunks joined) of the single-image PNG
+    """
+    data = []
+    position = len(PNG_SIGNATURE)
+    while position < len(encoded):
+        length, chunk_type = struct.unpack('>I4s', encoded[position:position + 8])
+        if chunk_type == b'IDAT':
+            data.append(encoded[position + 8:position + 8 + length])
+        position += length + 12
+    return b''.join(data)
+
+
+class AnimatedImageWriter(AbstractMovieWriter):
+    """
+    animated GIF / APNG writer for 'Animation.save', a faster replacement of PillowWriter
+
+    one palette of 256 colours is found once, from the first few frames, and every frame is
+    only mapped onto it, instead of being quantized from scratch. Each frame stores just the
+    rectangle that changed since the previous one, and mapping and compression of the frames
+    run in a pool of threads while the next frames are drawn. Frames are written to the file
+    as they are done, nothing but the frames in flight is kept in memory
+    """
+    def __init__(
+        self, fps: int = 5, image_format: Optional[str] = None,
+        palette_frames: int = DEFAULT_PALETTE_FRAMES, workers: Optional[int] = None,
+        queue_size: int = DEFAULT_QUEUE_SIZE, loop: int = 0, metadata=None
+    ):
+        """
+        :param fps: frame rate of the animation
+        :param image_format: 'gif' or 'apng', taken from the extension of the file if omitted
+            ('.png' and '.apng' are APNG)
+        :param palette_frames: amount of first frames the palette is made from; colours that
+            show up only later are drawn with the closest colour of the palette
+        :param workers: threads mapping and compressing frames, all the cores if omitted
+        :param queue_size: maximum amount of frames drawn but not written yet
+        :param loop: how many times the animation is played, 0 loops forever
+        """
+        super().__init__(fps=fps, metadata=metadata)
+        if image_format is not None and image_format not in IMAGE_FORMATS:
+            raise ValueError(f'image format has to be one of {IMAGE_FORMATS}')
+        self.image_format = image_format
+        self.palette_frames = max(1, palette_frames)
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = max(1, queue_size)
+        self.loop = loop
+        self._file = None
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._sampled: List[np.ndarray] = []
+        self._palette: Optional[Image.Image] = None
+        self._palette_data = b''
+        self._previous: Optional[Future] = None
+        self._pending: Deque[Future] = deque()
+        self._frames_written = 0
+        self._sequence = 0
+        self._frame_count_position = 0
+
+    @classmethod
+    def isAvailable(cls) -> bool:
+        return True
+
+    def setup(self, fig, outfile, dpi=None):
+        super().setup(fig, outfile, dpi=dpi)
+        if self.image_format is None:
+            extension = os.path.splitext(str(outfile))[1].lower()
+            self.image_format = 'apng' if extension in ('.png', '.apng') else 'gif'
+        self._file = open(outfile, 'wb')
+        self._pool = ThreadPoolExecutor(self.workers)
+        self._sampled = []
+        self._palette = None
+        self._previous = None
+        self._pending.clear()
+        self._frames_written = 0
+        self._sequence = 0
+
+    def grab_frame(self, **savefig_kwargs):
+        """
+        draw the current state of the figure and queue it for encoding
+        """
+        buffer = io.BytesIO()
+        self.fig.savefig(buffer, **{**savefig_kwargs, 'format': 'rgba', 'dpi': self.dpi})
+        width, height = self.frame_size
+        rgba = np.frombuffer(buffer.getbuffer(), dtype=np.uint8).reshape(height, width, 4)
+        self.write_frame(rgba)
+
+    def write_frame(self, rgba_buffer):
+        """
+        queue a frame drawn elsewhere, e.g. by the blitting renderer, instead of 'grab_frame'
+        :param rgba_buffer: (height x width x 4) RGBA buffer, e.g. FigureCanvasAgg.buffer_rgba(),
+            it is copied, so it can be reused right away
+        """
+        # formats support no partial transparency, alpha channel is dropped
+        rgb = np.ascontiguousarray(np.asarray(rgba_buffer)[..., :3])
+        if self._palette is None:
+            self._sampled.append(rgb)
+            if len(self._sampled) >= self.palette_frames:
+                self._start_encoding()
+            return
+        self._queue_frame(rgb)
+
+    def _start_encoding(self):
+        """
+        make the palette of the sampled frames, write the header and queue the sampled frames
+        """
+        # frames side by side make one image, quantized together
+        sample = Image.fromarray(np.concatenate(self._sampled, axis=0))
+        self._palette = sample.quantize(256, method=Image.Quantize.MEDIANCUT)
+        palette = bytes(self._palette.getpalette()[:768])
+        # every entry is written, so indices never change between the frames
+        self._palette_data = palette.ljust(768, b'\x00')
+        self._palette.putpalette(self._palette_data)
+        height, width = self._sampled[0].shape[:2]
+        self._write_header(self._palette_data, width, height)
+        sampled, self._sampled = self._sampled, []
+        for rgb in sampled:
+            self._queue_frame(rgb)
+
+    def _queue_frame(self, rgb: np.ndarray):
+        indexed = self._pool.submit(self._map_colours, rgb)
+        # every earlier mapping task has been started before this one is taken by a thread,
+        # so waiting on them inside the pool cannot block it
+        self._pending.append(self._pool.submit(self._encode, self._previous, indexed))
+        self._previous = indexed
+        while len(self._pending) > self.queue_size:
+            self._write_frame(*self._pending.popleft().result())
+
+    def _map_colours(self, rgb: np.ndarray) -> np.ndarray:
+        indexed = Image.fromarray(rgb).quantize(palette=self._palette, dither=Image.Dither.NONE)
+        return np.asarray(indexed)
+
+    def _encode(self, previous: Optional[Future], indexed: Future) -> Tuple[Box, bytes]:
+        """
+        compress the changed part of the frame as a standalone image of the format,
+        and take the pixel data out of it
+        """
+        current = indexed.result()
+        box = changed_box(None if previous is None else previous.result(), current)
+        top, bottom, left, right = box
+        image = Image.fromarray(np.ascontiguousarray(current[top:bottom, left:right]), 'P')
+        image.putpalette(self._palette_data)
+        encoded = io.BytesIO()
+        if self.image_format == 'gif':
+            image.save(encoded, 'GIF', optimize=False, interlace=False)
+            return box, _gif_image_data(encoded.getvalue())
+        image.save(encoded, 'PNG', optimize=False, bits=8)
+        return box, _png_image_data(encoded.getvalue())
+
+    def _write_header(self, palette: bytes, width: int, height: int):
+        if self.image_format == 'gif':
+            # global table of 256 colours, then the NETSCAPE extension with the loop count
+            self._file.write(b'GIF89a' + struct.pack('<HHBBB', width, height, 0xF7, 0, 0))
+            self._file.write(palette)
+            self._file.write(
+                b'\x21\xFF\x0BNETSCAPE2.0\x03\x01' + struct.pack('<H', self.loop) + b'\x00')
+            return
+        self._file.write(PNG_SIGNATURE)
+        header = struct.pack('>IIBBBBB', width, height, 8, 3, 0, 0, 0)
+        self._file.write(_png_chunk(b'IHDR', header))
+        self._file.write(_png_chunk(b'PLTE', palette))
+        # amount of frames is filled in by 'finish'
+        self._frame_count_position = self._file.tell()
+        self._file.write(_png_chunk(b'acTL', struct.pack('>II', 0, self.loop)))
+
+    def _write_frame(self, box: Box, data: bytes):
+        top, bottom, left, right = box
+        if self.image_format == 'gif':
+            delay = max(GIF_MIN_DELAY, round(100. / self.fps))
+            # graphic control: previous frame is kept under the changed rectangle
+            self._file.write(b'\x21\xF9\x04\x04' + struct.pack('<H', delay) + b'\x00\x00')
+            self._file.write(
+                b'\x2C' + struct.pack('<HHHHB', left, top, right - left, bottom - top, 0))
+            self._file.write(data)
+        else:
+            # delay of fps-th part of a second, no disposal, rectangle replaces what was there
+            self._file.write(_png_chunk(b'fcTL', struct.pack(
+                '>IIIIIHHBB', self._sequence, right - left, bottom - top, left, top,
+                1, int(self.fps), 0, 0)))
+            self._sequence += 1
+            if self._frames_written == 0:
+                self._file.write(_png_chunk(b'IDAT', data))
+            else:
+                self._file.write(_png_chunk(b'fdAT', struct.pack('>I', self._sequence) + data))
+                self._sequence += 1
+        self._frames_written += 1
+
+    def finish(self):
+        """
+        encode the frames still in flight and close the file
+        """
+        try:
+            if self._palette is None and self._sampled:
+                # fewer frames than palette_frames
+                self._start_encoding()
+            while self._pending:
+                self._write_frame(*self._pending.popleft().result())
+            if self.image_format == 'gif':
+                self._file.write(b'\x3B')
+            else:
+                self._file.write(_png_chunk(b'IEND', b''))
+                self._file.seek(self._frame_count_position)
+                self._file.write(
+                    _png_chunk(b'acTL', struct.pack('>II', self._frames_written, self.loop)))
+        finally:
+            self._pool.shutdown(cancel_futures=True)
+            self._previous = None
+            self._pending.clear()
+            self._file.close()
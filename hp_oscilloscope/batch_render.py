@@ -0,0 +1,375 @@
+# renders many captures at once, every capture into its own movie (or directory of frames), e.g.:
+#   python -m hp_oscilloscope.batch_render captures/ --output-dir movies --fps 60 --format mp4
+#   python -m hp_oscilloscope.batch_render shift/*.hpcap --memory-budget 8G --report report.json
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+from .capture_file import CAPTURE_EXTENSION, read_capture_header
+from .frame_pipeline import DEFAULT_MEMORY_LIMIT, frame_row_bytes
+from .spectral_band import SpectralBand
+from .spectral_engine import batch_frames
+from .spectral_store import SpectralFrameStore
+
+OUTPUT_FORMATS = ('mp4', 'png')
+# size of FFTAnimation figure in inches
+FIGURE_SIZE = (15., 9.)
+# canvas, blitting background and the copy made by the encoder (or PNG writer)
+FRAME_BUFFERS = 3
+# interpreter with numpy and matplotlib imported, before any data is loaded
+PROCESS_BASE_BYTES = 80 << 20
+# of the physical memory, when no budget is given
+DEFAULT_BUDGET_SHARE = 0.75
+
+
+class BatchJob(NamedTuple):
+    name: str
+    capture_path: str
+    output: str  # movie file, or directory of the frames
+    settings: dict  # FFTAnimation arguments and rendering options
+    memory: int  # estimated peak memory of the job, in bytes
+
+
+class JobResult(NamedTuple):
+    name: str
+    output: str
+    ok: bool
+    error: Optional[str]
+    frames: int
+    duration: float  # in seconds, in the worker
+    peak_memory: Optional[int]  # in bytes, of the worker process
+    estimated_memory: int
+    stages: Dict[str, Dict[str, float]]
+
+
+def parse_size(size: str) -> int:
+    """
+    amount of bytes from e.g. '512M', '8G' or plain '1000000'
+    """
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+    size = size.strip().upper().rstrip('B')
+    if size and size[-1] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+    return int(size)
+
+
+def physical_memory() -> Optional[int]:
+    """
+    total RAM of the machine, 'None' where it cannot be told
+    """
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def peak_rss() -> Optional[int]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def find_captures(paths: List[str]) -> List[str]:
+    """
+    capture files given directly, or found in the given directories
+    """
+    captures = []
+    for path in paths:
+        if os.path.isdir(path):
+            captures.extend(sorted(glob.glob(os.path.join(path, '*' + CAPTURE_EXTENSION))))
+        else:
+            captures.append(path)
+    return captures
+
+
+def estimate_job_memory(capture_path: str, settings: dict) -> int:
+    """
+    peak memory of rendering the capture with given settings, found from the header of the
+    capture only: samples of the signal, spectra of the frames (or the lazy pipeline
+    limit), FFT scratch of a single batch and the frame buffers of the figure
+    """
+    metadata, _ = read_capture_header(capture_path)
+    points = metadata['samples']
+    span = points // settings['split_factor']
+    frames = settings['fps'] * settings['total_time']
+    # windows repeat when there are more frames than window positions
+    rows = min(frames, points - span + 1)
+
+    freq_range, zoom = settings['freq_range'], settings['zoom']
+    if freq_range is None:
+        bins = SpectralFrameStore.bins_for_span(span)
+    elif freq_range == 'displayed':
+        bins = (span // 4 - 1) * zoom + 1
+    else:
+        preamble = metadata['preamble']
+        d_t = preamble['x_increment'] if settings['scaled'] and preamble else 1.
+        bins = SpectralBand(span, d_t, freq_range, zoom).bins
+
+    itemsize = settings['spectrum_dtype'].itemsize
+    # time axis and the signal as float64 when it is scaled, memory-mapped samples otherwise
+    signal = 8 * points * (2 if settings['scaled'] else 1)
+    spectra = 3 * rows * bins * itemsize
+    if settings['lazy']:
+        # the pipeline never holds more than its limit, nor more than all the spectra
+        spectra = min(spectra, settings['memory_limit'])
+    scratch = batch_frames(span) * frame_row_bytes(bins, settings['spectrum_dtype'])
+    width, height = (int(inches * settings['dpi']) for inches in FIGURE_SIZE)
+    figure = FRAME_BUFFERS * 4 * width * height
+    return PROCESS_BASE_BYTES + signal + spectra + scratch + figure
+
+
+def render_job(job: BatchJob) -> JobResult:
+    """
+    render a single capture in the worker process, errors are reported in the result
+    """
+    from .capture_file import open_capture
+    from .lazy_pyplot import pyplot
+    from .oscilloscope_fft_processing import FFTAnimation
+    from .render_profiling import RenderProfiler
+
+    settings = job.settings
+    profiler = RenderProfiler(progress_callback=None)
+    started = time.perf_counter()
+    frames = 0
+    try:
+        animation = FFTAnimation.from_capture(
+            open_capture(job.capture_path), scaled=settings['scaled'],
+            fps=settings['fps'], total_time=settings['total_time'],
+            split_factor=settings['split_factor'], spectrum_dtype=settings['spectrum_dtype'],
+            freq_range=settings['freq_range'], zoom=settings['zoom'], profiler=profiler,
+            # workers never show anything
+            headless=True,
+        )
+        if settings['format'] == 'png':
+            animation.generate_frame_images(
+                output_dir=job.output, dpi=settings['dpi'], lazy=settings['lazy'],
+                memory_limit=settings['memory_limit'], frame_range=settings['frame_range'],
+                resume=settings['resume'],
+            )
+        else:
+            animation.render_video(
+                job.output, dpi=settings['dpi'], fallback_dir=os.path.splitext(job.output)[0],
+                lazy=settings['lazy'], memory_limit=settings['memory_limit'],
+            )
+        frames = profiler.frames_done
+        pyplot().close(animation.animation_figure)
+        error = None
+    except Exception as exception:  # noqa
+        error = f'{type(exception).__name__}: {exception}'
+    return JobResult(
+        job.name, job.output, error is None, error, frames, time.perf_counter() - started,
+        peak_rss(), job.memory, profiler.summary(),
+    )
+
+
+def _failed_result(job: BatchJob, error: BaseException) -> JobResult:
+    """
+    result of the job whose worker could not even report back
+    """
+    return JobResult(
+        job.name, job.output, False, f'{type(error).__name__}: {error}', 0, 0., None,
+        job.memory, {},
+    )
+
+
+def run_batch(
+    jobs: List[BatchJob], workers: Optional[int] = None, memory_budget: Optional[int] = None,
+    progress: bool = True
+) -> List[JobResult]:
+    """
+    render the jobs with a pool of processes, starting a job only when the estimated memory
+    of all the running ones (together with it) fits the budget. The biggest jobs go first,
+    so the small ones fill the gaps at the end; a job over the budget runs alone
+    :param jobs: jobs to render
+    :param workers: amount of jobs running at once, 'None' uses all the cores
+    :param memory_budget: memory for all the running jobs in bytes, 3/4 of the RAM if omitted
+    :param progress: print every finished job
+    :return: results in the order the jobs finished; a job whose process died (e.g. killed
+        for running out of memory) comes back failed, with BrokenProcessPool as the error
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if memory_budget is None:
+        memory = physical_memory()
+        memory_budget = int(DEFAULT_BUDGET_SHARE * memory) if memory else sys.maxsize
+    waiting = sorted(jobs, key=lambda job: job.memory, reverse=True)
+    running: Dict[Future, Tuple[BatchJob, ProcessPoolExecutor]] = {}
+    results: List[JobResult] = []
+
+    def fits(job: BatchJob) -> bool:
+        return sum(other.memory for other, _ in running.values()) + job.memory <= memory_budget
+
+    # 'spawn' gives every worker a clean interpreter; every job gets a process of its own,
+    # which hands the memory of the finished job back to the system, and if the process
+    # dies, only its own job fails (the future raises BrokenProcessPool instead of hanging)
+    context = multiprocessing.get_context('spawn')
+    try:
+        while waiting or running:
+            for job in list(waiting):
+                if len(running) >= workers:
+                    break
+                if running and not fits(job):
+                    continue
+                waiting.remove(job)
+                executor = ProcessPoolExecutor(1, mp_context=context)
+                running[executor.submit(render_job, job)] = (job, executor)
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                job, executor = running.pop(future)
+                executor.shutdown()
+                try:
+                    result: JobResult = future.result()
+                except Exception as error:  # noqa
+                    result = _failed_result(job, error)
+                results.append(result)
+                if progress:
+                    print_job_result(result, len(results), len(jobs))
+    finally:
+        for _, executor in running.values():
+            executor.shutdown(cancel_futures=True)
+    return results
+
+
+def print_job_result(result: JobResult, done: int, total: int):
+    status = 'ok' if result.ok else f'FAILED ({result.error})'
+    peak = '?' if result.peak_memory is None else f'{result.peak_memory / 2 ** 20:.0f}'
+    estimated = result.estimated_memory / 2 ** 20
+    print(
+        f'[{done}/{total}] {result.name}: {status}, {result.frames} frames in '
+        f'{result.duration:.1f} s, peak {peak} MB (estimated {estimated:.0f} MB)'
+    )
+
+
+def batch_summary(results: List[JobResult], wall_time: float) -> dict:
+    """
+    totals of the batch; speedup is the time the jobs took one after another over the time
+    of the whole batch
+    """
+    job_time = sum(result.duration for result in results)
+    frames = sum(result.frames for result in results)
+    return {
+        'jobs': len(results),
+        'failed': sum(not result.ok for result in results),
+        'frames': frames,
+        'wall_time_s': wall_time,
+        'job_time_s': job_time,
+        'speedup': job_time / wall_time if wall_time > 0 else 0.,
+        'frames_per_s': frames / wall_time if wall_time > 0 else 0.,
+    }
+
+
+def write_report(path: str, results: List[JobResult], summary: dict, settings: dict):
+    report = {
+        'settings': {
+            **settings, 'spectrum_dtype': settings['spectrum_dtype'].str,
+        },
+        'summary': summary,
+        'jobs': [result._asdict() for result in results],
+    }
+    with open(path, 'w') as report_file:
+        json.dump(report, report_file, indent=2)
+
+
+def parse_frequency_range(value: str) -> Union[str, Tuple[float, float]]:
+    if value == 'displayed':
+        return value
+    low, high = (float(bound) for bound in value.split(':'))
+    return low, high
+
+
+def parse_arguments(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='render many captures into FFT animations')
+    parser.add_argument('captures', nargs='+', help='capture files, or directories with them')
+    parser.add_argument('--output-dir', default='rendered_movies')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='mp4')
+    parser.add_argument('--fps', type=int, default=60)
+    parser.add_argument('--total-time', type=int, default=10, help='length of animation, in s')
+    parser.add_argument('--split-factor', type=int, default=2)
+    parser.add_argument('--dpi', type=int, default=200)
+    parser.add_argument(
+        '--scaled', action='store_true', help='use seconds and volts from the preambles')
+    parser.add_argument(
+        '--freq-range', type=parse_frequency_range,
+        help="'displayed' or low:high, whole half-spectrum if omitted")
+    parser.add_argument('--zoom', type=int, default=1)
+    parser.add_argument(
+        '--lazy', action='store_true',
+        help='compute spectra just before the frames are drawn, with bounded memory')
+    parser.add_argument(
+        '--memory-limit', type=parse_size, default=DEFAULT_MEMORY_LIMIT,
+        help='memory for the spectra of a single job in the lazy mode')
+    parser.add_argument(
+        '--frame-range', type=int, nargs=2, metavar=('START', 'STOP'),
+        help='render only these frames (png format only)')
+    parser.add_argument(
+        '--no-resume', action='store_true', help='draw again the frames that are already saved')
+    parser.add_argument('--workers', type=int, help='jobs running at once, all cores if omitted')
+    parser.add_argument(
+        '--memory-budget', type=parse_size,
+        help='memory for all the running jobs, e.g. 8G; 3/4 of the RAM if omitted')
+    parser.add_argument('--report', help='JSON file for per-job timings and the summary')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import numpy as np
+
+    arguments = parse_arguments(argv)
+    if arguments.frame_range and arguments.format != 'png':
+        print('--frame-range needs the png format')
+        return 2
+    settings = {
+        'format': arguments.format,
+        'fps': arguments.fps,
+        'total_time': arguments.total_time,
+        'split_factor': arguments.split_factor,
+        'dpi': arguments.dpi,
+        'scaled': arguments.scaled,
+        'freq_range': arguments.freq_range,
+        'zoom': arguments.zoom,
+        'spectrum_dtype': np.dtype(np.float32),
+        'lazy': arguments.lazy,
+        'memory_limit': arguments.memory_limit,
+        'frame_range': arguments.frame_range,
+        'resume': not arguments.no_resume,
+    }
+    jobs = []
+    for path in find_captures(arguments.captures):
+        name = os.path.splitext(os.path.basename(path))[0]
+        output = os.path.join(arguments.output_dir, name)
+        if arguments.format != 'png':
+            output += '.' + arguments.format
+        jobs.append(BatchJob(name, path, output, settings, estimate_job_memory(path, settings)))
+    if len({job.name for job in jobs}) != len(jobs):
+        print('captures need distinct file names, outputs would overwrite each other')
+        return 2
+    if not jobs:
+        print('no captures found')
+        return 2
+    os.makedirs(arguments.output_dir, exist_ok=True)
+
+    started = time.perf_counter()
+    results = run_batch(jobs, arguments.workers, arguments.memory_budget)
+    summary = batch_summary(results, time.perf_counter() - started)
+    print(
+        f'{summary["jobs"]} jobs ({summary["failed"]} failed), {summary["frames"]} frames in '
+        f'{summary["wall_time_s"]:.1f} s, {summary["frames_per_s"]:.2f} frames/s, '
+        f'{summary["speedup"]:.2f}x over one job at a time'
+    )
+    if arguments.report:
+        write_report(arguments.report, results, summary, settings)
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,61 @@
+from typing import List
+
+from matplotlib.artist import Artist
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+
+def agg_canvas(figure: Figure) -> FigureCanvasAgg:
+    """
+    canvas of the figure that exposes RGBA buffer, Agg one is attached if the current
+    backend's canvas does not derive from it
+    """
+    canvas = figure.canvas
+    if not isinstance(canvas, FigureCanvasAgg):
+        canvas = FigureCanvasAgg(figure)
+    return canvas
+
+
+class BlitRenderer:
+    """
+    renders frames of the figure where only a few artists change from frame to frame
+
+    static part of the figure (background, axes decorations, long signal traces) is
+    rasterised once and kept as a pixel copy. Each frame restores that copy and draws only
+    the changing artists on top of it, so the cost of a frame does not depend on how much
+    is drawn in the background. Axes limits have to stay unchanged between frames
+    """
+    def __init__(self, figure: Figure, artists: List[Artist]):
+        self.figure = figure
+        self.artists = artists
+        self.canvas = agg_canvas(figure)
+        self.background = None
+
+    def capture_background(self):
+        """
+        draw the whole figure without the changing artists and keep its pixels
+        """
+        for artist in self.artists:
+            artist.set_animated(True)
+        self.canvas.draw()
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+
+    def render(self) -> memoryview:
+        """
+        draw the current state of the changing artists over the stored background
+        :return: RGBA buffer of the canvas, reused by the next call
+        """
+        if self.background is None:
+            self.capture_background()
+        self.canvas.restore_region(self.background)
+        for artist in self.artists:
+            self.figure.draw_artist(artist)
+        return self.canvas.buffer_rgba()
+
+    def release(self):
+        """
+        make artists part of the regular drawing again
+        """
+        for artist in self.artists:
+            artist.set_animated(False)
+        self.background = None
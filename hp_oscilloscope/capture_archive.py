@@ -0,0 +1,270 @@
+# many captures of a measurement session kept together, e.g. to collect the captures
+# saved during a shift into one archive:
+#   python -m hp_oscilloscope.capture_archive shift_archive captures/*.hpcap
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+
+from .capture_file import DATA_ALIGNMENT, Capture, open_capture
+from .oscilloscope_auxiliary import WaveformPreamble
+
+ARCHIVE_INFO = 'archive.json'
+INDEX_FILE = 'index.bin'
+ARCHIVE_VERSION = 1
+# captures never span two data files, a new file is started when the current one is full
+DEFAULT_CHUNK_BYTES = 256 << 20
+
+PREAMBLE_DTYPE = np.dtype([
+    ('format', '<i4'), ('type', '<i4'), ('points', '<i4'), ('count', '<i4'),
+    ('x_increment', '<f8'), ('x_origin', '<f8'), ('x_reference', '<f8'),
+    ('y_increment', '<f8'), ('y_origin', '<f8'), ('y_reference', '<f8'),
+])
+# one fixed-size record per capture, in the order they were appended
+INDEX_DTYPE = np.dtype([
+    ('timestamp', '<f8'),  # seconds since epoch
+    ('channel', '<u1'),
+    ('has_preamble', '?'),
+    ('dtype', 'S8'),  # numpy type string of the samples, e.g. b'|u1'
+    ('chunk', '<u4'),  # number of the data file
+    ('offset', '<u8'),  # place of the samples in the data file, in bytes
+    ('samples', '<u8'),
+    ('preamble', PREAMBLE_DTYPE),
+])
+
+TimeValue = Union[float, datetime]
+
+
+def chunk_name(chunk: int) -> str:
+    return f'data_{chunk:05d}.bin'
+
+
+def _seconds(value: Optional[TimeValue]) -> Optional[float]:
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return value
+
+
+class CaptureArchive:
+    """
+    append-only store of many captures: samples go into large data files one after
+    another, and a compact index of fixed-size records keeps time, channel, preamble and
+    place of every capture
+
+    opening the archive maps the index only, no samples are read. Captures have to be
+    appended in time order, so a time range is found with a binary search over the index,
+    and captures come out as memory-mapped views over the data files, ready for
+    FFTAnimation.from_capture or the spectral code. A capture is in the archive once its
+    index record is written, which happens only after its samples are flushed - a crash
+    in the middle of an append leaves unreferenced bytes behind, never a broken capture
+    """
+    def __init__(
+        self, directory: str, writable: bool = False, chunk_bytes: int = DEFAULT_CHUNK_BYTES
+    ):
+        """
+        :param directory: place of the archive, created if missing when writable
+        :param writable: allow appending captures
+        :param chunk_bytes: size of a data file above which the next one is started,
+            taken from the archive when it already exists
+        """
+        self.directory = directory
+        self.writable = writable
+        info_path = os.path.join(directory, ARCHIVE_INFO)
+        if os.path.exists(info_path):
+            with open(info_path, 'r') as info_file:
+                info = json.load(info_file)
+            if info['version'] != ARCHIVE_VERSION:
+                raise ValueError(f'unsupported archive version {info["version"]}')
+            chunk_bytes = info['chunk_bytes']
+        elif writable:
+            os.makedirs(directory, exist_ok=True)
+            with open(info_path, 'w') as info_file:
+                json.dump({'version': ARCHIVE_VERSION, 'chunk_bytes': chunk_bytes}, info_file)
+            open(os.path.join(directory, INDEX_FILE), 'ab').close()
+        else:
+            raise FileNotFoundError(f'no capture archive in {directory}')
+        self.chunk_bytes = chunk_bytes
+        self.index_path = os.path.join(directory, INDEX_FILE)
+        self.index = np.zeros(0, dtype=INDEX_DTYPE)
+        self._chunks: Dict[int, np.memmap] = {}
+        self.refresh()
+
+    def refresh(self):
+        """
+        map the index again, to see the captures appended since (e.g. by another process)
+        """
+        # a record cut short by a crash is not a part of the archive
+        records = os.path.getsize(self.index_path) // INDEX_DTYPE.itemsize
+        if records == len(self.index):
+            return
+        self.index = np.memmap(self.index_path, dtype=INDEX_DTYPE, mode='r', shape=(records,))
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def _chunk_path(self, chunk: int) -> str:
+        return os.path.join(self.directory, chunk_name(chunk))
+
+    def append(
+        self, samples: np.ndarray, channel: int = 1, timestamp: Optional[TimeValue] = None,
+        preamble: Optional[WaveformPreamble] = None
+    ) -> int:
+        """
+        add the capture at the end of the archive
+        :param samples: raw waveform samples, any numeric dtype
+        :param channel: channel of the oscilloscope the capture comes from
+        :param timestamp: capture time in seconds since epoch (or datetime), current time
+            if omitted; it cannot be earlier than the time of the last capture
+        :param preamble: scaling of the waveform, as sent by the oscilloscope
+        :return: number of the capture in the archive
+        """
+        if not self.writable:
+            raise PermissionError('archive was opened read-only')
+        samples = np.ascontiguousarray(samples)
+        timestamp = time.time() if timestamp is None else _seconds(timestamp)
+        self.refresh()
+        if len(self.index) and timestamp < self.index['timestamp'][-1]:
+            raise ValueError('captures have to be appended in time order')
+
+        if len(self.index):
+            last = self.index[-1]
+            chunk = int(last['chunk'])
+            offset = int(last['offset']) + int(last['samples']) * np.dtype(
+                last['dtype'].decode('ASCII')).itemsize
+        else:
+            chunk, offset = 0, 0
+        offset += -offset % DATA_ALIGNMENT
+        if offset and offset + samples.nbytes > self.chunk_bytes:
+            chunk, offset = chunk + 1, 0
+
+        with open(self._chunk_path(chunk), 'ab') as data_file:
+            # pads up to the alignment, or cuts off what a crashed append left behind
+            data_file.truncate(offset)
+            data_file.write(samples.tobytes())
+            data_file.flush()
+            os.fsync(data_file.fileno())
+
+        record = np.zeros(1, dtype=INDEX_DTYPE)
+        record['timestamp'] = timestamp
+        record['channel'] = channel
+        record['dtype'] = samples.dtype.str.encode('ASCII')
+        record['chunk'] = chunk
+        record['offset'] = offset
+        record['samples'] = len(samples)
+        if preamble is not None:
+            record['has_preamble'] = True
+            record['preamble'] = tuple(preamble)
+        with open(self.index_path, 'ab') as index_file:
+            # cuts off a record left half-written by a crashed append, the new one would be
+            # out of step with the records otherwise
+            index_file.truncate(len(self.index) * INDEX_DTYPE.itemsize)
+            index_file.write(record.tobytes())
+        self.refresh()
+        return len(self.index) - 1
+
+    def append_capture(self, capture: Capture) -> int:
+        """
+        add the capture loaded e.g. with 'open_capture'
+        """
+        return self.append(capture.samples, capture.channel, capture.timestamp, capture.preamble)
+
+    def _chunk(self, chunk: int, needed_bytes: int) -> np.memmap:
+        """
+        memory map of the data file that covers at least needed_bytes of it
+        """
+        data = self._chunks.get(chunk)
+        if data is None or len(data) < needed_bytes:
+            # the last data file grows with every append, so its map is renewed
+            data = np.memmap(self._chunk_path(chunk), dtype=np.uint8, mode='r')
+            self._chunks[chunk] = data
+        return data
+
+    def samples(self, number: int) -> np.ndarray:
+        """
+        samples of the capture, as a read-only view over the data file (nothing is copied)
+        """
+        record = self.index[number]
+        dtype = np.dtype(record['dtype'].decode('ASCII'))
+        start = int(record['offset'])
+        stop = start + int(record['samples']) * dtype.itemsize
+        return self._chunk(int(record['chunk']), stop)[start:stop].view(dtype)
+
+    def capture(self, number: int) -> Capture:
+        """
+        capture with its metadata, samples stay on the disk until they are used
+        """
+        record = self.index[number]
+        preamble = None
+        if record['has_preamble']:
+            preamble = WaveformPreamble(*(value.item() for value in record['preamble']))
+        return Capture(
+            self.samples(number), channel=int(record['channel']),
+            timestamp=float(record['timestamp']), preamble=preamble,
+        )
+
+    def find(
+        self, start: Optional[TimeValue] = None, stop: Optional[TimeValue] = None,
+        channel: Optional[int] = None
+    ) -> np.ndarray:
+        """
+        numbers of the captures taken in the time range, found by binary search
+        :param start: earliest capture time (included), seconds since epoch or datetime
+        :param stop: latest capture time (excluded)
+        :param channel: only the captures of this channel, all of them if omitted
+        """
+        timestamps = self.index['timestamp']
+        first = 0 if start is None else int(np.searchsorted(timestamps, _seconds(start), 'left'))
+        last = len(self.index) if stop is None else \
+            int(np.searchsorted(timestamps, _seconds(stop), 'left'))
+        numbers = np.arange(first, max(first, last))
+        if channel is not None:
+            numbers = numbers[self.index['channel'][first:last] == channel]
+        return numbers
+
+    def captures(
+        self, start: Optional[TimeValue] = None, stop: Optional[TimeValue] = None,
+        channel: Optional[int] = None
+    ) -> List[Capture]:
+        """
+        captures taken in the time range, see 'find'
+        """
+        return [self.capture(int(number)) for number in self.find(start, stop, channel)]
+
+    def close(self):
+        self._chunks.clear()
+        self.index = np.zeros(0, dtype=INDEX_DTYPE)
+
+    def __enter__(self) -> 'CaptureArchive':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def parse_arguments(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='add capture files to a capture archive')
+    parser.add_argument('archive', help='directory of the archive, created if missing')
+    parser.add_argument('captures', nargs='+', help='capture files to add, in time order')
+    parser.add_argument('--chunk-bytes', type=int, default=DEFAULT_CHUNK_BYTES)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    arguments = parse_arguments(argv)
+    captures = sorted(
+        (open_capture(path) for path in arguments.captures), key=lambda capture: capture.timestamp)
+    with CaptureArchive(arguments.archive, writable=True, chunk_bytes=arguments.chunk_bytes) \
+            as archive:
+        for capture in captures:
+            number = archive.append_capture(capture)
+            print(f'{capture.path} -> capture {number}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
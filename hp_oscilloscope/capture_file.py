@@ -0,0 +1,175 @@
+import json
+import os
+import struct
+import time
+from typing import Optional, Tuple, Union
+
+import numpy as np
+
+from .oscilloscope_auxiliary import WaveformPreamble, parse_block, scale_waveform
+
+# layout of the capture file:
+#   8 bytes   - magic
+#   4 bytes   - little-endian length of the JSON metadata
+#   N bytes   - JSON metadata (dtype, amount of samples, channel, timestamp, preamble)
+#   padding   - zeros up to DATA_ALIGNMENT
+#   rest      - raw samples
+CAPTURE_MAGIC = b'HPCAPT01'
+CAPTURE_EXTENSION = '.hpcap'
+DATA_ALIGNMENT = 64
+_LENGTH_FIELD = struct.Struct('<I')
+
+# directory with the sample captures shipped with the package
+SAMPLE_CAPTURES_DIR = os.path.join(os.path.dirname(__file__), 'captures')
+
+
+class Capture:
+    """
+    single digitized waveform with its metadata, samples are memory-mapped from the file
+    """
+    def __init__(
+        self, samples: np.ndarray, channel: int = 1, timestamp: Optional[float] = None,
+        preamble: Optional[WaveformPreamble] = None, path: Optional[str] = None
+    ):
+        self.samples = samples
+        self.channel = channel
+        self.timestamp = timestamp
+        self.preamble = preamble
+        self.path = path
+
+    def __len__(self):
+        return len(self.samples)
+
+    def time_and_values(self, scaled: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        x and y data of the capture
+        :param scaled: convert to seconds and volts with the preamble (if there is one),
+            otherwise sample indices and raw sample values are returned
+        """
+        if scaled and self.preamble is not None:
+            return scale_waveform(self.samples, self.preamble)
+        return np.arange(len(self.samples), dtype=np.float64), self.samples
+
+
+def _capture_header(
+    dtype: np.dtype, samples: int, channel: int, timestamp: Optional[float],
+    preamble: Optional[WaveformPreamble]
+) -> bytes:
+    """
+    everything that precedes the samples in the capture file, padding included
+    """
+    metadata = {
+        'dtype': np.dtype(dtype).str,
+        'samples': samples,
+        'channel': channel,
+        'timestamp': time.time() if timestamp is None else timestamp,
+        'preamble': None if preamble is None else preamble._asdict(),
+    }
+    header = json.dumps(metadata).encode('UTF-8')
+    header_end = len(CAPTURE_MAGIC) + _LENGTH_FIELD.size + len(header)
+    padding = -header_end % DATA_ALIGNMENT
+    return CAPTURE_MAGIC + _LENGTH_FIELD.pack(len(header)) + header + b'\0' * padding
+
+
+def write_capture(
+    path: str, samples: np.ndarray, channel: int = 1, timestamp: Optional[float] = None,
+    preamble: Optional[WaveformPreamble] = None
+):
+    """
+    save raw samples together with the header describing them
+    :param path: output file
+    :param samples: raw waveform samples, any numeric dtype
+    :param channel: channel of the oscilloscope the capture comes from
+    :param timestamp: capture time in seconds since epoch, current time if omitted
+    :param preamble: scaling of the waveform, as sent by the oscilloscope
+    """
+    samples = np.ascontiguousarray(samples)
+    with open(path, 'wb') as capture_file:
+        capture_file.write(_capture_header(
+            samples.dtype, len(samples), channel, timestamp, preamble))
+        capture_file.write(samples.tobytes())
+
+
+def create_capture(
+    path: str, samples: int, dtype: np.dtype = np.uint8, channel: int = 1,
+    timestamp: Optional[float] = None, preamble: Optional[WaveformPreamble] = None
+) -> np.memmap:
+    """
+    preallocate the capture file, so the samples can be written into it piece by piece
+    :param path: output file
+    :param samples: amount of samples in the capture
+    :param dtype: type of the samples
+    :param channel: channel of the oscilloscope the capture comes from
+    :param timestamp: capture time in seconds since epoch, current time if omitted
+    :param preamble: scaling of the waveform, as sent by the oscilloscope
+    :return: writable memory map over the samples of the new file
+    """
+    header = _capture_header(dtype, samples, channel, timestamp, preamble)
+    with open(path, 'wb') as capture_file:
+        capture_file.write(header)
+        capture_file.truncate(len(header) + samples * np.dtype(dtype).itemsize)
+    return np.memmap(path, dtype=dtype, mode='r+', offset=len(header), shape=(samples,))
+
+
+def read_capture_header(path: str) -> Tuple[dict, int]:
+    """
+    read only the metadata of the capture file
+    :return: metadata dictionary and offset of the samples in the file
+    """
+    with open(path, 'rb') as capture_file:
+        magic = capture_file.read(len(CAPTURE_MAGIC))
+        if magic != CAPTURE_MAGIC:
+            raise ValueError(f'{path} is not a capture file')
+        header_length, = _LENGTH_FIELD.unpack(capture_file.read(_LENGTH_FIELD.size))
+        metadata = json.loads(capture_file.read(header_length).decode('UTF-8'))
+    header_end = len(CAPTURE_MAGIC) + _LENGTH_FIELD.size + header_length
+    return metadata, header_end + (-header_end % DATA_ALIGNMENT)
+
+
+def open_capture(path: str, mode: str = 'r') -> Capture:
+    """
+    open the capture file, samples are memory-mapped and not read until used
+    :param path: capture file
+    :param mode: memory-map mode, read-only by default ('r+' lets the samples be modified)
+    """
+    metadata, data_offset = read_capture_header(path)
+    samples = np.memmap(
+        path, dtype=np.dtype(metadata['dtype']), mode=mode, offset=data_offset,
+        shape=(metadata['samples'],)
+    )
+    preamble = metadata['preamble']
+    return Capture(
+        samples, channel=metadata['channel'], timestamp=metadata['timestamp'],
+        preamble=None if preamble is None else WaveformPreamble(**preamble), path=path
+    )
+
+
+def convert_bin_data(
+    bin_data: Union[bytes, bytearray], path: str, channel: int = 1,
+    timestamp: Optional[float] = None, preamble: Optional[WaveformPreamble] = None
+):
+    """
+    convert ':WAVEFORM:DATA?' reply (like 'bin_data' of bin_data_file_* modules) to a capture file
+    """
+    write_capture(path, parse_block(bin_data), channel, timestamp, preamble)
+
+
+def convert_sample_modules(directory: str = SAMPLE_CAPTURES_DIR):
+    """
+    convert the captures kept as Python literals into capture files in the directory
+    """
+    from auxiliary_functions import bin_data_file_1
+    from . import bin_data_file_2
+
+    os.makedirs(directory, exist_ok=True)
+    for module in (bin_data_file_1, bin_data_file_2):
+        module_name = module.__name__.rsplit('.', 1)[-1]
+        # the literals carry no information about when they were captured
+        convert_bin_data(
+            module.bin_data, os.path.join(directory, module_name + CAPTURE_EXTENSION),
+            timestamp=0.
+        )
+
+
+if __name__ == '__main__':
+    convert_sample_modules()
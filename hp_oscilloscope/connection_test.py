@@ -1,22 +1,16 @@
-import time
-from .oscilloscope_auxiliary import process_bytes
-import serial
+from .oscilloscope_auxiliary import BAUDRATE_FAST, process_bytes
+from .serial_transport import SerialTransport
 
-connection = serial.Serial(
-    port='COM5', baudrate=19200, timeout=0.2, parity=serial.PARITY_NONE,
-    xonxoff=True, dsrdtr=False, stopbits=serial.STOPBITS_ONE
-)
+# XON/XOFF as set in the oscilloscope I/O menu, the transport switches it off for the replies
+transport = SerialTransport.open(port='COM5', baudrate=BAUDRATE_FAST, timeout=2., xonxoff=True)
 
 
-def execute(connection_instance: serial.Serial, command_):
+def execute(transport_: SerialTransport, command_):
     print(command_)
-    connection_instance.write(
-        chr(17).encode('ASCII') + command_ + chr(10).encode('ASCII') + chr(19).encode('ASCII')
-    )
-    data = connection_instance.read(4020)
-    if "WAVEFORM:DATA" in command_:
+    data = transport_.execute(command_)
+    if "WAVEFORM:DATA" in command_.decode('ASCII'):
         return process_bytes(data)
-    else:
+    elif data is not None:
         print(data)
 
 
@@ -60,6 +54,7 @@ commands = [
 ]
 
 
+# replies are read up to their terminator (or declared block length), so there is
+# no need to sleep between the commands anymore
 for command in commands:
-    execute(connection_instance=connection, command_=command)
-    time.sleep(0.5)
+    execute(transport_=transport, command_=command)
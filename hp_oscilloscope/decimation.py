@@ -0,0 +1,87 @@
+from math import ceil
+from typing import Optional, Tuple, TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from matplotlib.axes import Axes
+    from matplotlib.lines import Line2D
+
+
+def minmax_envelope(
+    x: np.ndarray, y: np.ndarray, columns: int, x_limits: Optional[Tuple[float, float]] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    reduce the trace to the first, minimum, maximum and last sample of every pixel column
+
+    points are kept in their original order, so the line drawn through them covers exactly
+    the same pixels as the full trace would. Samples outside of x_limits are dropped,
+    except the closest ones on both sides, so the line still reaches the edges of the axes
+    :param x: sample positions, sorted ascending
+    :param y: sample values
+    :param columns: amount of pixel columns the x_limits span over
+    :param x_limits: visible range of x, whole trace if omitted
+    :return: decimated x and y arrays
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if x_limits is None:
+        x_limits = (x[0], x[-1])
+    first = max(int(np.searchsorted(x, x_limits[0], side='left')) - 1, 0)
+    last = min(int(np.searchsorted(x, x_limits[1], side='right')) + 1, len(x))
+    x = x[first:last]
+    y = y[first:last]
+    if len(x) <= 4 * columns:
+        return x, y
+
+    # column of each sample, columns have the same width in data coordinates
+    column_width = (x_limits[1] - x_limits[0]) / columns
+    column_ids = np.clip(((x - x_limits[0]) / column_width).astype(np.intp), -1, columns)
+    # column ids never decrease along the trace, so every column is one contiguous group
+    # both in the original order and after sorting by value within the columns
+    group_starts = np.flatnonzero(np.r_[True, column_ids[1:] != column_ids[:-1]])
+    group_ends = np.r_[group_starts[1:], len(column_ids)] - 1
+    # first and last sample of a column keep the joints between the columns as they were,
+    # minimum and maximum keep the vertical extent of the column
+    order = np.lexsort((y, column_ids))
+    kept = np.unique(np.concatenate((
+        group_starts, group_ends, order[group_starts], order[group_ends]
+    )))
+    return x[kept], y[kept]
+
+
+class DecimatedTrace:
+    """
+    line on the axes that holds only the per-pixel-column min/max envelope of the trace
+
+    envelope is computed for the current size of the axes in pixels and recomputed only
+    when x limits of the axes change (or 'update' is called after a dpi change), so
+    drawing it costs the same for 4k and 1M sample records
+    """
+    def __init__(self, axes: 'Axes', x: np.ndarray, y: np.ndarray, **line_kwargs):
+        self.axes = axes
+        self.x = np.asarray(x)
+        self.y = np.asarray(y)
+        self.columns: Optional[int] = None
+        self.x_limits: Optional[Tuple[float, float]] = None
+        x_data, y_data = minmax_envelope(self.x, self.y, self.pixel_columns())
+        self.line: Line2D = axes.plot(x_data, y_data, **line_kwargs)[0]
+        axes.callbacks.connect('xlim_changed', lambda _: self.update())
+
+    def pixel_columns(self) -> int:
+        """
+        width of the axes in pixels, for the current figure size and dpi
+        """
+        return max(int(ceil(self.axes.get_window_extent().width)), 1)
+
+    def update(self):
+        """
+        recompute the envelope, if the limits or the size of the axes changed since last time
+        """
+        columns = self.pixel_columns()
+        x_limits = tuple(self.axes.get_xlim())
+        if (columns, x_limits) == (self.columns, self.x_limits):
+            return
+        self.columns = columns
+        self.x_limits = x_limits
+        self.line.set_data(*minmax_envelope(self.x, self.y, columns, x_limits))
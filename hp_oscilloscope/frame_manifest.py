@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+import time
+from typing import Dict, Optional
+
+MANIFEST_NAME = 'manifest.json'
+# least time between two saves of the manifest, in seconds; frames finished after the last
+# save are simply rendered again after a crash
+DEFAULT_SAVE_INTERVAL = 1.
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as frame_file:
+        for chunk in iter(lambda: frame_file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FrameManifest:
+    """
+    record of the frame files that were completely written to the output directory
+
+    every finished frame is kept with the size and sha256 of its file, together with the
+    signature of the render settings and the limits of the charts, so an interrupted
+    (or partial, range-limited) render can be continued later, or on another machine,
+    without drawing the valid frames again. The manifest file is replaced atomically,
+    so it never describes a frame that was not written in full
+    """
+    def __init__(
+        self, output_dir: str, signature: str, save_interval: float = DEFAULT_SAVE_INTERVAL
+    ):
+        """
+        :param output_dir: directory of the frame files and the manifest
+        :param signature: hash of everything that decides how frames look, frames recorded
+            with a different signature are not trusted
+        :param save_interval: least time between two saves, in seconds
+        """
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, MANIFEST_NAME)
+        self.signature = signature
+        self.save_interval = save_interval
+        self.frames: Dict[int, dict] = {}
+        self.chart_limits: Optional[Dict[str, float]] = None
+        self.last_save = 0.
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r') as manifest_file:
+            manifest = json.load(manifest_file)
+        if manifest.get('signature') != self.signature:
+            # settings changed, everything has to be rendered anew
+            return
+        self.chart_limits = manifest.get('chart_limits')
+        self.frames = {int(index): entry for index, entry in manifest['frames'].items()}
+
+    def save(self):
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'w') as manifest_file:
+            json.dump({
+                'signature': self.signature,
+                'chart_limits': self.chart_limits,
+                'frames': {str(index): entry for index, entry in sorted(self.frames.items())},
+            }, manifest_file, indent=1)
+        os.replace(temporary_path, self.path)
+        self.last_save = time.monotonic()
+
+    def is_done(self, frame_index: int, verify: bool = True) -> bool:
+        """
+        tell if the frame file is in place and the same as when it was recorded
+        :param verify: compare the checksum as well, not only the size
+        """
+        entry = self.frames.get(frame_index)
+        if entry is None:
+            return False
+        path = os.path.join(self.output_dir, entry['file'])
+        if not os.path.exists(path) or os.path.getsize(path) != entry['size']:
+            return False
+        return not verify or file_digest(path) == entry['sha256']
+
+    def record(self, frame_index: int, path: str):
+        """
+        add the written frame file, the manifest is saved if it was not saved for a while
+        """
+        self.frames[frame_index] = {
+            'file': os.path.relpath(path, self.output_dir),
+            'size': os.path.getsize(path),
+            'sha256': file_digest(path),
+        }
+        if time.monotonic() - self.last_save >= self.save_interval:
+            self.save()
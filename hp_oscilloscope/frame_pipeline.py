@@ -0,0 +1,128 @@
+import queue
+import threading
+from typing import Iterator, List, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np
+
+from .spectral_engine import frame_offsets
+from .spectral_store import SpectralFrameStore
+
+if TYPE_CHECKING:
+    from .oscilloscope_fft_processing import FFTAnimation
+
+
+# memory given to the spectra of frames waiting to be rendered
+DEFAULT_MEMORY_LIMIT = 256 << 20
+# amount of batches computed ahead of the one being rendered
+DEFAULT_PREFETCH = 2
+# how often the producer checks if the consumer went away, in seconds
+_PUT_TIMEOUT = 0.1
+
+Spectrum = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+def frame_row_bytes(bins: int, dtype: np.dtype) -> int:
+    """
+    memory taken by a single frame in the pipeline: stored power, real and imaginary part,
+    plus complex scratch of the FFT that computes it
+    """
+    return bins * (3 * np.dtype(dtype).itemsize + 2 * np.dtype(np.complex128).itemsize)
+
+
+def pipeline_batch_frames(
+    bins: int, dtype: np.dtype, memory_limit: int = DEFAULT_MEMORY_LIMIT,
+    prefetch: int = DEFAULT_PREFETCH
+) -> int:
+    """
+    amount of frames computed at once, so all the batches alive at the same time (the ones
+    waiting in the queue, the one being computed and the one being rendered) fit the limit
+    """
+    return max(1, memory_limit // ((prefetch + 2) * frame_row_bytes(bins, dtype)))
+
+
+class SpectrumPrefetcher:
+    """
+    computes spectra of consecutive batches of frames in a background thread, while the
+    frames of the previous batches are rendered; FFT releases the GIL, so both really run
+    at the same time. Finished batches wait in a bounded queue, when it is full the thread
+    waits for the renderer, so memory stays at a few batches however long the animation is
+    """
+    def __init__(
+        self, animation: 'FFTAnimation', frames: List[List[int]],
+        memory_limit: int = DEFAULT_MEMORY_LIMIT, prefetch: int = DEFAULT_PREFETCH
+    ):
+        """
+        :param animation: FFTAnimation the spectra are computed for
+        :param frames: frame pointers in the order they will be rendered
+        :param memory_limit: memory for the spectra of all the batches alive at once, in bytes
+        :param prefetch: amount of batches computed ahead
+        """
+        self.animation = animation
+        self.frames = frames
+        self.bins = animation.spectrum_bins()
+        self.batch_frames = pipeline_batch_frames(
+            self.bins, animation.spectrum_dtype, memory_limit, prefetch)
+        self.batches: queue.Queue = queue.Queue(maxsize=prefetch)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._produce, name='spectrum-prefetch', daemon=True)
+
+    def _put(self, item) -> bool:
+        while not self.stopped.is_set():
+            try:
+                self.batches.put(item, timeout=_PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self):
+        try:
+            for start in range(0, len(self.frames), self.batch_frames):
+                batch = self.frames[start:start + self.batch_frames]
+                store = SpectralFrameStore(
+                    len(batch), self.bins, dtype=self.animation.spectrum_dtype)
+                self.animation.compute_spectra(frame_offsets(batch), store=store)
+                if not self._put((batch, store)):
+                    return
+            self._put(None)
+        except BaseException as error:
+            # handed over to the consumer, and raised there
+            self._put(error)
+
+    def __iter__(self) -> Iterator[Tuple[List[int], Spectrum]]:
+        self.thread.start()
+        try:
+            while True:
+                item = self.batches.get()
+                if item is None:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                batch, store = item
+                for row, frame_data in enumerate(batch):
+                    yield frame_data, store.frame(row)
+        finally:
+            self.close()
+
+    def close(self):
+        """
+        stop computing, e.g. when rendering ended early
+        """
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+
+def stream_spectra(
+    animation: 'FFTAnimation', frames: Optional[List[List[int]]] = None,
+    memory_limit: int = DEFAULT_MEMORY_LIMIT, prefetch: int = DEFAULT_PREFETCH
+) -> Iterator[Tuple[List[int], Spectrum]]:
+    """
+    spectrum of every frame, computed just before it is needed
+    :param animation: FFTAnimation the spectra are computed for
+    :param frames: frame pointers in the order they will be rendered, all frames if omitted
+    :param memory_limit: memory for the spectra of all the batches alive at once, in bytes
+    :param prefetch: amount of batches computed ahead
+    """
+    frames = animation.frame_info if frames is None else frames
+    return iter(SpectrumPrefetcher(animation, frames, memory_limit, prefetch))
@@ -0,0 +1,24 @@
+# pyplot is imported on the first call only, so the numerical part of the package (capture
+# files, spectra, the archive) and the command line tools start without loading matplotlib
+import sys
+from types import ModuleType
+
+
+def use_headless():
+    """
+    switch matplotlib to the non-interactive Agg backend, for batch jobs and worker processes
+    that only save frames; it has to happen before pyplot is imported
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def pyplot(headless: bool = False) -> ModuleType:
+    """
+    matplotlib.pyplot, imported on the first call
+    :param headless: use the Agg backend (see 'use_headless'), unless pyplot is already loaded
+    """
+    if headless and 'matplotlib.pyplot' not in sys.modules:
+        use_headless()
+    from matplotlib import pyplot as plt
+    return plt
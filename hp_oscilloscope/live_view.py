@@ -0,0 +1,522 @@
+# live rolling FFT of the captures coming straight from the oscilloscope, e.g. against
+# the simulated one:
+#   python -m hp_oscilloscope.live_view --simulate pty
+#   python -m hp_oscilloscope.live_view --port COM5 --baudrate 19200
+import argparse
+import collections
+import sys
+import threading
+import time
+from typing import Callable, Deque, List, NamedTuple, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np
+
+from .lazy_pyplot import use_headless
+from .oscilloscope_auxiliary import (
+    BAUDRATE_FAST, WaveformPreamble, parse_preamble, scale_waveform
+)
+from .oscilloscope_fft_processing import FFTAnimation
+from .serial_transport import SerialTransport
+
+if TYPE_CHECKING:
+    from .blit_render import BlitRenderer
+
+DEFAULT_RING_SIZE = 4
+DEFAULT_DISPLAY_FPS = 30
+# amount of displayed frames it takes the time-window to sweep over the whole capture
+DEFAULT_SWEEP_FRAMES = 60
+# time over which the rates are averaged, in seconds
+RATE_WINDOW = 2.
+# failed captures in a row after which the acquisition gives up
+MAX_FAILURES = 5
+# time for digitizing and the replies on top of the transfer of the first capture, in seconds
+FIRST_CAPTURE_MARGIN = 10.
+# share of the observed range added to the chart limits whenever they have to grow,
+# so the background is not redrawn on every small excursion of the spectrum
+LIMITS_HEADROOM = 0.1
+
+
+class LiveCapture(NamedTuple):
+    sequence: int  # number of the capture since the acquisition started
+    timestamp: float  # time.monotonic() when it arrived
+    samples: np.ndarray
+
+
+class LiveStats(NamedTuple):
+    display_fps: float
+    acquisition_rate: float  # in captures per second
+    transfer_rate: float  # in bytes per second
+    captures: int
+    dropped: int  # captures replaced by newer ones before they were shown
+    failures: int
+
+
+def print_live_stats(stats: LiveStats):
+    print(
+        f'display {stats.display_fps:.1f} fps, acquisition {stats.acquisition_rate:.2f} '
+        f'captures/s ({stats.transfer_rate / 1000.:.2f} kB/s), {stats.captures} captures, '
+        f'{stats.dropped} dropped, {stats.failures} failed'
+    )
+
+
+def capture_timeout(points: Optional[int], baudrate: Optional[int]) -> float:
+    """
+    how long to wait for a capture: twice the time its bytes take on the line (10 bits per
+    byte), plus the margin; just the margin if the record length or the rate is unknown
+    """
+    if not points or not baudrate:
+        return FIRST_CAPTURE_MARGIN
+    return 2. * points * 10 / baudrate + FIRST_CAPTURE_MARGIN
+
+
+class RateMeter:
+    """
+    events per second over the last few seconds, safe to tick and read from different threads
+    """
+    def __init__(self, window: float = RATE_WINDOW, clock: Callable[[], float] = time.monotonic):
+        self.window = window
+        self.clock = clock
+        self.events: Deque[Tuple[float, int]] = collections.deque()
+        self.lock = threading.Lock()
+
+    def _trim(self, now: float):
+        while len(self.events) > 2 and now - self.events[0][0] > self.window:
+            self.events.popleft()
+
+    def tick(self, amount: int = 1):
+        now = self.clock()
+        with self.lock:
+            self.events.append((now, amount))
+            self._trim(now)
+
+    def rate(self) -> float:
+        with self.lock:
+            self._trim(self.clock())
+            if len(self.events) < 2:
+                return 0.
+            # events rarer than the window are measured between the last two of them,
+            # and the rate falls once they stop coming
+            now = self.clock()
+            elapsed = max(self.events[-1][0] - self.events[0][0], now - self.events[-1][0])
+            if elapsed <= 0:
+                return 0.
+            # the first event closes the time before the measured span
+            return (sum(amount for _, amount in self.events) - self.events[0][1]) / elapsed
+
+
+class CaptureRing:
+    """
+    the few newest captures; when the consumer falls behind, the oldest ones are dropped
+    instead of queueing up, so what is shown is never staler than the newest capture
+    """
+    def __init__(self, size: int = DEFAULT_RING_SIZE):
+        self.captures: Deque[LiveCapture] = collections.deque(maxlen=size)
+        self.condition = threading.Condition()
+        self.sequence = 0
+        self.dropped = 0
+        self.last_taken = -1
+
+    def put(self, samples: np.ndarray) -> LiveCapture:
+        with self.condition:
+            capture = LiveCapture(self.sequence, time.monotonic(), samples)
+            self.sequence += 1
+            self.captures.append(capture)
+            self.condition.notify_all()
+        return capture
+
+    def latest(self, timeout: Optional[float] = 0.) -> Optional[LiveCapture]:
+        """
+        newest capture that was not taken yet, the older ones that were never taken are
+        counted as dropped
+        :param timeout: how long to wait for a new capture, in seconds, 'None' waits forever
+        :return: the capture, 'None' if nothing new arrived in time
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.sequence - 1 > self.last_taken, timeout):
+                return None
+            capture = self.captures[-1]
+            self.dropped += capture.sequence - self.last_taken - 1
+            self.last_taken = capture.sequence
+            return capture
+
+    def snapshot(self) -> List[LiveCapture]:
+        """
+        all the captures kept in the ring, oldest first
+        """
+        with self.condition:
+            return list(self.captures)
+
+
+class AcquisitionThread(threading.Thread):
+    """
+    keeps digitizing and downloading captures into the ring in the background, so blocking
+    serial reads never hold up the display (pyserial releases the GIL while it waits)
+    """
+    def __init__(
+        self, transport: SerialTransport, ring: Optional[CaptureRing] = None,
+        digitize_command: bytes = b':DIGITIZE CHANNEL1',
+        data_query: bytes = b':WAVEFORM:DATA?', max_failures: int = MAX_FAILURES
+    ):
+        """
+        :param transport: connection to the oscilloscope, used only by this thread from now on
+        :param ring: destination of the captures, new one if omitted
+        :param digitize_command: command acquiring a new record
+        :param data_query: query downloading the record
+        :param max_failures: failed captures in a row after which the thread gives up
+        """
+        super().__init__(name='scope-acquisition', daemon=True)
+        self.transport = transport
+        self.ring = CaptureRing() if ring is None else ring
+        self.digitize_command = digitize_command
+        self.data_query = data_query
+        self.max_failures = max_failures
+        self.stopped = threading.Event()
+        self.capture_rate = RateMeter()
+        self.transfer_rate = RateMeter()
+        self.failures = 0
+        self.error: Optional[BaseException] = None
+
+    def run(self):
+        failures_in_row = 0
+        while not self.stopped.is_set():
+            try:
+                self.transport.write(self.digitize_command)
+                samples = self.transport.query_block(self.data_query)
+            except (TimeoutError, ValueError, OSError) as error:
+                self.failures += 1
+                failures_in_row += 1
+                if failures_in_row > self.max_failures:
+                    self.error = error
+                    return
+                self.transport.reset_input()
+                continue
+            failures_in_row = 0
+            self.ring.put(samples)
+            self.capture_rate.tick()
+            self.transfer_rate.tick(len(samples))
+
+    def check(self):
+        """
+        raise the error that stopped the acquisition, if it did
+        """
+        if self.error is not None:
+            raise RuntimeError(
+                f'acquisition stopped after {self.failures} failed captures') from self.error
+
+    def stop(self, timeout: Optional[float] = None):
+        """
+        finish after the transfer in progress, which is bounded by the read timeout
+        """
+        self.stopped.set()
+        if self.is_alive():
+            self.join(timeout)
+
+
+class LiveFFTView:
+    """
+    rolling FFT of the newest capture, drawn on the TOP/LEFT/RIGHT layout of FFTAnimation
+
+    the time-window sweeps over the newest capture, one step per displayed frame, and
+    new captures take over in the middle of the sweep. Signal trace, window bars and the
+    spectra are blitted every frame; limits of the charts only grow, so the background
+    (axes, ticks, titles) is drawn again only when the data outgrows them
+    """
+    def __init__(
+        self, acquisition: AcquisitionThread, preamble: Optional[WaveformPreamble] = None,
+        split_factor: int = 2, sweep_frames: int = DEFAULT_SWEEP_FRAMES,
+        fps: int = DEFAULT_DISPLAY_FPS, dpi: int = 100, freq_range=None,
+        stats_callback: Optional[Callable[[LiveStats], None]] = print_live_stats,
+        stats_interval: float = 1., first_capture_timeout: Optional[float] = None
+    ):
+        """
+        :param acquisition: thread filling the ring with captures
+        :param preamble: scaling of the captures to seconds and volts, raw samples if omitted
+        :param split_factor: window spans 1/split_factor of the capture, as in FFTAnimation
+        :param sweep_frames: displayed frames per sweep of the window over the capture
+        :param fps: target rate of the display
+        :param dpi: resolution of the figure
+        :param freq_range: band of the spectra, as in FFTAnimation
+        :param stats_callback: called with the rates every stats_interval, 'None' to stay silent
+        :param stats_interval: time between the stats calls, in seconds
+        :param first_capture_timeout: how long to wait for the first capture, in seconds;
+            found from the record length in the preamble and the baud rate of the link
+            if omitted (see 'capture_timeout')
+        """
+        self.acquisition = acquisition
+        self.ring = acquisition.ring
+        self.preamble = preamble
+        self.split_factor = split_factor
+        self.sweep_frames = sweep_frames
+        self.fps = fps
+        self.dpi = dpi
+        self.freq_range = freq_range
+        self.stats_callback = stats_callback
+        self.stats_interval = stats_interval
+        if first_capture_timeout is None:
+            first_capture_timeout = capture_timeout(
+                None if preamble is None else preamble.points,
+                getattr(acquisition.transport.connection, 'baudrate', None))
+        self.first_capture_timeout = first_capture_timeout
+        self.animation: Optional[FFTAnimation] = None
+        self.blitter: Optional['BlitRenderer'] = None
+        self.resize_connection: Optional[int] = None
+        self.limits: Optional[dict] = None
+        self.signal_limits: Optional[Tuple[float, float]] = None
+        self.frame = 0
+        self.needs_background = True
+        self.display_rate = RateMeter()
+        self.last_stats = time.monotonic()
+
+    def _capture_data(self, samples: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if self.preamble is None:
+            return np.arange(len(samples), dtype=np.float64), samples.astype(np.float64)
+        return scale_waveform(samples, self.preamble)
+
+    def _build_layout(self, x: np.ndarray, y: np.ndarray):
+        from .blit_render import BlitRenderer
+        self.animation = FFTAnimation(
+            x, y, fps=self.sweep_frames, total_time=1, split_factor=self.split_factor,
+            freq_range=self.freq_range
+        )
+        self.animation.prepare_charts(dry_run=True)
+        self.animation.axes_dict["TOP"].set_xlim(x[0], x[-1])
+        self.animation.start_rendering(self.dpi)
+        figure = self.animation.animation_figure
+        # positions found by the first draw are kept, the layout engine would make every
+        # redraw of the background twice as slow
+        figure.set_layout_engine('none')
+        # signal trace changes with every capture, so it is blitted along with the rest
+        self.animation.blitter.release()
+        self.blitter = BlitRenderer(
+            figure, self.animation.dynamic_artists() + [self.animation.signal_trace.line])
+        if self.resize_connection is None:
+            self.resize_connection = figure.canvas.mpl_connect('resize_event', self._resized)
+        self.limits = None
+        self.signal_limits = None
+
+    def load_capture(self, capture: LiveCapture):
+        """
+        show the capture from the next frame on, the layout is built anew only when
+        the length of the record changes
+        """
+        x, y = self._capture_data(capture.samples)
+        if self.animation is None or len(x) != len(self.animation.X):
+            self._build_layout(x, y)
+        else:
+            self.animation.X = x
+            self.animation.Y = y
+            self.animation.bar_levels = None
+            self.animation.signal_trace.x = x
+            self.animation.signal_trace.y = y
+            # envelope has to be recomputed even though the limits stay the same
+            self.animation.signal_trace.columns = None
+            self.animation.signal_trace.update()
+        bar_top, bar_bottom = self.animation.window_bar_levels()
+        if self.signal_limits is None \
+                or bar_bottom < self.signal_limits[0] or bar_top > self.signal_limits[1]:
+            margin = LIMITS_HEADROOM * (bar_top - bar_bottom)
+            self.signal_limits = (bar_bottom - margin, bar_top + margin)
+            self.animation.axes_dict["TOP"].set_ylim(*self.signal_limits)
+            self.needs_background = True
+
+    def _resized(self, event):
+        self.needs_background = True
+
+    def fit_limits(self, spectrum: Tuple[np.ndarray, np.ndarray, np.ndarray]) -> bool:
+        """
+        widen the limits of the spectrum charts so the spectrum fits in them
+        :return: 'True' if the limits changed
+        """
+        power, real, imag = spectrum
+        imag_extreme = max(float(np.max(imag)), -float(np.min(imag)))
+        observed = {
+            'power_max': float(np.max(power)),
+            'real_min': float(np.min(real)), 'real_max': float(np.max(real)),
+            'imag_min': -imag_extreme, 'imag_max': imag_extreme,
+        }
+        real_room = LIMITS_HEADROOM * (observed['real_max'] - observed['real_min'])
+        imag_room = LIMITS_HEADROOM * 2 * imag_extreme
+        wanted = {
+            'power_max': observed['power_max'] + LIMITS_HEADROOM * abs(observed['power_max']),
+            'real_min': observed['real_min'] - real_room,
+            'real_max': observed['real_max'] + real_room,
+            'imag_min': observed['imag_min'] - imag_room,
+            'imag_max': observed['imag_max'] + imag_room,
+        }
+        if self.limits is None:
+            limits = wanted
+        else:
+            # limits only grow, a quieter spectrum is drawn on the wider charts
+            limits = dict(self.limits)
+            for name, value in wanted.items():
+                if name.endswith('_max') and observed[name] > limits[name] \
+                        or name.endswith('_min') and observed[name] < limits[name]:
+                    limits[name] = value
+            if limits == self.limits:
+                return False
+        self.limits = limits
+        axes = self.animation.axes_dict
+        chart_freqs = self.animation.chart_freqs
+        axes["LEFT"].set_xlim(np.min(chart_freqs), np.max(chart_freqs))
+        axes["LEFT"].set_ylim(-11, limits['power_max'])
+        axes["RIGHT"].set_xlim(limits['real_min'], limits['real_max'])
+        axes["RIGHT"].set_ylim(limits['imag_min'], limits['imag_max'])
+        return True
+
+    def step(self) -> Optional[memoryview]:
+        """
+        draw the next frame of the view, with the newest capture if a new one arrived
+        :return: RGBA buffer of the frame, 'None' until the first capture arrives
+        """
+        self.acquisition.check()
+        capture = self.ring.latest(timeout=0.)
+        if capture is not None:
+            self.load_capture(capture)
+        if self.animation is None:
+            return None
+        frame = self.animation.frame_info[self.frame % len(self.animation.frame_info)]
+        self.frame += 1
+        spectrum = self.animation.window_spectrum(frame[1])
+        if self.fit_limits(spectrum) or self.needs_background:
+            self.blitter.capture_background()
+            self.needs_background = False
+        self.animation.move_window(frame)
+        self.animation.move_fft(frame, spectrum)
+        rgba = self.blitter.render()
+        self.display_rate.tick()
+        self._report()
+        return rgba
+
+    def stats(self) -> LiveStats:
+        return LiveStats(
+            self.display_rate.rate(), self.acquisition.capture_rate.rate(),
+            self.acquisition.transfer_rate.rate(), self.ring.sequence, self.ring.dropped,
+            self.acquisition.failures
+        )
+
+    def _report(self):
+        now = time.monotonic()
+        if self.stats_callback is not None and now - self.last_stats >= self.stats_interval:
+            self.last_stats = now
+            self.stats_callback(self.stats())
+
+    def wait_for_capture(self, timeout: Optional[float] = None):
+        """
+        block until the first capture is loaded, the figure exists only from then on
+        :param timeout: in seconds, first_capture_timeout if omitted
+        """
+        timeout = self.first_capture_timeout if timeout is None else timeout
+        capture = self.ring.latest(timeout)
+        if capture is None:
+            self.acquisition.check()
+            raise TimeoutError(f'no capture arrived within {timeout} s')
+        self.load_capture(capture)
+
+    def run(self, duration: float) -> LiveStats:
+        """
+        keep updating the view for the given time without showing it (e.g. on a headless
+        machine, or to measure the rates), frames are paced at the target fps
+        """
+        if self.animation is None:
+            self.wait_for_capture()
+        frame_time = 1. / self.fps
+        started = next_frame = time.monotonic()
+        while time.monotonic() - started < duration:
+            self.step()
+            next_frame += frame_time
+            delay = next_frame - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # fell behind, no point in rushing the frames that were missed
+                next_frame = time.monotonic()
+        return self.stats()
+
+    def show(self):
+        """
+        open the window and keep it updating with a GUI timer until it is closed; the
+        event loop stays responsive, as all the waiting for the link happens in the
+        acquisition thread
+        """
+        from matplotlib import pyplot as plt
+        from .blit_render import agg_canvas
+        if self.animation is None:
+            self.wait_for_capture()
+        figure = self.animation.animation_figure
+        timer = figure.canvas.new_timer(interval=int(1000 / self.fps))
+
+        def update_screen():
+            if self.step() is not None:
+                canvas = agg_canvas(figure)
+                canvas.blit(figure.bbox)
+                canvas.flush_events()
+
+        timer.add_callback(update_screen)
+        timer.start()
+        plt.show()
+        timer.stop()
+
+
+def parse_arguments(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='live rolling FFT of the oscilloscope captures')
+    parser.add_argument('--port', default='COM5', help='serial port of the oscilloscope')
+    parser.add_argument('--baudrate', type=int, default=BAUDRATE_FAST)
+    parser.add_argument(
+        '--simulate', choices=['loopback', 'pty'],
+        help='use the simulated oscilloscope instead of the one on the port')
+    parser.add_argument(
+        '--points', type=int, default=4000, help='record length of the simulated oscilloscope')
+    parser.add_argument('--split-factor', type=int, default=2)
+    parser.add_argument('--sweep-frames', type=int, default=DEFAULT_SWEEP_FRAMES)
+    parser.add_argument('--fps', type=int, default=DEFAULT_DISPLAY_FPS)
+    parser.add_argument('--ring-size', type=int, default=DEFAULT_RING_SIZE)
+    parser.add_argument('--freq-range', choices=['displayed'])
+    parser.add_argument(
+        '--capture-timeout', type=float,
+        help='seconds to wait for the first capture, found from the record length '
+             'and the baud rate if omitted')
+    parser.add_argument(
+        '--duration', type=float,
+        help='run without a window for this many seconds, and print the final rates')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    arguments = parse_arguments(argv)
+    if arguments.duration is not None:
+        use_headless()
+    simulator = None
+    if arguments.simulate == 'pty':
+        from .simulated_instrument import PtyHP54645D, SimulatedHP54645D
+        simulator = PtyHP54645D(
+            SimulatedHP54645D(points=arguments.points), baudrate=arguments.baudrate).start()
+        transport = SerialTransport.open(port=simulator.port, baudrate=arguments.baudrate)
+    elif arguments.simulate == 'loopback':
+        from .simulated_instrument import simulated_transport
+        transport = simulated_transport(arguments.points, baudrate=arguments.baudrate)
+    else:
+        transport = SerialTransport.open(port=arguments.port, baudrate=arguments.baudrate)
+
+    preamble = parse_preamble(transport.query(b':WAVEFORM:PREAMBLE?'))
+    acquisition = AcquisitionThread(transport, CaptureRing(arguments.ring_size))
+    view = LiveFFTView(
+        acquisition, preamble=preamble, split_factor=arguments.split_factor,
+        sweep_frames=arguments.sweep_frames, fps=arguments.fps,
+        freq_range=arguments.freq_range, first_capture_timeout=arguments.capture_timeout
+    )
+    acquisition.start()
+    try:
+        if arguments.duration is not None:
+            print_live_stats(view.run(arguments.duration))
+        else:
+            view.show()
+    finally:
+        acquisition.stop()
+        transport.close()
+        if simulator is not None:
+            simulator.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,3 +1,7 @@
+from typing import NamedTuple, Tuple, Union
+
+import numpy as np
+
 # from HP54645D programming interface manual:
 BAUDRATE_SLOWEST = 1200
 BAUDRATE_SLOW = 2400
@@ -5,9 +9,95 @@ BAUDRATE_REGULAR = 9600
 BAUDRATE_FAST = 19200
 
 
-def process_bytes(waveform_data: bytes):
-    header = waveform_data[:10]
-    data = waveform_data[10:]
-    d = [int(point) for point in data]
-    h = [int(point) for point in header]
-    return h, d
+class WaveformPreamble(NamedTuple):
+    """
+    reply to ':WAVEFORM:PREAMBLE?', in the order the oscilloscope sends the fields
+    """
+    format: int
+    type: int
+    points: int
+    count: int
+    x_increment: float
+    x_origin: float
+    x_reference: float
+    y_increment: float
+    y_origin: float
+    y_reference: float
+
+
+def block_header(data: Union[bytes, bytearray, memoryview]) -> Tuple[int, int]:
+    """
+    read the header of IEEE 488.2 definite-length block: '#', single digit telling how
+    many digits follow, then that many digits with the length of the payload
+    (e.g. '#800004000' is a block of 4000 bytes)
+    :param data: bytes starting with the block header
+    :return: size of the header and size of the payload, both in bytes
+    """
+    if len(data) < 2 or data[0] != ord('#'):
+        raise ValueError('data does not start with a definite-length block header')
+    length_digits = data[1] - ord('0')
+    if not 1 <= length_digits <= 9:
+        # '#0' denotes an indefinite-length block, terminated by newline instead
+        raise ValueError(f'unsupported block header {bytes(data[:2])!r}')
+    header_size = 2 + length_digits
+    if len(data) < header_size:
+        raise ValueError('block header is truncated')
+    length_field = bytes(data[2:header_size])
+    if not length_field.isdigit():
+        raise ValueError(f'malformed block length {length_field!r}')
+    return header_size, int(length_field)
+
+
+def parse_block(data: Union[bytes, bytearray, memoryview]) -> np.ndarray:
+    """
+    extract the payload of a definite-length block without copying it or touching every
+    single sample in Python; anything after the payload (like the newline terminator) is ignored
+    :param data: bytes starting with the block header
+    :return: uint8 array viewing the payload inside of the data
+    """
+    header_size, payload_size = block_header(data)
+    if len(data) - header_size < payload_size:
+        raise ValueError(
+            f'block declares {payload_size} bytes, only {len(data) - header_size} received')
+    return np.frombuffer(data, dtype=np.uint8, count=payload_size, offset=header_size)
+
+
+def parse_preamble(preamble: Union[bytes, str]) -> WaveformPreamble:
+    """
+    convert comma separated reply to ':WAVEFORM:PREAMBLE?' into named fields
+    """
+    if isinstance(preamble, bytes):
+        preamble = preamble.decode('ASCII')
+    values = preamble.strip().split(',')
+    if len(values) != len(WaveformPreamble._fields):
+        raise ValueError(
+            f'expected {len(WaveformPreamble._fields)} preamble fields, got {len(values)}')
+    integer_fields = 4
+    return WaveformPreamble(
+        *[int(float(value)) for value in values[:integer_fields]],
+        *[float(value) for value in values[integer_fields:]]
+    )
+
+
+def scale_waveform(
+    samples: np.ndarray, preamble: WaveformPreamble
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    convert raw samples into seconds and volts with a single vectorized affine step each
+    :param samples: raw waveform samples, as returned by 'parse_block'
+    :param preamble: scaling of the waveform
+    :return: time of each sample in seconds and its value in volts
+    """
+    time = (np.arange(len(samples)) - preamble.x_reference) * preamble.x_increment \
+        + preamble.x_origin
+    volts = (samples - preamble.y_reference) * preamble.y_increment + preamble.y_origin
+    return time, volts
+
+
+def process_bytes(waveform_data: bytes) -> Tuple[bytes, np.ndarray]:
+    """
+    split ':WAVEFORM:DATA?' reply into the block header and the samples
+    :return: header bytes and uint8 array of samples
+    """
+    header_size, _ = block_header(waveform_data)
+    return waveform_data[:header_size], parse_block(waveform_data)
@@ -1,17 +1,37 @@
-from typing import List, Optional, Union, Dict
-from math import sqrt, pow, log
+import hashlib
+import itertools
+import os
+from typing import Iterator, List, Optional, Tuple, Union, Dict, TYPE_CHECKING
+from math import sqrt, pow
 
-import numpy
 import numpy as np
-from matplotlib import pyplot as plt
-from matplotlib import animation
-from matplotlib.animation import FuncAnimation, PillowWriter    # noqa
-from matplotlib.axes import Axes
-from matplotlib.figure import Figure
-from matplotlib.lines import Line2D
-from matplotlib.spines import Spine
 
-from .bin_data_file_2 import bin_data
+from .capture_file import Capture
+from .frame_manifest import FrameManifest
+from .frame_pipeline import DEFAULT_MEMORY_LIMIT, DEFAULT_PREFETCH, stream_spectra
+from .lazy_pyplot import pyplot
+from .oscilloscope_auxiliary import parse_block
+from .render_profiling import NullProfiler, RenderProfiler
+from .spectral_band import SpectralBand
+from .spectral_cache import SpectralCache, cache_key
+from .spectral_engine import (
+    fill_store, fill_store_sliding, frame_offsets, power_db, sliding_pays_off
+)
+from .spectral_store import SpectralFrameStore, StreamingLimits
+from .video_pipe import FFmpegPipeWriter
+
+# matplotlib (and everything drawing with it) is loaded along with the first animation,
+# importing this module only for the spectra or the settings of the frames stays light
+if TYPE_CHECKING:
+    from matplotlib.animation import FuncAnimation
+    from matplotlib.axes import Axes
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    from matplotlib.lines import Line2D
+    from matplotlib.spines import Spine
+
+    from .blit_render import BlitRenderer
+    from .decimation import DecimatedTrace
 
 
 def norm(z: complex):
@@ -39,9 +59,12 @@ def rgb_to_matlab(r, g, b) -> list | tuple:
     return r/255., g/255., b/255.
 
 
+SPECTRUM_METHODS = ('fft', 'sliding', 'auto')
+
+
 # final animation, the animation that displays FFT transform as a function of time itself
 # FFT is performed on data captured in a specific time-window that advances frame-by-frame
-plt.rcParams['font.family'] = 'monospace'
+DEFAULT_FRAMES_DIR = os.path.join('rendered_frames', 'movie1')
 
 
 class FFTAnimation:
@@ -55,10 +78,39 @@ class FFTAnimation:
 
     def __init__(
         self, data_x: Union[list, np.ndarray], data_y: Union[list, np.ndarray], fps: int = 60,
-        total_time: int = 10, split_factor: int = 2, autoscale_limits=False
+        total_time: int = 10, split_factor: int = 2, autoscale_limits=False,
+        spectrum_dtype: np.dtype = np.float32, profiler: Optional[RenderProfiler] = None,
+        spectrum_method: str = 'auto', spectral_cache: Optional[SpectralCache] = None,
+        freq_range: Union[None, str, Tuple[float, float]] = None, zoom: int = 1,
+        headless: bool = False
     ):
+        """
+        :param spectrum_method: 'fft' computes every window from scratch, 'sliding' updates
+            the spectrum of the previous frame by the samples that entered and left the window,
+            'auto' picks the sliding one when windows move by a few samples per frame
+        :param spectral_cache: if given, spectra are reused from it (and saved to it), so
+            rendering the same data with the same window settings again skips the FFT stage
+        :param profiler: collects timings of the rendering stages and reports progress of
+            the frames, nothing is measured if omitted
+        :param freq_range: lowest and highest frequency to compute, store and show on both
+            spectrum charts, 'displayed' for the range the power chart shows by default
+            (the lowest quarter of the two-sided spectrum); whole half-spectrum if omitted
+        :param zoom: how many times denser than the FFT bins the frequency range is sampled,
+            computed with the chirp-z transform
+        :param headless: draw with the non-interactive Agg backend, for batch jobs that only
+            save frames; it takes effect only if pyplot was not loaded before
+        """
         if len(data_x) != len(data_y):
             raise ValueError('size of data lists is mismatched')
+        if spectrum_method not in SPECTRUM_METHODS:
+            raise ValueError(f'spectrum method has to be one of {SPECTRUM_METHODS}')
+        if freq_range is None and zoom != 1:
+            raise ValueError('zoom needs a frequency range')
+        if spectrum_method == 'sliding' and zoom != 1:
+            raise ValueError('sliding spectrum method works only without zoom')
+        plt = pyplot(headless)
+        # set with the first animation instead of on import, it is global for pyplot anyway
+        plt.rcParams['font.family'] = 'monospace'
         self.animation_figure: Figure = plt.figure(
             num=99, constrained_layout=True, figsize=(15., 9.), edgecolor=self.OSCILLOSCOPE_GREEN,
             facecolor=self.OSCILLOSCOPE_NEARBLACK,
@@ -73,12 +125,17 @@ class FFTAnimation:
         self.autoscale_limits = autoscale_limits
         self.animation_figure.suptitle('ANIMATED FFT', color=self.OSCILLOSCOPE_GREEN)
         self.fps = fps
-        self.X = np.array(data_x)
-        self.Y = np.array(data_y)
+        self.total_time = total_time
+        # no copy, so memory-mapped captures stay on the disk until they are needed
+        self.X = np.asarray(data_x)
+        self.Y = np.asarray(data_y)
         self.d_t = self.X[1] - self.X[0]
-        self.fft_data: List[np.ndarray] = []
-        self.frequency_data: List[list] = []
-        self.time_window_data: List[dict] = []
+        self.spectrum_dtype = spectrum_dtype
+        self.spectrum_method = spectrum_method
+        self.spectral_cache = spectral_cache
+        self.spectra: Optional[SpectralFrameStore] = None
+        self.bar_levels: Optional[Tuple[float, float]] = None
+        self.chart_limits: Optional[Dict[str, float]] = None
         self.chart_scales: List[List[float]] = []
         self.time_window_span = int(len(self.X)/self.split_factor)
         self.time_window_step = (len(self.X)-self.time_window_span)/(fps*total_time)
@@ -86,25 +143,69 @@ class FFTAnimation:
             [i, int(i*self.time_window_step)] for i in range(fps*total_time)
         ]
         self.fft_freq_bounds = np.fft.fftfreq(self.time_window_span, d=self.d_t)
+        self.freq_range = freq_range
+        self.zoom = zoom
+        self.band: Optional[SpectralBand] = None
+        if freq_range == 'displayed':
+            self.band = SpectralBand.displayed(self.time_window_span, float(self.d_t), zoom)
+        elif freq_range is not None:
+            self.band = SpectralBand(self.time_window_span, float(self.d_t), freq_range, zoom)
+        if self.band is None:
+            # only the lowest quarter of the two-sided spectrum goes to the power chart
+            freq_limit = int(len(self.fft_freq_bounds)/4)
+            self.chart_freqs = self.fft_freq_bounds[:freq_limit]
+            self.chart_bins = slice(0, freq_limit)
+        else:
+            self.chart_freqs = self.band.frequencies
+            self.chart_bins = slice(None)
         self.anim: Optional[FuncAnimation] = None
         self.axes_dict: Optional[Dict[str, Axes]] = None
         # typehint to Dict has to cover the type of the key (in this case "str")
         # and the type of the item (in this case it is list of lists of Line2D's)
         self.lines: Optional[Dict[str, List[List[Line2D]]]] = {}
         self.interval = int(1000. / self.fps)
+        self.canvas: Optional[FigureCanvasAgg] = None
+        self.blitter: Optional[BlitRenderer] = None
+        self.signal_trace: Optional[DecimatedTrace] = None
+        self.profiler = NullProfiler() if profiler is None else profiler
+
+    @classmethod
+    def from_capture(cls, capture: Capture, scaled: bool = False, **kwargs) -> 'FFTAnimation':
+        """
+        create the animation for the capture loaded with 'open_capture'
+        :param capture: capture to animate
+        :param scaled: use seconds and volts from the preamble instead of raw samples
+        :param kwargs: the rest of FFTAnimation arguments
+        """
+        data_x, data_y = capture.time_and_values(scaled=scaled)
+        return cls(data_x, data_y, **kwargs)
+
+    def window_bar_levels(self) -> Tuple[float, float]:
+        """
+        top and bottom ends of the red bars, a bit over the extremes of the signal;
+        the whole signal is scanned only once, on the first call
+        """
+        if self.bar_levels is None:
+            vert_line_offset = 0.1
+            y_max = float(np.max(self.Y))
+            y_min = float(np.min(self.Y))
+            self.bar_levels = (
+                y_max+vert_line_offset*y_max, y_min-abs(vert_line_offset*y_min)
+            )
+        return self.bar_levels
 
-    def prepare_interval(self, frame: List[int]):
+    def prepare_interval(self, frame: List[int]) -> Optional[dict]:
         """
-        limit data to certain interval and save the points to be
+        limit data to certain interval and find the points to be
         represented as bound on the main chart
         :param frame: set of pointers that is used for each frame to get specific data from
             either X/Y tables or to access other records
+        :return: points of the window bounds, 'None' if the window is out of the data
         """
         # calculate the points of red bars representing time-window that is being
         # processed in the given frame
 
         frame_index, data_index = frame
-        vert_line_offset = 0.1
         x_start_index = data_index
         x_end_index = x_start_index + self.time_window_span
         # print(frame, x_start_index, x_end_index, self.time_window_step, self.time_window_span)
@@ -115,97 +216,173 @@ class FFTAnimation:
             return
 
         # here we take 'plot()'s argument order to zip arguments of 'left' and 'right'
-        # into points that will form window lines
-        interval_on_frame = {
-            'left': [[x_start, x_start],
-                     [max(self.Y)+vert_line_offset*max(self.Y),
-                      min(self.Y)-abs(vert_line_offset*min(self.Y))]],
-            'right': [[x_end, x_end],
-                      [max(self.Y)+vert_line_offset*max(self.Y),
-                       min(self.Y)-abs(vert_line_offset*min(self.Y))]],
+        # into points that will form window lines; bounds are cheap to get, so they are
+        # computed for the frame being drawn instead of being kept for all the frames
+        bar_top, bar_bottom = self.window_bar_levels()
+        return {
+            'left': [[x_start, x_start], [bar_top, bar_bottom]],
+            'right': [[x_end, x_end], [bar_top, bar_bottom]],
             'first': x_start_index,
             'last': x_end_index,
         }
-        self.time_window_data.append(interval_on_frame)
 
-    def calculate_fft(self):
+    def spectrum_bins(self) -> int:
+        """
+        amount of bins computed and stored for every frame
+        """
+        if self.band is None:
+            return SpectralFrameStore.bins_for_span(self.time_window_span)
+        return self.band.bins
+
+    def allocate_spectra(
+        self, directory: Optional[str] = None, frame_rows: Optional[np.ndarray] = None
+    ):
+        """
+        reserve the frame store big enough to hold spectra of all the frames of animation
+        :param directory: place for memory-mapped store files, store is kept in RAM if omitted
+        :param frame_rows: row of the store for each frame, when frames share the windows
+        """
+        self.spectra = SpectralFrameStore(
+            len(self.frame_info), self.spectrum_bins(),
+            dtype=self.spectrum_dtype, directory=directory, frame_rows=frame_rows
+        )
+
+    def spectra_parameters(self) -> dict:
+        """
+        everything besides the waveform itself that decides the content of the spectra
+        """
+        return {
+            'fps': self.fps,
+            'total_time': self.total_time,
+            'split_factor': self.split_factor,
+            'span': self.time_window_span,
+            'offsets': hashlib.sha256(frame_offsets(self.frame_info).tobytes()).hexdigest(),
+            'bins': self.spectrum_bins(),
+            'band': None if self.band is None else self.band.parameters(),
+            'dtype': np.dtype(self.spectrum_dtype).str,
+        }
+
+    def compute_spectra(self, offsets: np.ndarray, store=None):
+        """
+        fill the store with the spectra of the windows starting at offsets,
+        one for each row of the store
+        :param store: SpectralFrameStore (or anything with the same 'write', 'flush' and
+            'bins'), the allocated 'spectra' if omitted
+        """
+        store = self.spectra if store is None else store
+        with self.profiler.stage('fft'):
+            if self.spectrum_method == 'sliding' or (
+                    self.spectrum_method == 'auto' and sliding_pays_off(offsets)
+                    and (self.band is None or self.band.on_grid)):
+                fill_store_sliding(store, self.Y, offsets, self.time_window_span, band=self.band)
+            else:
+                fill_store(store, self.Y, offsets, self.time_window_span, band=self.band)
+            store.flush()
+        self.profiler.count('fft_windows', len(offsets))
+
+    def spectral_limits(self) -> Dict[str, float]:
+        """
+        global minima and maxima of the spectra of all frames, unless they were already set
+        in 'chart_limits'; without precalculated spectra of every frame they are found with
+        a streaming pass over all the windows, which keeps nothing but the running extremes
+        """
+        if self.chart_limits is not None:
+            return self.chart_limits
+        if self.spectra is not None and self.spectra.complete:
+            return self.spectra.limits()
+        limits = StreamingLimits(self.spectrum_bins(), self.spectrum_dtype)
+        with self.profiler.stage('limits_pass'):
+            self.compute_spectra(np.unique(frame_offsets(self.frame_info)), store=limits)
+        self.chart_limits = limits.limits()
+        return self.chart_limits
+
+    def window_spectrum(self, data_index: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        spectrum of a single window computed on the spot, without the frame store
+        :param data_index: first sample of the window
+        :return: power in dB, real part and imaginary part of the spectrum
+        """
+        window = self.Y[np.newaxis, data_index:data_index + self.time_window_span]
+        if self.band is None:
+            f_out = np.fft.rfft(window, self.time_window_span, axis=1)[0]
+        else:
+            f_out = self.band.transform(window)[0]
+        return power_db(f_out), f_out.real, f_out.imag
+
+    def calculate_fft(self, frame: List[int]):
         """
         calculate fft component, and it's freq representation to be displayed on one of the charts
         do it for single frame of animation
+        :param frame: set of pointers that is used for each frame to get specific data from
+            either X/Y tables or to access other records
         """
-        # as we step through the time, we create the sample in the previous function,
-        # thus we can always take the last appended element from time_window_data as current frame
-        frame_interval = self.time_window_data[-1]
-        waveform_ = self.Y[frame_interval['first']:frame_interval['last']]
-        f_out: Union[np.ndarray, List[complex]] = numpy.fft.fft(waveform_, len(waveform_))
-        normalized = [log(norm(z), 10)*10 for z in f_out]
-        self.frequency_data.append(normalized)
-        real = [z.real for z in f_out]
-        imag = [z.imag for z in f_out]
-        self.fft_data.append(np.array([real, imag]))
+        frame_index, data_index = frame
+        if self.spectra is None:
+            self.allocate_spectra()
+        with self.profiler.stage('fft', frame_index):
+            fill_store(
+                self.spectra, self.Y, [data_index], self.time_window_span,
+                first_frame=self.spectra.row(frame_index), band=self.band
+            )
+        self.profiler.count('fft_windows')
 
-    def move_window(self, frame: List[int]):
+    def move_window(self, frame: List[int], interval: Optional[dict] = None):
         """
         set new red bars to depict new frame of interest
         :param frame: set of pointers that is used for each frame to get specific data from
             either X/Y tables or to access other records
+        :param interval: bounds of the window from 'prepare_interval', found if omitted
         """
         # print(self.lines["TOP"][1][0])
         # raise
-        frame_index, data_index = frame
-        self.lines["TOP"][1][0].set_data(
-            self.time_window_data[frame_index]["left"][0],
-            self.time_window_data[frame_index]["left"][1])
-        self.lines["TOP"][2][0].set_data(
-            self.time_window_data[frame_index]["right"][0],
-            self.time_window_data[frame_index]["right"][1])
+        if interval is None:
+            interval = self.prepare_interval(frame)
+        if interval is None:
+            return
+        self.lines["TOP"][1][0].set_data(interval["left"][0], interval["left"][1])
+        self.lines["TOP"][2][0].set_data(interval["right"][0], interval["right"][1])
 
-    def move_fft(self, frame_):
+    def move_fft(
+        self, frame_, spectrum: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+    ):
         """
         move points in FFT scatter-plot and rescale charts to properly show data
+        :param spectrum: power, real and imaginary part of the frame, taken from the
+            precalculated spectra if omitted
         """
         frame_index, data_index = frame_
         x_margin = 0.05
         y_margin = 0.1
-        freq_limit = int(len(self.fft_freq_bounds)/4)
-        # if frame_index % 30 == 0:
-        #     print(len(self.frequency_data[frame_index]), len(self.fft_freq_bounds))
-        #     print(self.frequency_data[frame_index][:freq_limit])
-        #     print(self.fft_freq_bounds[:freq_limit])
-        try:
-            self.lines["LEFT"][0][0].set_data(
-                self.fft_freq_bounds[:freq_limit],
-                self.frequency_data[frame_index][:freq_limit],
-            )
-            self.lines["RIGHT"][0][0].set_data(
-                self.fft_data[frame_index][0], self.fft_data[frame_index][1]
-            )
-        except IndexError:
-            print(len(self.frame_info), frame_index)
-            return
+        if spectrum is None:
+            try:
+                spectrum = self.spectra.frame(frame_index)
+            except IndexError:
+                print(len(self.frame_info), frame_index)
+                return
+        power, real, imag = spectrum
+        self.lines["LEFT"][0][0].set_data(self.chart_freqs, power[self.chart_bins])
+        self.lines["RIGHT"][0][0].set_data(real, imag)
+        # only the half of the spectrum is stored, the other half is its complex conjugate
+        self.lines["RIGHT"][1][0].set_data(real, -imag)
 
         if self.autoscale_limits:
             # set new limits for frequency viewer
             self.axes_dict["LEFT"].set_xlim(
-                min(self.fft_freq_bounds[:freq_limit])-abs(
-                    x_margin*min(self.fft_freq_bounds[:freq_limit])),
-                max(self.fft_freq_bounds[:freq_limit])+abs(
-                    x_margin*max(self.fft_freq_bounds[:freq_limit]))
+                np.min(self.chart_freqs)-abs(x_margin*np.min(self.chart_freqs)),
+                np.max(self.chart_freqs)+abs(x_margin*np.max(self.chart_freqs))
             )
             self.axes_dict["LEFT"].set_ylim(
-                min(self.frequency_data[frame_index])-abs(
-                    y_margin*min(self.frequency_data[frame_index])),  # bot
-                max(self.frequency_data[frame_index])+abs(
-                    y_margin*max(self.frequency_data[frame_index]))  # top
+                np.min(power)-abs(y_margin*np.min(power)),  # bot
+                np.max(power)+abs(y_margin*np.max(power))  # top
             )
 
-            # set new limits for raw fft viewer
+            # set new limits for raw fft viewer, imaginary part is mirrored
+            imag_min = min(np.min(imag), -np.max(imag))
+            imag_max = max(np.max(imag), -np.min(imag))
             self.axes_dict["RIGHT"].set_xlim(
-                min(self.fft_data[frame_index][0])-abs(x_margin*min(self.fft_data[frame_index][0])),
-                max(self.fft_data[frame_index][0])+abs(x_margin*max(self.fft_data[frame_index][0])))
+                np.min(real)-abs(x_margin*np.min(real)), np.max(real)+abs(x_margin*np.max(real)))
             self.axes_dict["RIGHT"].set_ylim(
-                min(self.fft_data[frame_index][1])-abs(y_margin*min(self.fft_data[frame_index][1])),
-                max(self.fft_data[frame_index][1])+abs(y_margin*max(self.fft_data[frame_index][1])))
+                imag_min-abs(y_margin*imag_min), imag_max+abs(y_margin*imag_max))
 
     def prescale_charts(self):
         """
@@ -213,29 +390,25 @@ class FFTAnimation:
         presented in the figure throughout the animation, and set them in stone for the
         entire rendering process
         """
-        freq_limit = int(len(self.fft_freq_bounds)/4)
         reference_level = -11
         # now in dB, a bit lower than 10 to move it away from '0.00' from 'frequency' axis
 
         # find maxima and minima
-        time_min = min(self.X)
-        time_max = max(self.X)
+        time_min = float(np.min(self.X))
+        time_max = float(np.max(self.X))
         time_min = time_min - abs(0.02*(time_max-time_min))
         time_max = time_max + abs(0.02*(time_max-time_min))
-        fft_min_re = min([np.min(fft_frame_data[0]) for fft_frame_data in self.fft_data])
-        fft_min_im = min([np.min(fft_frame_data[1]) for fft_frame_data in self.fft_data])
-        fft_max_re = max([np.max(fft_frame_data[0]) for fft_frame_data in self.fft_data])
-        fft_max_im = max([np.max(fft_frame_data[1]) for fft_frame_data in self.fft_data])
-        freq_max = max([np.max(freq_data) for freq_data in self.frequency_data])
-        freq_min = min([np.min(freq_data) for freq_data in self.frequency_data])
+        limits = self.spectral_limits()
+        fft_min_re = limits['real_min']
+        fft_min_im = limits['imag_min']
+        fft_max_re = limits['real_max']
+        fft_max_im = limits['imag_max']
+        freq_max = limits['power_max']
 
         # set subplot's minima and maxima, first for signal in time domain,
         # then in freq. viewer, and finally for IM/RE fft chart
         self.axes_dict["TOP"].set_xlim(time_min, time_max)
-        self.axes_dict["LEFT"].set_xlim(
-            min(self.fft_freq_bounds[:freq_limit]),
-            max(self.fft_freq_bounds[:freq_limit])
-        )
+        self.axes_dict["LEFT"].set_xlim(np.min(self.chart_freqs), np.max(self.chart_freqs))
         self.axes_dict["LEFT"].set_ylim(reference_level, freq_max)
         self.axes_dict["RIGHT"].set_xlim(fft_min_re, fft_max_re)
         self.axes_dict["RIGHT"].set_ylim(fft_min_im, fft_max_im)
@@ -258,7 +431,7 @@ class FFTAnimation:
         # plt.rc('axes', edgecolor=self.OSCILLOSCOPE_DIM)
 
         self.animation_figure.suptitle('ANIMATED FFT', color=self.OSCILLOSCOPE_GREEN)
-        self.prepare_interval([0, 0])
+        first_interval = self.prepare_interval([0, 0])
         self.axes_dict = self.animation_figure.subplot_mosaic(
             mosaic, subplot_kw={'facecolor': self.OSCILLOSCOPE_NEARBLACK},
             gridspec_kw={'wspace': 0.16, 'hspace': 0.245,}
@@ -289,14 +462,17 @@ class FFTAnimation:
         # top with signal + moving window
         # print(self.axes_dict["TOP"].get_position())
         self.lines["TOP"] = []
-        self.lines["TOP"].append(self.axes_dict["TOP"].plot(  # the main plot
-            self.X, self.Y, color=rgb_to_matlab(100, 255, 200)))
+        # the main plot, reduced to what can be seen at the pixel resolution of the figure
+        from .decimation import DecimatedTrace
+        self.signal_trace = DecimatedTrace(
+            self.axes_dict["TOP"], self.X, self.Y, color=rgb_to_matlab(100, 255, 200))
+        self.lines["TOP"].append([self.signal_trace.line])
         self.lines["TOP"].append(self.axes_dict["TOP"].plot(  # left line of the time window
-            self.time_window_data[-1]["left"][0], self.time_window_data[-1]["left"][1],
+            first_interval["left"][0], first_interval["left"][1],
             color=self.WINDOW_RED, marker='None',
         ))
         self.lines["TOP"].append(self.axes_dict["TOP"].plot(  # right line of the time window
-            self.time_window_data[-1]["right"][0], self.time_window_data[-1]["right"][1],
+            first_interval["right"][0], first_interval["right"][1],
             color=self.WINDOW_RED, marker="None",
         ))
         self.axes_dict["TOP"].set_xlabel("time [s]", color=self.OSCILLOSCOPE_GREEN)
@@ -314,78 +490,379 @@ class FFTAnimation:
         self.lines["RIGHT"].append(self.axes_dict["RIGHT"].plot(
             [1, 2, 3], [1, 2, 3], color=self.OSCILLOSCOPE_GREEN,
             linestyle='', marker='o', markersize=3))
+        self.lines["RIGHT"].append(self.axes_dict["RIGHT"].plot(  # conjugate half of the spectrum
+            [1, 2, 3], [1, 2, 3], color=self.OSCILLOSCOPE_GREEN,
+            linestyle='', marker='o', markersize=3))
         self.axes_dict["RIGHT"].set_xlabel("RE", color=self.OSCILLOSCOPE_GREEN)
         self.axes_dict["RIGHT"].set_ylabel("IM", color=self.OSCILLOSCOPE_GREEN)
         # print(self.lines)
         if not self.autoscale_limits and not dry_run:
             self.prescale_charts()
-        self.time_window_data.pop()
 
-    def pre_calculate_frames(self):
+    def pre_calculate_frames(
+        self, spectra_directory: Optional[str] = None, frames: Optional[List[List[int]]] = None
+    ):
         """
         calculate all the data needed for each frame to render, separate for each chart
         to be drawn in the canvas, if there are more than one.
+        :param spectra_directory: if given, spectra are written into memory-mapped files there
+            (unless the spectral cache is used, then they are kept in the cache)
+        :param frames: frames that are going to be rendered, all of them if omitted; spectra
+            of the other frames are not computed (nor saved to the spectral cache)
         """
-        for frame_data in self.frame_info:
-            self.prepare_interval(frame_data)
-            self.calculate_fft()
+        partial = frames is not None and len(frames) < len(self.frame_info)
+        # frames with the same window (slow animations of short captures) share a single row,
+        # then all the distinct windows go through the batched FFT at once, instead of
+        # 'calculate_fft' being called for every single frame
+        if partial:
+            frame_indices = np.array([frame_data[0] for frame_data in frames], dtype=np.intp)
+            offsets, rows = np.unique(
+                frame_offsets(self.frame_info)[frame_indices], return_inverse=True)
+            frame_rows = np.full(len(self.frame_info), -1, dtype=np.intp)
+            frame_rows[frame_indices] = rows
+        else:
+            offsets, frame_rows = np.unique(frame_offsets(self.frame_info), return_inverse=True)
+            frame_rows = None if len(offsets) == len(self.frame_info) else frame_rows
+        if self.spectral_cache is None:
+            self.allocate_spectra(spectra_directory, frame_rows)
+            self.compute_spectra(offsets)
+            return
 
-    def init_animation(self):
+        parameters = self.spectra_parameters()
+        with self.profiler.stage('cache_lookup'):
+            key = cache_key(self.Y, parameters)
+            self.spectra = self.spectral_cache.lookup(key)
+        if self.spectra is not None:
+            self.profiler.count('cache_hits')
+            return
+        if partial:
+            # the cache keeps spectra of whole animations only
+            self.allocate_spectra(spectra_directory, frame_rows)
+            self.compute_spectra(offsets)
+            return
+        self.spectra = self.spectral_cache.create(
+            len(self.frame_info), self.spectrum_bins(),
+            dtype=self.spectrum_dtype, frame_rows=frame_rows
+        )
+        staging_dir = self.spectra.directory
+        try:
+            self.compute_spectra(offsets)
+        except BaseException:
+            self.spectra = None
+            self.spectral_cache.discard(staging_dir)
+            raise
+        # memory maps are released before the cache moves their files
+        self.spectra = None
+        self.spectra = self.spectral_cache.commit(key, staging_dir, parameters)
+
+    def init_animation(self) -> List['Line2D']:
         """
         set the initial frame of the animation
         """
-        self.prepare_interval([0, 0])
         self.move_window([0, 0])
         self.move_fft([0, 0])
+        return self.dynamic_artists()
 
-    def animate(self, frame: List[int]):
+    def animate(self, frame: List[int]) -> List['Line2D']:
         """
         animate charts by replacing the data each frame with precomputed values
         """
-        self.prepare_interval(frame)
         self.move_window(frame)
         self.move_fft(frame)
+        self.profiler.frame_done()
+        return self.dynamic_artists()
+
+    def dynamic_artists(self) -> List['Line2D']:
+        """
+        artists that change from frame to frame, the rest of the figure stays the same
+        throughout the animation (as long as limits are not autoscaled)
+        """
+        return [
+            self.lines["TOP"][1][0], self.lines["TOP"][2][0],  # time window
+            self.lines["LEFT"][0][0],
+            self.lines["RIGHT"][0][0], self.lines["RIGHT"][1][0],
+        ]
+
+    def draw_frame(
+        self, frame: List[int], spectrum: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+    ):
+        """
+        update all the changing artists of the figure to the state of the given frame
+        :param frame: set of pointers that is used for each frame to get specific data from
+            either X/Y tables or to access other records
+        :param spectrum: spectrum of the frame, taken from the precalculated spectra if omitted
+        """
+        frame_index = frame[0]
+        with self.profiler.stage('prepare_interval', frame_index):
+            interval = self.prepare_interval(frame)
+        with self.profiler.stage('move_window', frame_index):
+            self.move_window(frame, interval)
+        with self.profiler.stage('move_fft', frame_index):
+            self.move_fft(frame, spectrum)
+
+    def start_rendering(self, dpi: int = 200) -> Tuple[int, int]:
+        """
+        prepare the canvas for drawing frames at given resolution, has to be called after
+        'prepare_charts'. Unless limits are autoscaled every frame, static part of the figure
+        (signal trace, axes, titles) is rasterised only once here, and frames only redraw
+        the artists that change
+        :param dpi: resolution of the frames
+        :return: width and height of a frame in pixels
+        """
+        from .blit_render import BlitRenderer, agg_canvas
+        self.animation_figure.set_dpi(dpi)
+        self.canvas = agg_canvas(self.animation_figure)
+        # layout of the axes settles on the first draw, and the envelope of
+        # the decimated signal trace depends on the final width of the axes
+        self.canvas.draw()
+        self.signal_trace.update()
+        if self.autoscale_limits:
+            self.blitter = None
+        else:
+            self.blitter = BlitRenderer(self.animation_figure, self.dynamic_artists())
+            self.blitter.capture_background()
+        return self.canvas.get_width_height(physical=True)
+
+    def render_frame(
+        self, frame: List[int], spectrum: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+    ) -> memoryview:
+        """
+        draw single frame of animation on the canvas prepared by 'start_rendering'
+        :param frame: set of pointers that is used for each frame to get specific data from
+            either X/Y tables or to access other records
+        :param spectrum: spectrum of the frame, taken from the precalculated spectra if omitted
+        :return: RGBA buffer of the canvas, valid until the next frame is rendered
+        """
+        self.draw_frame(frame, spectrum)
+        with self.profiler.stage('draw', frame[0]):
+            if self.blitter is not None:
+                return self.blitter.render()
+            self.canvas.draw()
+            return self.canvas.buffer_rgba()
+
+    @staticmethod
+    def frame_path(frame_index: int, output_dir: str) -> str:
+        return os.path.join(output_dir, f'FFT_frame_{frame_index}.png')
+
+    def write_frame_image(self, rgba: memoryview, frame_index: int, output_dir: str) -> str:
+        """
+        save the rendered RGBA buffer of a frame as an image file
+        :return: path of the saved file
+        """
+        path = self.frame_path(frame_index, output_dir)
+        # format='png'<- format is dictated by
+        # the extension passed in the filename
+        with self.profiler.stage('savefig', frame_index):
+            pyplot().imsave(fname=path, arr=np.asarray(rgba), dpi=self.animation_figure.dpi)
+        return path
+
+    def save_frame(self, frame: List[int], output_dir: str) -> str:
+        """
+        render single frame of animation and save it as an image file
+        :param frame: set of pointers that is used for each frame to get specific data from
+            either X/Y tables or to access other records
+        :param output_dir: directory for the frame files
+        :return: path of the saved file
+        """
+        return self.write_frame_image(self.render_frame(frame), frame[0], output_dir)
+
+    def select_frames(self, frame_range: Optional[Tuple[int, int]] = None) -> List[List[int]]:
+        """
+        frame pointers of the part of animation
+        :param frame_range: first frame and the one after the last, like in 'range';
+            the whole animation if omitted
+        """
+        if frame_range is None:
+            return self.frame_info
+        start, stop = frame_range
+        return self.frame_info[start:stop]
 
-    def generate_frame_images(self):
+    def render_signature(self, dpi: int) -> str:
+        """
+        hash of the data and of every setting that decides how the rendered frames look,
+        frames rendered with the same signature can be reused
+        """
+        return cache_key(self.Y, {
+            **self.spectra_parameters(),
+            'x': hashlib.sha256(np.ascontiguousarray(self.X).data).hexdigest(),
+            'dpi': dpi,
+            'autoscale_limits': self.autoscale_limits,
+        })
+
+    def rendered_frames(
+        self, dpi: int = 200, lazy: bool = False, memory_limit: int = DEFAULT_MEMORY_LIMIT,
+        prefetch: int = DEFAULT_PREFETCH, frames: Optional[List[List[int]]] = None
+    ) -> Iterator[Tuple[List[int], memoryview]]:
+        """
+        prepare the figure and draw the frames of animation one after another
+        :param dpi: resolution of the frames
+        :param lazy: instead of calculating the spectra of all frames up front, compute them
+            in small batches just before they are drawn, so memory does not grow with the
+            amount of frames (limits of the charts come from an extra pass over the spectra)
+        :param memory_limit: memory for the spectra waiting to be drawn in the lazy mode
+        :param prefetch: amount of batches of spectra computed ahead in the lazy mode
+        :param frames: frames to draw, all of them if omitted; only their spectra are
+            computed, limits of the charts still cover the whole animation
+        :return: frame pointers and RGBA buffer of the frame, valid until the next one
+        """
+        frames = self.frame_info if frames is None else frames
+        if lazy:
+            self.spectra = None
+        else:
+            self.pre_calculate_frames(frames=frames)
+        self.prepare_charts()
+        self.start_rendering(dpi)
+        if lazy:
+            spectra = stream_spectra(self, frames, memory_limit, prefetch)
+        else:
+            spectra = ((frame_data, None) for frame_data in frames)
+        self.profiler.start(len(frames))
+        for frame_data, spectrum in spectra:
+            yield frame_data, self.render_frame(frame_data, spectrum)
+            self.profiler.frame_done()
+        self.profiler.finish()
+
+    def generate_frame_images(
+        self, output_dir: str = DEFAULT_FRAMES_DIR, dpi: int = 200, workers: int = 1,
+        lazy: bool = False, memory_limit: int = DEFAULT_MEMORY_LIMIT,
+        frame_range: Optional[Tuple[int, int]] = None, resume: bool = True
+    ):
         """
         generate images that can be assembled into mp4 file with an external program like the
         ffmpeg library
+        :param output_dir: directory for the frame files, created if missing
+        :param dpi: resolution of the saved images
+        :param workers: amount of processes rendering the frames, 'None' uses all the cores
+        :param lazy: compute spectra just in time, with memory bounded by memory_limit
+            (see 'rendered_frames'), single process only
+        :param memory_limit: memory for the spectra waiting to be drawn in the lazy mode
+        :param frame_range: first frame and the one after the last to render, e.g. to split
+            the animation between machines; the whole animation if omitted
+        :param resume: skip frames recorded in the manifest of output_dir whose files are still
+            intact, and take limits of the charts from there; all frames are drawn anew if
+            disabled. The manifest is kept up to date in both cases
         """
-        self.pre_calculate_frames()
-        self.prepare_charts()
-        for frame_data in self.frame_info:
-            self.prepare_interval(frame_data)
-            self.move_window(frame_data)
-            self.move_fft(frame_data)
-            # format='png'<- format is dictated by
-            # the extension passed in the filename
-            plt.savefig(fname=f'rendered_frames/movie1/FFT_frame_{frame_data[0]}.png', dpi=200)
+        if (workers is None or workers > 1) and lazy:
+            raise ValueError('lazy pipeline renders frames in a single process')
+        os.makedirs(output_dir, exist_ok=True)
+        manifest = FrameManifest(output_dir, self.render_signature(dpi))
+        if resume:
+            with self.profiler.stage('verify_frames'):
+                frames = [
+                    frame_data for frame_data in self.select_frames(frame_range)
+                    if not manifest.is_done(frame_data[0])
+                ]
+            if manifest.chart_limits is not None and not self.autoscale_limits:
+                self.chart_limits = manifest.chart_limits
+        else:
+            frames = self.select_frames(frame_range)
+        if not frames:
+            return
+        try:
+            if workers is None or workers > 1:
+                from .parallel_render import render_frames_parallel
+                render_frames_parallel(
+                    self, output_dir=output_dir, dpi=dpi, workers=workers, frames=frames,
+                    manifest=manifest
+                )
+                return
+            for frame_data, rgba in self.rendered_frames(
+                    dpi, lazy=lazy, memory_limit=memory_limit, frames=frames):
+                path = self.write_frame_image(rgba, frame_data[0], output_dir)
+                manifest.record(frame_data[0], path)
+                if manifest.chart_limits is None and not self.autoscale_limits:
+                    # found by now, while the charts were prepared
+                    manifest.chart_limits = self.spectral_limits()
+        finally:
+            manifest.save()
+
+    def render_video(
+        self, filename: str = 'FFT_v1_0.mp4', dpi: int = 200, queue_size: int = 8,
+        ffmpeg_path: Optional[str] = None, fallback_dir: str = DEFAULT_FRAMES_DIR,
+        lazy: bool = False, memory_limit: int = DEFAULT_MEMORY_LIMIT
+    ):
+        """
+        render the frames straight into an ffmpeg process as raw video, skipping PNG files
+        entirely; falls back to 'generate_frame_images' when ffmpeg is not available
+        :param filename: output movie file
+        :param dpi: resolution of the frames
+        :param queue_size: amount of drawn frames that may wait for the encoder
+        :param ffmpeg_path: ffmpeg executable, looked up in PATH if omitted
+        :param fallback_dir: directory for PNG frames, if they have to be used instead
+        :param lazy: compute spectra just in time, with memory bounded by memory_limit
+            (see 'rendered_frames')
+        :param memory_limit: memory for the spectra waiting to be drawn in the lazy mode
+        """
+        if ffmpeg_path is None and not FFmpegPipeWriter.available():
+            print('ffmpeg not found, saving PNG frames to', fallback_dir)
+            self.generate_frame_images(
+                output_dir=fallback_dir, dpi=dpi, lazy=lazy, memory_limit=memory_limit)
+            return
+        frames = self.rendered_frames(dpi, lazy=lazy, memory_limit=memory_limit)
+        # the encoder needs the size of the canvas, which is set up along with the first frame
+        first_frame = next(frames)
+        width, height = self.canvas.get_width_height(physical=True)
+        with FFmpegPipeWriter(
+            filename, width, height, self.fps, queue_size=queue_size, ffmpeg_path=ffmpeg_path
+        ) as writer:
+            for frame_data, rgba in itertools.chain([first_frame], frames):
+                # no copy here, the writer takes care of the buffer being reused;
+                # waits only if the encoder falls behind the drawing
+                with self.profiler.stage('encode', frame_data[0]):
+                    writer.write_frame(rgba)
+
+    def render_animated_image(
+        self, filename: str = 'FFT_v1_0.gif', dpi: int = 100, lazy: bool = False,
+        memory_limit: int = DEFAULT_MEMORY_LIMIT
+    ):
+        """
+        render the frames with blitting straight into an animated GIF (or APNG, for '.png'
+        files); much faster than 'create_animation', which redraws the whole figure every frame
+        :param filename: output file, format is dictated by the extension
+        :param dpi: resolution of the frames
+        :param lazy: compute spectra just in time, with memory bounded by memory_limit
+            (see 'rendered_frames')
+        :param memory_limit: memory for the spectra waiting to be drawn in the lazy mode
+        """
+        from .animated_image import AnimatedImageWriter
+        writer = AnimatedImageWriter(fps=self.fps)
+        with writer.saving(self.animation_figure, filename, dpi):
+            for frame_data, rgba in self.rendered_frames(
+                    dpi, lazy=lazy, memory_limit=memory_limit):
+                # the writer copies the buffer, and waits only if the encoding falls behind
+                with self.profiler.stage('encode', frame_data[0]):
+                    writer.write_frame(rgba)
 
     def create_animation(self):
         """
         create the animation object used to show figures and used to save animation to the file
         """
+        from matplotlib.animation import FuncAnimation
+        from .animated_image import AnimatedImageWriter
         self.pre_calculate_frames()
         self.prepare_charts()
-        self.anim: FuncAnimation = animation.FuncAnimation(
+        self.anim: FuncAnimation = FuncAnimation(
             fig=self.animation_figure, func=self.animate,
             frames=self.frame_info[1:], init_func=self.init_animation,  # noqa
-            interval=self.interval, repeat_delay=1000
+            interval=self.interval, repeat_delay=1000, blit=not self.autoscale_limits
         )
-        movie_writer = PillowWriter(fps=60)
+        self.profiler.start(len(self.frame_info) - 1)
+        movie_writer = AnimatedImageWriter(fps=60)
         self.anim.save('FFT_v1_0.gif', dpi=100, writer=movie_writer)  # noqa
+        self.profiler.finish()
 
 
 if __name__ == '__main__':
-    pseudo_pointlist: bytearray = bytearray([int(b) for b in bin_data])
-    pseudo_pointlist = pseudo_pointlist[10:-1]
-
-    waveform = numpy.array([float(b) for b in pseudo_pointlist])
-    x = numpy.array(list([float(i) for i in range(len(pseudo_pointlist))]))
+    # sample capture is big, it is loaded only when this module is run as a script
+    from .bin_data_file_2 import bin_data
+    samples = parse_block(bin_data)
+    waveform = samples.astype(np.float64)
+    x = np.arange(len(samples), dtype=np.float64)
 
     # sophisticated fft animation
-    fft_anim = FFTAnimation(x, waveform, fps=120)
+    fft_anim = FFTAnimation(x, waveform, fps=120, profiler=RenderProfiler())
     fft_anim.prepare_charts(dry_run=True)
     fft_anim.generate_frame_images()
+    fft_anim.profiler.print_summary()
     # fft_anim.create_animation()
     # plt.show()
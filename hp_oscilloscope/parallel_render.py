@@ -0,0 +1,126 @@
+import multiprocessing
+import os
+import tempfile
+from typing import List, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np
+
+from .frame_manifest import FrameManifest
+from .spectral_store import SpectralFrameStore
+
+if TYPE_CHECKING:
+    from .oscilloscope_fft_processing import FFTAnimation
+
+
+# each worker gets several smaller shards instead of one big one,
+# so the processes that finish early can pick up the remaining work
+SHARDS_PER_WORKER = 4
+
+# animation object built once per worker process by '_init_worker'
+_worker_animation: Optional['FFTAnimation'] = None
+_worker_job: Optional[dict] = None
+
+
+def _init_worker(job: dict):
+    """
+    build worker's own figure and attach it to the spectra shared through memory-mapped files
+    """
+    global _worker_animation, _worker_job
+    from .oscilloscope_fft_processing import FFTAnimation
+
+    _worker_job = job
+    _worker_animation = FFTAnimation(
+        np.load(job['x_path'], mmap_mode='r'), np.load(job['y_path'], mmap_mode='r'),
+        fps=job['fps'], total_time=job['total_time'], split_factor=job['split_factor'],
+        autoscale_limits=job['autoscale_limits'], spectrum_dtype=job['spectrum_dtype'],
+        freq_range=job['freq_range'], zoom=job['zoom'],
+        # workers never show anything
+        headless=True,
+    )
+    _worker_animation.spectra = SpectralFrameStore.open(job['spectra_directory'])
+    # found once by the parent, the store may hold spectra of only some of the frames
+    _worker_animation.chart_limits = job['chart_limits']
+    _worker_animation.prepare_charts()
+    _worker_animation.start_rendering(job['dpi'])
+
+
+def _render_shard(frames: List[List[int]]) -> List[Tuple[int, str]]:
+    """
+    save every frame of the shard, return indices and paths of the saved frames
+    """
+    return [
+        (frame_data[0], _worker_animation.save_frame(frame_data, _worker_job['output_dir']))
+        for frame_data in frames
+    ]
+
+
+def render_frames_parallel(
+    animation: 'FFTAnimation', output_dir: str, dpi: int = 200, workers: Optional[int] = None,
+    spectra_directory: Optional[str] = None, frames: Optional[List[List[int]]] = None,
+    manifest: Optional[FrameManifest] = None
+):
+    """
+    compute spectra once in the current process, then split the frames into shards and render
+    them with a pool of processes, each one with its own figure. Spectra are handed over
+    as memory-mapped files, so nothing big is pickled between the processes
+    :param animation: FFTAnimation instance with the data to be rendered
+    :param output_dir: directory for the 'FFT_frame_{i}.png' files
+    :param dpi: resolution of the saved images
+    :param workers: amount of processes, 'None' uses all the cores
+    :param spectra_directory: directory to keep the spectra in, temporary one is used if omitted
+        (and spectra are released from 'animation' after rendering)
+    :param frames: frames to render, all the frames of animation if omitted
+    :param manifest: if given, every saved frame is recorded in it, along with chart limits
+    """
+    frames = animation.frame_info if frames is None else frames
+    if workers is None:
+        workers = os.cpu_count() or 1
+    keep_spectra = spectra_directory is not None
+    shared_directory = spectra_directory or tempfile.mkdtemp(prefix='fft_frames_')
+    try:
+        job = {
+            'x_path': os.path.join(shared_directory, 'x.npy'),
+            'y_path': os.path.join(shared_directory, 'y.npy'),
+            'spectra_directory': shared_directory,
+            'fps': animation.fps,
+            'total_time': animation.total_time,
+            'split_factor': animation.split_factor,
+            'autoscale_limits': animation.autoscale_limits,
+            'spectrum_dtype': animation.spectrum_dtype,
+            'freq_range': animation.freq_range,
+            'zoom': animation.zoom,
+            'output_dir': output_dir,
+            'dpi': dpi,
+        }
+        np.save(job['x_path'], animation.X)
+        np.save(job['y_path'], animation.Y)
+        animation.pre_calculate_frames(spectra_directory=shared_directory, frames=frames)
+        # spectra found in the spectral cache are opened right from there
+        job['spectra_directory'] = animation.spectra.directory
+        job['chart_limits'] = None if animation.autoscale_limits else animation.spectral_limits()
+        if manifest is not None and manifest.chart_limits is None:
+            manifest.chart_limits = job['chart_limits']
+
+        shards = [
+            shard.tolist() for shard in np.array_split(
+                np.array(frames), workers * SHARDS_PER_WORKER)
+            if len(shard)
+        ]
+        # 'spawn' gives every worker a clean interpreter, without the parent's pyplot state
+        context = multiprocessing.get_context('spawn')
+        # timings of the stages stay in the workers, only the progress is tracked here
+        animation.profiler.start(len(frames))
+        with context.Pool(workers, initializer=_init_worker, initargs=(job,)) as pool:
+            for rendered in pool.imap_unordered(_render_shard, shards):
+                if manifest is not None:
+                    for frame_index, path in rendered:
+                        manifest.record(frame_index, path)
+                animation.profiler.frame_done(len(rendered))
+        animation.profiler.finish()
+    finally:
+        if not keep_spectra:
+            # release the memory-mapped files before removing them
+            animation.spectra = None
+            for file_name in os.listdir(shared_directory):
+                os.remove(os.path.join(shared_directory, file_name))
+            os.rmdir(shared_directory)
@@ -0,0 +1,225 @@
+import csv
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+
+class StageEvent(NamedTuple):
+    name: str
+    start: float  # seconds since the profiler was created
+    duration: float  # in seconds
+    frame: Optional[int]
+    thread: int
+
+
+class RenderProgress(NamedTuple):
+    frames_done: int
+    total_frames: int
+    rate: float  # in frames per second
+    eta: float  # in seconds
+
+
+def print_render_progress(progress: RenderProgress):
+    print(
+        f'{progress.frames_done}/{progress.total_frames} frames, '
+        f'{progress.rate:.2f} frames/s, ETA {progress.eta:.1f} s'
+    )
+
+
+class _NullStage:
+    """
+    context manager that does nothing, shared by all the stages of NullProfiler
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class NullProfiler:
+    """
+    profiler that records nothing, default of FFTAnimation - the hooks cost a method call
+    and an empty 'with' block each
+    """
+    def stage(self, name: str, frame: Optional[int] = None) -> _NullStage:
+        return _NULL_STAGE
+
+    def count(self, name: str, amount: int = 1):
+        pass
+
+    def start(self, total_frames: int):
+        pass
+
+    def frame_done(self, amount: int = 1):
+        pass
+
+    def finish(self):
+        pass
+
+
+class _Stage:
+    __slots__ = ('profiler', 'name', 'frame', 'started')
+
+    def __init__(self, profiler: 'RenderProfiler', name: str, frame: Optional[int]):
+        self.profiler = profiler
+        self.name = name
+        self.frame = frame
+
+    def __enter__(self):
+        self.started = self.profiler.clock()
+        return self
+
+    def __exit__(self, *exc_info):
+        finished = self.profiler.clock()
+        self.profiler.events.append(StageEvent(
+            self.name, self.started - self.profiler.origin, finished - self.started,
+            self.frame, threading.get_ident()
+        ))
+        return False
+
+
+class RenderProfiler:
+    """
+    timing and counter hooks for the stages of rendering, with live progress of the frames
+
+    every stage is kept as a separate event, so the run can be looked at on a timeline
+    ('export_chrome_trace', opens in chrome://tracing or Perfetto) or summed up per stage
+    ('summary', 'export_csv')
+    """
+    def __init__(
+        self, progress_callback: Optional[Callable[[RenderProgress], None]] = print_render_progress,
+        progress_interval: float = 1., clock: Callable[[], float] = time.perf_counter
+    ):
+        """
+        :param progress_callback: called with the progress of frames, 'None' to stay silent
+        :param progress_interval: minimal time between progress calls, in seconds
+        :param clock: source of time, in seconds
+        """
+        self.progress_callback = progress_callback
+        self.progress_interval = progress_interval
+        self.clock = clock
+        self.origin = clock()
+        self.events: List[StageEvent] = []
+        self.counters: Dict[str, int] = {}
+        # (time, name, value after the change), for the counter tracks of the timeline
+        self.counter_events: List[tuple] = []
+        self.total_frames = 0
+        self.frames_done = 0
+        self.frames_started_at = self.origin
+        self.last_progress = self.origin
+        self.reported_frames: Optional[int] = None
+
+    def stage(self, name: str, frame: Optional[int] = None) -> _Stage:
+        """
+        context manager timing a single stage
+        :param name: stage label, events with the same name are summed up together
+        :param frame: index of the frame the stage belongs to, if any
+        """
+        return _Stage(self, name, frame)
+
+    def count(self, name: str, amount: int = 1):
+        value = self.counters.get(name, 0) + amount
+        self.counters[name] = value
+        self.counter_events.append((self.clock() - self.origin, name, value))
+
+    def start(self, total_frames: int):
+        """
+        begin counting frames of a render job, for the rate and ETA of the progress
+        """
+        self.total_frames = total_frames
+        self.frames_done = 0
+        self.frames_started_at = self.last_progress = self.clock()
+        self.reported_frames = None
+
+    def _report(self, now: float):
+        if self.progress_callback is None:
+            return
+        elapsed = now - self.frames_started_at
+        rate = self.frames_done / elapsed if elapsed > 0 else float('inf')
+        remaining = self.total_frames - self.frames_done
+        self.progress_callback(RenderProgress(
+            self.frames_done, self.total_frames, rate, remaining / rate if rate else float('inf')
+        ))
+        self.last_progress = now
+        self.reported_frames = self.frames_done
+
+    def frame_done(self, amount: int = 1):
+        self.frames_done += amount
+        self.count('frames', amount)
+        now = self.clock()
+        if now - self.last_progress >= self.progress_interval:
+            self._report(now)
+
+    def finish(self):
+        """
+        report the final progress of the render job, unless it was just reported
+        """
+        if self.reported_frames != self.frames_done:
+            self._report(self.clock())
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        amount of calls, total, mean and longest time of every stage
+        """
+        stages: Dict[str, List[float]] = {}
+        for event in self.events:
+            stages.setdefault(event.name, []).append(event.duration)
+        return {
+            name: {
+                'calls': len(durations),
+                'total_s': sum(durations),
+                'mean_s': sum(durations) / len(durations),
+                'max_s': max(durations),
+            } for name, durations in stages.items()
+        }
+
+    def print_summary(self):
+        summary = self.summary()
+        for name, stage in sorted(summary.items(), key=lambda item: -item[1]['total_s']):
+            print(
+                f'{name:>18}: {stage["calls"]:6d} calls, {stage["total_s"]:9.3f} s total, '
+                f'{1000. * stage["mean_s"]:8.3f} ms mean'
+            )
+
+    def export_chrome_trace(self, path: str):
+        """
+        save the events in the Chrome trace-event format (JSON object form)
+        """
+        process = os.getpid()
+        trace_events = []
+        for event in self.events:
+            trace_event = {
+                'name': event.name, 'cat': 'render', 'ph': 'X', 'pid': process,
+                'tid': event.thread, 'ts': event.start * 1e6, 'dur': event.duration * 1e6,
+            }
+            if event.frame is not None:
+                trace_event['args'] = {'frame': event.frame}
+            trace_events.append(trace_event)
+        for timestamp, name, value in self.counter_events:
+            trace_events.append({
+                'name': name, 'cat': 'counter', 'ph': 'C', 'pid': process,
+                'ts': timestamp * 1e6, 'args': {name: value},
+            })
+        with open(path, 'w') as trace_file:
+            json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, trace_file)
+
+    def export_csv(self, path: str):
+        """
+        save the events as a flat table, one row per stage call
+        """
+        with open(path, 'w', newline='') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(['stage', 'frame', 'start_s', 'duration_s', 'thread'])
+            for event in self.events:
+                writer.writerow([
+                    event.name, '' if event.frame is None else event.frame,
+                    f'{event.start:.9f}', f'{event.duration:.9f}', event.thread
+                ])
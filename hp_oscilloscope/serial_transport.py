@@ -0,0 +1,184 @@
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+import numpy as np
+
+from .oscilloscope_auxiliary import BAUDRATE_FAST, parse_block
+
+TERMINATOR = b'\n'
+
+
+def is_query(command: bytes) -> bool:
+    """
+    only queries (commands with '?' in them) make the oscilloscope send a reply
+    """
+    return b'?' in command
+
+
+class SerialTransport:
+    """
+    command/reply framing for the HP54645D RS232 interface
+
+    text replies end with the newline terminator, waveform data comes as a definite-length
+    block ('#8NNNNNNNN' followed by the declared amount of bytes and a terminator). Reads
+    finish as soon as the frame is complete, instead of waiting for a fixed amount of bytes
+    or a fixed time. XON/XOFF flow control of the port is switched off while a reply is read,
+    as a binary block can hold the XON (0x11) and XOFF (0x13) bytes, which the driver would
+    otherwise swallow; commands sent on their own are still paced by it.
+
+    connection can be 'serial.Serial' or anything with the same 'read', 'read_until' and
+    'write' methods, like a pty or a loopback stand-in of the instrument
+    """
+    def __init__(self, connection):
+        self.connection = connection
+
+    @classmethod
+    def open(
+        cls, port: str = 'COM5', baudrate: int = BAUDRATE_FAST, timeout: float = 2.,
+        xonxoff: bool = True
+    ) -> 'SerialTransport':
+        """
+        open the serial port with the settings of the oscilloscope
+        :param port: name of the serial port
+        :param baudrate: one of the rates set in the oscilloscope I/O menu
+        :param timeout: maximum time of silence on the line, in seconds, before the read fails
+        :param xonxoff: software flow control, as set in the oscilloscope I/O menu
+        """
+        import serial
+        connection = serial.Serial(
+            port=port, baudrate=baudrate, timeout=timeout, parity=serial.PARITY_NONE,
+            xonxoff=xonxoff, dsrdtr=False, stopbits=serial.STOPBITS_ONE
+        )
+        return cls(connection)
+
+    def close(self):
+        self.connection.close()
+
+    @contextmanager
+    def flow_control_off(self) -> Iterator[None]:
+        """
+        disable XON/XOFF of the connection for the time of the block, restore it afterwards
+        (nothing happens if the connection has no software flow control)
+        """
+        xonxoff = getattr(self.connection, 'xonxoff', False)
+        if xonxoff:
+            self.connection.xonxoff = False
+        try:
+            yield
+        finally:
+            if xonxoff:
+                self.connection.xonxoff = True
+
+    def reset_input(self):
+        """
+        drop whatever is left of an interrupted reply
+        """
+        self.connection.reset_input_buffer()
+
+    def write(self, command: bytes):
+        """
+        send a single command, terminated with newline
+        """
+        self.connection.write(command + TERMINATOR)
+
+    def read_exactly(self, size: int) -> bytes:
+        """
+        read the given amount of bytes, raise TimeoutError if the line goes silent before that
+        """
+        buffer = bytearray()
+        while len(buffer) < size:
+            chunk = self.connection.read(size - len(buffer))
+            if not chunk:
+                raise TimeoutError(f'expected {size} bytes, received {len(buffer)}')
+            buffer += chunk
+        return bytes(buffer)
+
+    def read_line(self) -> bytes:
+        """
+        read a text reply up to the terminator
+        :return: reply without the terminator
+        """
+        line = self.connection.read_until(TERMINATOR)
+        if not line.endswith(TERMINATOR):
+            raise TimeoutError(f'reply not terminated, received {line!r}')
+        return line[:-len(TERMINATOR)]
+
+    def read_response(self) -> bytes:
+        """
+        read a single reply of any kind
+        :return: text reply without terminator, or the whole definite-length block
+            (header included, so it can be passed to 'parse_block')
+        """
+        first = self.read_exactly(1)
+        if first == TERMINATOR:
+            return b''
+        if first != b'#':
+            return first + self.read_line()
+        header = first + self._read_block_header()
+        payload = self.read_exactly(int(header[2:]))
+        # block is followed by the terminator as well
+        self.read_line()
+        return header + payload
+
+    def _read_block_header(self) -> bytes:
+        """
+        rest of the block header, after the '#': length digit and the length field
+        """
+        length_digits = self.read_exactly(1)
+        return length_digits + self.read_exactly(int(length_digits))
+
+    def query(self, command: bytes) -> bytes:
+        """
+        send the query and wait just as long as it takes for the reply to arrive
+        """
+        # switched before the query is sent, so no byte of the reply passes the driver
+        # with flow control still on
+        with self.flow_control_off():
+            self.write(command)
+            return self.read_response()
+
+    def query_block(self, command: bytes) -> np.ndarray:
+        """
+        send the query answered with a definite-length block (like ':WAVEFORM:DATA?')
+        :return: uint8 array of the block payload
+        """
+        return parse_block(self.query(command))
+
+    def query_block_pieces(
+        self, command: bytes, piece_size: int, expected_size: Optional[int] = None
+    ) -> Iterator[np.ndarray]:
+        """
+        send the query answered with a definite-length block, and yield its payload in pieces
+        as they arrive, so a long block never has to be held in memory whole
+        :param piece_size: amount of bytes in every piece, except maybe the last one
+        :param expected_size: raise ValueError if the block declares another length
+        :return: uint8 arrays of the consecutive parts of the payload
+        """
+        with self.flow_control_off():
+            self.write(command)
+            first = self.read_exactly(1)
+            if first != b'#':
+                raise ValueError(f'expected a definite-length block, received {first!r}')
+            remaining = int(self._read_block_header()[1:])
+            if expected_size is not None and remaining != expected_size:
+                raise ValueError(f'expected a block of {expected_size} bytes, got {remaining}')
+            while remaining:
+                piece = self.read_exactly(min(piece_size, remaining))
+                remaining -= len(piece)
+                yield np.frombuffer(piece, dtype=np.uint8)
+            self.read_line()
+
+    def execute(self, command: bytes) -> Optional[bytes]:
+        """
+        send the command, and read the reply only if the command is a query
+        """
+        if is_query(command):
+            return self.query(command)
+        self.write(command)
+        return None
+
+    def __enter__(self) -> 'SerialTransport':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,286 @@
+import os
+import re
+import threading
+import time
+from typing import Iterable, Optional
+
+import numpy as np
+
+from .oscilloscope_auxiliary import BAUDRATE_FAST, WaveformPreamble
+from .serial_transport import SerialTransport
+
+TERMINATOR = b'\n'
+XON = b'\x11'
+XOFF = b'\x13'
+# ':WAVEFORM:DATA? <first point>,<amount of points>' - range form understood by the simulator
+RANGE_QUERY = re.compile(rb'(\d+)\s*,\s*(\d+)')
+SCPI_NODE = re.compile(r'([*A-Z]+)(\d*)')
+
+
+def short_form(header: bytes) -> bytes:
+    """
+    SCPI short form of the command header, so both ':ANALOG1:RANGE' and ':ANAL1:RANG'
+    are the same command for the simulator (e.g. ':WAVEFORM:PREAMBLE?' -> ':WAV:PRE?')
+    """
+    header = header.decode('ASCII').upper()
+    query = header.endswith('?')
+    nodes = []
+    for node in header.rstrip('?').split(':'):
+        match = SCPI_NODE.fullmatch(node)
+        if match is None:
+            nodes.append(node)
+            continue
+        keyword, suffix = match.groups()
+        if not keyword.startswith('*') and len(keyword) > 4:
+            # short form is 4 letters long, or 3 if the fourth one is a vowel
+            keyword = keyword[:3] if keyword[3] in 'AEIOU' else keyword[:4]
+        nodes.append(keyword + suffix)
+    return (':'.join(nodes) + ('?' if query else '')).encode('ASCII')
+
+
+def synthetic_record(points: int, seed: int = 0) -> np.ndarray:
+    """
+    8-bit record resembling a real capture: a few sines around the middle of the ADC range
+    with some noise on top, phase of the signal depends on the seed. The record starts with
+    a full-scale ramp, so every byte value - XON (0x11) and XOFF (0x13) too - goes through
+    the link, like it can in a real waveform
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(points) / points
+    phase = rng.uniform(0, 2 * np.pi)
+    signal = 40 * np.sin(2 * np.pi * 37 * t + phase) + 15 * np.sin(2 * np.pi * 411 * t) \
+        + rng.normal(0, 4, points)
+    record = np.clip(np.round(128 + signal), 0, 255).astype(np.uint8)
+    ramp = min(points, 256)
+    record[:ramp] = np.arange(ramp)
+    return record
+
+
+def block(payload: bytes, length_digits: int = 8) -> bytes:
+    """
+    wrap the payload into a definite-length block, followed by the terminator
+    """
+    return b'#' + str(length_digits).encode('ASCII') \
+        + str(len(payload)).zfill(length_digits).encode('ASCII') + payload + TERMINATOR
+
+
+class SimulatedHP54645D:
+    """
+    stand-in for the oscilloscope that answers the SCPI commands used in this package and
+    serves a synthetic waveform record
+
+    long and short forms of the headers are both accepted. ':DIGITIZE' acquires a new record
+    (same signal, different phase and noise). Besides ':WAVEFORM:DATA?' returning the whole
+    record, ':WAVEFORM:DATA? <start>,<count>' returns only the given range of it. Replies
+    can be cut in half on purpose, to simulate timeouts and dropped links - either the ones
+    listed in drop_replies (counted from 0), or at random with dropout_probability
+    """
+    IDENTITY = b'HEWLETT-PACKARD,54645D,0,A.02.00'
+
+    def __init__(
+        self, record: Optional[np.ndarray] = None, points: int = 4000, seed: int = 0,
+        drop_replies: Iterable[int] = (), dropout_probability: float = 0.
+    ):
+        self.record = synthetic_record(points, seed) if record is None else np.asarray(record)
+        self.seed = seed
+        self.captures = 0
+        self.preamble = WaveformPreamble(
+            format=0, type=0, points=len(self.record), count=1, x_increment=1e-7,
+            x_origin=0., x_reference=0., y_increment=0.003125, y_origin=0., y_reference=128.
+        )
+        self.drop_replies = set(drop_replies)
+        self.dropout_probability = dropout_probability
+        self.rng = np.random.default_rng(seed)
+        self.replies_sent = 0
+        self.settings = {}
+
+    def respond(self, command: bytes) -> Optional[bytes]:
+        """
+        reply to a single command (without terminator) the way the oscilloscope would,
+        'None' if the command is not a query
+        """
+        reply = None
+        for part in command.strip().split(b';'):
+            header, _, argument = part.strip().partition(b' ')
+            if header:
+                reply = self._execute(short_form(header), argument.strip())
+        return reply
+
+    def _execute(self, header: bytes, argument: bytes) -> Optional[bytes]:
+        if header == b'*RST':
+            self.settings.clear()
+        elif header in (b':DIG', b':RUN', b':SING'):
+            self.captures += 1
+            self.record = synthetic_record(len(self.record), self.seed + self.captures)
+        elif not header.endswith(b'?'):
+            self.settings[header] = argument
+        elif header == b'*IDN?':
+            return self.IDENTITY + TERMINATOR
+        elif header == b':WAV:PRE?':
+            fields = [str(value) for value in self.preamble]
+            return ','.join(fields).encode('ASCII') + TERMINATOR
+        elif header == b':WAV:POIN?':
+            return str(len(self.record)).encode('ASCII') + TERMINATOR
+        elif header == b':WAV:DATA?':
+            range_query = RANGE_QUERY.fullmatch(argument)
+            if range_query:
+                start, count = int(range_query.group(1)), int(range_query.group(2))
+                return block(self.record[start:start + count].tobytes())
+            return block(self.record.tobytes())
+        elif header == b':ACQ:DATA?':
+            return block(self.record.tobytes())
+        else:
+            # echo back the settings made earlier, like ':ANAL1:RANG?'
+            return self.settings.get(header[:-1], b'0') + TERMINATOR
+        return None
+
+    def transmit(self, reply: bytes) -> bytes:
+        """
+        what actually reaches the host - the whole reply, or only its first half on dropout
+        """
+        reply_number = self.replies_sent
+        self.replies_sent += 1
+        dropped = reply_number in self.drop_replies or (
+            self.dropout_probability and self.rng.random() < self.dropout_probability)
+        return reply[:len(reply) // 2] if dropped else reply
+
+
+class LoopbackSerial:
+    """
+    object with the 'serial.Serial' interface used by SerialTransport, wired directly to
+    the simulated instrument; reads return what is left of the replies, or nothing
+    (like a timeout) if there is nothing to read
+    """
+    def __init__(
+        self, instrument: SimulatedHP54645D, baudrate: Optional[int] = None,
+        xonxoff: bool = True
+    ):
+        """
+        :param instrument: simulated oscilloscope answering the commands
+        :param baudrate: if given, reads take as long as on the real line (10 bits per byte)
+        :param xonxoff: software flow control, like on the port opened by SerialTransport -
+            the XON and XOFF bytes of the replies are swallowed, as the port driver does
+        """
+        self.instrument = instrument
+        self.baudrate = baudrate
+        self.xonxoff = xonxoff
+        self._output = bytearray()
+        self._input = bytearray()
+        self.is_open = True
+
+    def write(self, data: bytes) -> int:
+        self._input += data
+        while TERMINATOR in self._input:
+            command, _, rest = bytes(self._input).partition(TERMINATOR)
+            self._input = bytearray(rest)
+            reply = self.instrument.respond(command)
+            if reply is not None:
+                self._output += self.instrument.transmit(reply)
+        return len(data)
+
+    def _take(self, size: int) -> bytes:
+        data = bytes(self._output[:size])
+        del self._output[:size]
+        if self.baudrate:
+            time.sleep(len(data) * 10 / self.baudrate)
+        if self.xonxoff:
+            data = data.replace(XON, b'').replace(XOFF, b'')
+        return data
+
+    def read(self, size: int = 1) -> bytes:
+        return self._take(size)
+
+    def read_until(self, expected: bytes = TERMINATOR, size: Optional[int] = None) -> bytes:
+        end = self._output.find(expected)
+        length = len(self._output) if end < 0 else end + len(expected)
+        if size is not None:
+            length = min(length, size)
+        return self._take(length)
+
+    @property
+    def in_waiting(self) -> int:
+        return len(self._output)
+
+    def reset_input_buffer(self):
+        self._output.clear()
+
+    def close(self):
+        self.is_open = False
+
+
+def simulated_transport(
+    points: int = 4000, baudrate: Optional[int] = BAUDRATE_FAST, **instrument_kwargs
+) -> SerialTransport:
+    """
+    SerialTransport talking to a fresh simulated oscilloscope over a loopback connection
+    """
+    instrument = SimulatedHP54645D(points=points, **instrument_kwargs)
+    return SerialTransport(LoopbackSerial(instrument, baudrate=baudrate))
+
+
+class PtyHP54645D:
+    """
+    simulated oscilloscope behind a pseudo-terminal, so it can be opened like a real serial
+    port (e.g. 'SerialTransport.open(port=simulator.port)') and the whole pyserial stack
+    is exercised. Replies are paced to the given baud rate (10 bits per byte).
+    Available on POSIX systems only
+    """
+    def __init__(
+        self, instrument: Optional[SimulatedHP54645D] = None,
+        baudrate: Optional[int] = BAUDRATE_FAST
+    ):
+        import tty
+        self.instrument = instrument or SimulatedHP54645D()
+        self.baudrate = baudrate
+        self._master, self._slave = os.openpty()
+        # no line discipline on the simulator side, binary blocks have to pass untouched
+        tty.setraw(self._slave)
+        tty.setraw(self._master)
+        self.port = os.ttyname(self._slave)
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> 'PtyHP54645D':
+        self._running = True
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        return self
+
+    def _send(self, reply: bytes):
+        if not self.baudrate:
+            os.write(self._master, reply)
+            return
+        # chunks of ~10 ms of line time
+        chunk_size = max(self.baudrate // 1000, 1)
+        started = time.monotonic()
+        for sent in range(0, len(reply), chunk_size):
+            chunk = reply[sent:sent + chunk_size]
+            os.write(self._master, chunk)
+            delay = started + (sent + len(chunk)) * 10 / self.baudrate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def _serve(self):
+        pending = b''
+        while self._running:
+            try:
+                data = os.read(self._master, 4096)
+            except OSError:
+                return
+            pending += data
+            while TERMINATOR in pending:
+                command, _, pending = pending.partition(TERMINATOR)
+                reply = self.instrument.respond(command)
+                if reply is not None:
+                    self._send(self.instrument.transmit(reply))
+
+    def stop(self):
+        self._running = False
+        os.close(self._slave)
+        os.close(self._master)
+
+    def __enter__(self) -> 'PtyHP54645D':
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
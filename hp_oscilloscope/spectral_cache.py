@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+
+from .spectral_store import SpectralFrameStore
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.expanduser('~'), '.cache', 'hp_oscilloscope', 'spectra')
+DEFAULT_MAX_BYTES = 4 << 30
+ENTRY_INFO = 'entry.json'
+# amount of bytes of the waveform hashed at once, memory-mapped captures are never read whole
+HASH_CHUNK = 1 << 24
+
+
+class CacheEntry(NamedTuple):
+    key: str
+    path: str
+    size: int  # in bytes
+    last_used: float  # in seconds since epoch
+
+
+def cache_key(signal: np.ndarray, parameters: dict) -> str:
+    """
+    content address of the spectra: sha256 of the waveform samples and of everything that
+    decides how they are cut into windows and transformed
+    :param signal: 1D array with samples of the waveform
+    :param parameters: JSON-serialisable settings of the computation
+    """
+    signal = np.asarray(signal)
+    digest = hashlib.sha256()
+    digest.update(json.dumps(
+        {'dtype': signal.dtype.str, 'points': len(signal), **parameters}, sort_keys=True
+    ).encode('ASCII'))
+    flat = signal.reshape(-1)
+    step = max(1, HASH_CHUNK // max(1, signal.itemsize))
+    for start in range(0, len(flat), step):
+        digest.update(np.ascontiguousarray(flat[start:start + step]).data)
+    return digest.hexdigest()
+
+
+def _directory_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(path, file_name)) for file_name in os.listdir(path)
+    )
+
+
+class SpectralCache:
+    """
+    on-disk store of computed spectra, reused whenever the same capture is rendered again
+    with the same window settings (other dpi, colours or output place do not matter)
+
+    every entry is a directory with memory-mappable SpectralFrameStore files, named after
+    its key. Entries are written to a temporary directory first and renamed into place when
+    complete, so an interrupted computation never leaves a broken entry behind. When the
+    cache grows over max_bytes, least recently used entries are removed
+    """
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        :param directory: place of the cache, created if missing
+        :param max_bytes: size of the cache above which old entries are evicted
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def lookup(self, key: str) -> Optional[SpectralFrameStore]:
+        """
+        open the entry read-only and mark it as used, 'None' if it is not in the cache
+        """
+        path = self.entry_path(key)
+        info_path = os.path.join(path, ENTRY_INFO)
+        if not os.path.exists(info_path):
+            return None
+        # modification time of the info file is the "last used" of the entry
+        os.utime(info_path)
+        return SpectralFrameStore.open(path)
+
+    def create(
+        self, frames: int, bins: int, dtype: np.dtype = np.float32,
+        frame_rows: Optional[np.ndarray] = None
+    ) -> SpectralFrameStore:
+        """
+        new, memory-mapped store in a temporary directory of the cache, to be filled,
+        flushed, released and then handed over to 'commit' (or 'discard') by its directory
+        """
+        partial = tempfile.mkdtemp(prefix='partial_', dir=self.directory)
+        return SpectralFrameStore(
+            frames, bins, dtype=dtype, directory=partial, frame_rows=frame_rows)
+
+    def commit(self, key: str, partial: str, parameters: dict) -> SpectralFrameStore:
+        """
+        move the filled store under its key and evict old entries if the cache got too big;
+        memory maps of the store have to be closed before, or the move fails on Windows
+        :param key: key of the entry, from 'cache_key'
+        :param partial: directory of the store made by 'create'
+        :param parameters: settings the spectra were computed with, kept for reference
+        :return: the entry opened read-only
+        """
+        with open(os.path.join(partial, ENTRY_INFO), 'w') as info_file:
+            json.dump({'key': key, 'created': time.time(), 'parameters': parameters}, info_file)
+        path = self.entry_path(key)
+        try:
+            os.replace(partial, path)
+        except OSError:
+            # the same spectra were committed by another process in the meantime
+            shutil.rmtree(partial, ignore_errors=True)
+        self.evict(keep=key)
+        return self.lookup(key)
+
+    @staticmethod
+    def discard(partial: str):
+        """
+        remove the directory of the store that was not committed
+        """
+        shutil.rmtree(partial, ignore_errors=True)
+
+    def entries(self) -> List[CacheEntry]:
+        """
+        complete entries of the cache, least recently used first
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            path = self.entry_path(name)
+            info_path = os.path.join(path, ENTRY_INFO)
+            if os.path.exists(info_path):
+                entries.append(CacheEntry(
+                    name, path, _directory_size(path), os.path.getmtime(info_path)))
+        return sorted(entries, key=lambda entry: entry.last_used)
+
+    def size(self) -> int:
+        return sum(entry.size for entry in self.entries())
+
+    def evict(self, keep: Optional[str] = None):
+        """
+        remove least recently used entries until the cache fits in max_bytes
+        :param keep: key of the entry that must stay, e.g. the one just added
+        """
+        entries = self.entries()
+        total = sum(entry.size for entry in entries)
+        for entry in entries:
+            if total <= self.max_bytes:
+                break
+            if entry.key == keep:
+                continue
+            shutil.rmtree(entry.path, ignore_errors=True)
+            total -= entry.size
+
+    def clear(self):
+        for entry in self.entries():
+            shutil.rmtree(entry.path, ignore_errors=True)
@@ -0,0 +1,160 @@
+from typing import List, Optional, Sequence, Union
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .spectral_band import SpectralBand
+
+
+# amount of windows pushed through a single batched FFT call, keeps the temporary
+# complex (batch x span) matrix at a reasonable size for long records
+DEFAULT_BATCH_SIZE = 256
+# ...but no more samples than this in a single batch, so long windows of 1 MS captures
+# do not blow the temporary arrays up to gigabytes
+MAX_BATCH_SAMPLES = 1 << 22
+# sliding DFT spectra are recomputed from scratch every so many frames,
+# so rounding errors of the recursive updates cannot pile up
+DEFAULT_REFRESH_INTERVAL = 128
+# longest window step (in samples) for which updating the previous spectrum is cheaper than
+# a new FFT; measured per-frame cost of the update is 0.1-0.4 of the rfft for steps up to 8,
+# and gets on par with it around 16
+SLIDING_MAX_STEP = 8
+
+
+def frame_offsets(frame_info: Sequence[Sequence[int]]) -> np.ndarray:
+    """
+    extract start offsets of time-windows from the list of [frame_index, data_index] pairs
+    :param frame_info: pointers for each frame, as kept in FFTAnimation.frame_info
+    :return: 1D integer array of data indices
+    """
+    return np.array([data_index for _, data_index in frame_info], dtype=np.intp)
+
+
+def frame_windows(signal: np.ndarray, offsets: np.ndarray, span: int) -> np.ndarray:
+    """
+    select all the time-windows of the signal at once
+
+    sliding_window_view creates a (len - span + 1) x span strided view over the signal
+    without copying anything, then only the rows pointed by offsets are gathered
+    :param signal: 1D array with samples of the waveform
+    :param offsets: starting indices of each window
+    :param span: amount of samples in a single window
+    :return: (len(offsets) x span) array of windows
+    """
+    windows = sliding_window_view(np.asarray(signal), span)
+    return windows[offsets]
+
+
+def power_db(spectrum: np.ndarray) -> np.ndarray:
+    """
+    signal power in dB, whole-array version of 'log(norm(z), 10)*10'
+    """
+    magnitude = np.abs(spectrum)
+    # bins that cancel out exactly (e.g. Nyquist bin of rfft) would give -inf, which breaks
+    # axis scaling later on - clamp them to the smallest positive float instead
+    return 10. * np.log10(np.maximum(magnitude, np.finfo(magnitude.dtype).tiny))
+
+
+def batch_frames(span: int, batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """
+    amount of windows of given span that can be processed at once
+    """
+    return max(1, min(batch_size, MAX_BATCH_SAMPLES // span))
+
+
+def fill_store(
+    store, signal: np.ndarray, offsets: Union[np.ndarray, List[int]], span: int,
+    first_frame: int = 0, batch_size: int = DEFAULT_BATCH_SIZE,
+    band: Optional[SpectralBand] = None
+):
+    """
+    calculate the half-spectrum (rfft) of every time-window pointed by offsets and write
+    it batch by batch straight into the preallocated frame store
+    :param store: SpectralFrameStore with at least first_frame + len(offsets) rows
+    :param signal: 1D array with samples of the waveform
+    :param offsets: starting indices of each window
+    :param span: amount of samples in a single window
+    :param first_frame: row of the store that receives the first window
+    :param batch_size: amount of windows transformed at once
+    :param band: if given, only this part of the spectrum is computed and stored
+    """
+    offsets = np.asarray(offsets, dtype=np.intp)
+    batch_size = batch_frames(span if band is None else band.samples_per_window, batch_size)
+    for start in range(0, len(offsets), batch_size):
+        windows = frame_windows(signal, offsets[start:start+batch_size], span)
+        if band is None:
+            f_out = np.fft.rfft(windows, span, axis=1)
+        else:
+            f_out = band.transform(windows)
+        store.write(first_frame + start, power_db(f_out), f_out.real, f_out.imag)
+
+
+def sliding_pays_off(offsets: np.ndarray, max_step: int = SLIDING_MAX_STEP) -> bool:
+    """
+    tell if the windows move by small enough steps for 'fill_store_sliding' to pay off
+    """
+    steps = np.diff(np.asarray(offsets))
+    return len(steps) > 0 and bool(np.median(steps) <= max_step)
+
+
+def fill_store_sliding(
+    store, signal: np.ndarray, offsets: Union[np.ndarray, List[int]], span: int,
+    first_frame: int = 0, refresh_interval: int = DEFAULT_REFRESH_INTERVAL,
+    max_step: int = SLIDING_MAX_STEP, batch_size: int = DEFAULT_BATCH_SIZE,
+    band: Optional[SpectralBand] = None
+):
+    """
+    same result as 'fill_store', but every spectrum is derived from the previous one
+    (sliding DFT), which for windows moving by d samples costs O(bins * d) instead of
+    O(span * log(span)). When the window moves from n0 to n0 + d, each bin k becomes
+
+        X'[k] = W^(-k*d) * (X[k] + sum_{m<d} (x[n0+span+m] - x[n0+m]) * W^(k*m))
+
+    with W = exp(-2j*pi/span) - samples that left the window are taken out, the ones that
+    came in are added, and the phase is rotated to the new start. Spectra are computed with
+    a regular FFT for the first frame, every refresh_interval frames, and for steps longer
+    than max_step (or going backwards). Cost of the updates is proportional to the amount
+    of bins, so a narrower band makes them cheaper
+    :param store: SpectralFrameStore with at least first_frame + len(offsets) rows
+    :param signal: 1D array with samples of the waveform
+    :param offsets: starting indices of each window
+    :param span: amount of samples in a single window
+    :param first_frame: row of the store that receives the first window
+    :param refresh_interval: amount of frames between full FFT computations
+    :param max_step: longest step updated recursively
+    :param batch_size: amount of frames collected before they are written to the store
+    :param band: if given, only its bins are updated and stored; it has to lie on the rfft
+        grid (zoom 1), other frequencies do not follow the recurrence above
+    """
+    if band is not None and not band.on_grid:
+        raise ValueError('sliding DFT works only for bands on the rfft grid')
+    offsets = np.asarray(offsets, dtype=np.intp)
+    signal = np.asarray(signal)
+    bins = store.bins
+    first_bin = 0 if band is None else band.first_bin
+    k = np.arange(first_bin, first_bin + bins, dtype=np.int64)
+    # exponents reduced modulo span before scaling, so the phases stay exact for high bins
+    entering = np.exp(-2j * np.pi * (np.outer(np.arange(max_step), k) % span) / span)
+    rotations = {}
+
+    spectrum = None
+    batch = np.empty((min(batch_frames(span, batch_size), len(offsets)), bins), dtype=np.complex128)
+    batch_start = 0
+    for i, offset in enumerate(offsets):
+        step = int(offset - offsets[i - 1]) if i else -1
+        if spectrum is None or i % refresh_interval == 0 or not 0 <= step <= max_step:
+            spectrum = np.fft.rfft(signal[offset:offset + span], span)[first_bin:first_bin + bins]
+        elif step:
+            change = np.subtract(
+                signal[offset + span - step:offset + span], signal[offset - step:offset],
+                dtype=np.float64
+            )
+            spectrum += change @ entering[:step]
+            if step not in rotations:
+                rotations[step] = np.exp(2j * np.pi * ((k * step) % span) / span)
+            spectrum *= rotations[step]
+        batch[i - batch_start] = spectrum
+        if i - batch_start + 1 == len(batch) or i + 1 == len(offsets):
+            filled = batch[:i - batch_start + 1]
+            store.write(first_frame + batch_start, power_db(filled), filled.real, filled.imag)
+            batch_start = i + 1
@@ -0,0 +1,192 @@
+import os
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+
+class SpectralFrameStore:
+    """
+    contiguous, preallocated storage for the spectra of all animation frames
+
+    every chart quantity is kept in its own (frames x bins) array, so a single frame is
+    just a row view and global extrema are a single reduction over the whole block.
+    Input signal is real, so only the non-negative half of the spectrum is stored,
+    the other half is a complex conjugate mirror of it
+
+    frames that look at the same data (same time-window) can share a single row,
+    with frame_rows telling which row belongs to which frame; frames with row -1 have no
+    spectrum at all, when only some of the frames are rendered
+    """
+    QUANTITIES = ('power', 'real', 'imag')
+    FRAME_ROWS = 'frame_rows'
+
+    def __init__(
+        self, frames: int, bins: int, dtype: np.dtype = np.float32, directory: Optional[str] = None,
+        frame_rows: Optional[np.ndarray] = None
+    ):
+        """
+        :param frames: amount of animation frames
+        :param bins: amount of spectrum bins kept for each frame
+        :param dtype: type of stored values
+        :param directory: if given, arrays are created as memory-mapped .npy files in there,
+            so other processes can open them with 'open' without any copying or pickling
+        :param frame_rows: row of the store for every frame (-1 for frames left out),
+            one row per frame if omitted
+        """
+        self.frames = frames
+        self.bins = bins
+        self.dtype = np.dtype(dtype)
+        self.directory = directory
+        self.frame_rows = None if frame_rows is None else np.asarray(frame_rows, dtype=np.intp)
+        rows = frames if self.frame_rows is None else max(int(self.frame_rows.max()) + 1, 0)
+        arrays = []
+        for quantity in self.QUANTITIES:
+            if directory is None:
+                arrays.append(np.empty((rows, bins), dtype=self.dtype))
+            else:
+                arrays.append(np.lib.format.open_memmap(
+                    os.path.join(directory, f'{quantity}.npy'), mode='w+',
+                    dtype=self.dtype, shape=(rows, bins)
+                ))
+        self.power, self.real, self.imag = arrays
+        if directory is not None and self.frame_rows is not None:
+            np.save(os.path.join(directory, f'{self.FRAME_ROWS}.npy'), self.frame_rows)
+
+    @classmethod
+    def open(cls, directory: str, mode: str = 'r') -> 'SpectralFrameStore':
+        """
+        map the store previously created in the directory, without reading it into memory
+        :param directory: place where .npy files of the store are kept
+        :param mode: memory-map mode, read-only by default
+        """
+        store = cls.__new__(cls)
+        store.directory = directory
+        store.power, store.real, store.imag = [
+            np.load(os.path.join(directory, f'{quantity}.npy'), mmap_mode=mode)
+            for quantity in cls.QUANTITIES
+        ]
+        store.frames, store.bins = store.power.shape
+        store.dtype = store.power.dtype
+        store.frame_rows = None
+        frame_rows_path = os.path.join(directory, f'{cls.FRAME_ROWS}.npy')
+        if os.path.exists(frame_rows_path):
+            store.frame_rows = np.load(frame_rows_path)
+            store.frames = len(store.frame_rows)
+        return store
+
+    def flush(self):
+        """
+        make sure memory-mapped data reached the files
+        """
+        for array in (self.power, self.real, self.imag):
+            if isinstance(array, np.memmap):
+                array.flush()
+
+    @staticmethod
+    def bins_for_span(span: int) -> int:
+        """
+        amount of the half-spectrum bins (as returned by rfft) for the window of given size
+        """
+        return span // 2 + 1
+
+    @property
+    def nbytes(self) -> int:
+        return self.power.nbytes + self.real.nbytes + self.imag.nbytes
+
+    @property
+    def rows(self) -> int:
+        return len(self.power)
+
+    @property
+    def complete(self) -> bool:
+        """
+        tell if every frame of the animation has its spectrum in the store
+        """
+        return self.frame_rows is None or bool(np.all(self.frame_rows >= 0))
+
+    def row(self, frame_index: int) -> int:
+        """
+        row of the store holding the spectrum of the frame
+        """
+        if self.frame_rows is None:
+            return frame_index
+        row = int(self.frame_rows[frame_index])
+        if row < 0:
+            raise IndexError(f'spectrum of frame {frame_index} was not computed')
+        return row
+
+    def write(self, first_row: int, power: np.ndarray, real: np.ndarray, imag: np.ndarray):
+        """
+        put block of consecutive rows into the store, starting at first_row
+        (rows are the frames, unless frame_rows were given)
+        """
+        last_row = first_row + len(power)
+        self.power[first_row:last_row] = power
+        self.real[first_row:last_row] = real
+        self.imag[first_row:last_row] = imag
+
+    def frame(self, frame_index: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        views (no copy) over the data of a single frame
+        :return: power in dB, real part and imaginary part of the half-spectrum
+        """
+        row = self.row(frame_index)
+        return self.power[row], self.real[row], self.imag[row]
+
+    def limits(self) -> Dict[str, float]:
+        """
+        global minima and maxima over all the frames in the store; imaginary part limits
+        cover the mirrored half of the spectrum as well
+        """
+        imag_min = float(np.min(self.imag))
+        imag_max = float(np.max(self.imag))
+        return {
+            'power_min': float(np.min(self.power)),
+            'power_max': float(np.max(self.power)),
+            'real_min': float(np.min(self.real)),
+            'real_max': float(np.max(self.real)),
+            'imag_min': min(imag_min, -imag_max),
+            'imag_max': max(imag_max, -imag_min),
+        }
+
+
+class StreamingLimits:
+    """
+    stand-in for SpectralFrameStore that keeps only the running minima and maxima of
+    what is written to it, so global limits of the spectra can be found while frames
+    are computed batch after batch, without holding any of them
+    """
+    def __init__(self, bins: int, dtype: np.dtype = np.float64):
+        """
+        :param bins: amount of spectrum bins of every frame
+        :param dtype: type the values would be stored in, extremes are rounded to it,
+            so they come out exactly as the ones of a SpectralFrameStore
+        """
+        self.bins = bins
+        self.dtype = np.dtype(dtype)
+        self.extremes = {
+            'power': [np.inf, -np.inf], 'real': [np.inf, -np.inf], 'imag': [np.inf, -np.inf]
+        }
+
+    def write(self, first_row: int, power: np.ndarray, real: np.ndarray, imag: np.ndarray):
+        for quantity, values in (('power', power), ('real', real), ('imag', imag)):
+            extremes = self.extremes[quantity]
+            extremes[0] = min(extremes[0], float(self.dtype.type(np.min(values))))
+            extremes[1] = max(extremes[1], float(self.dtype.type(np.max(values))))
+
+    def flush(self):
+        pass
+
+    def limits(self) -> Dict[str, float]:
+        """
+        same as 'SpectralFrameStore.limits', over everything written so far
+        """
+        imag_min, imag_max = self.extremes['imag']
+        return {
+            'power_min': self.extremes['power'][0],
+            'power_max': self.extremes['power'][1],
+            'real_min': self.extremes['real'][0],
+            'real_max': self.extremes['real'][1],
+            'imag_min': min(imag_min, -imag_max),
+            'imag_max': max(imag_max, -imag_min),
+        }
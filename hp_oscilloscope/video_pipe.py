@@ -0,0 +1,115 @@
+import queue
+import shutil
+import subprocess
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+
+class FFmpegPipeWriter:
+    """
+    encodes raw RGBA frames into a movie file by writing them to stdin of an ffmpeg process
+
+    frames are handed over through a bounded queue and written by a background thread, so
+    drawing of the next frame overlaps with encoding of the previous ones. Canvas buffer
+    is reused by matplotlib for every draw, so each frame is copied once into one of the
+    preallocated slots - this is the only copy, there is no PNG compression or disk I/O
+    """
+    def __init__(
+        self, filename: str, width: int, height: int, fps: int, queue_size: int = 8,
+        ffmpeg_path: Optional[str] = None, codec_args: Optional[List[str]] = None
+    ):
+        """
+        :param filename: output movie file, container is dictated by the extension
+        :param width: frame width in pixels
+        :param height: frame height in pixels
+        :param fps: frame rate of the movie
+        :param queue_size: maximum amount of frames waiting for the encoder
+        :param ffmpeg_path: ffmpeg executable, looked up in PATH if omitted
+        :param codec_args: output codec options, H.264 with yuv420p pixel format by default
+        """
+        self.filename = filename
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.ffmpeg_path = ffmpeg_path or shutil.which('ffmpeg')
+        if self.ffmpeg_path is None:
+            raise FileNotFoundError('ffmpeg executable was not found')
+        if codec_args is None:
+            # yuv420p needs even dimensions of the frame, pad by a single pixel if necessary
+            codec_args = [
+                '-vcodec', 'libx264', '-pix_fmt', 'yuv420p',
+                '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',
+            ]
+        self.codec_args = codec_args
+        # one slot more than the queue can hold, for the frame that is being written
+        self._slots = [np.empty((height, width, 4), dtype=np.uint8) for _ in range(queue_size + 1)]
+        self._free_slots: queue.Queue = queue.Queue()
+        for slot_index in range(len(self._slots)):
+            self._free_slots.put(slot_index)
+        self._pending: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._process: Optional[subprocess.Popen] = None
+        self._thread: Optional[threading.Thread] = None
+        self._error: Optional[BaseException] = None
+
+    @staticmethod
+    def available() -> bool:
+        return shutil.which('ffmpeg') is not None
+
+    def start(self):
+        command = [
+            self.ffmpeg_path, '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'rgba', '-s', f'{self.width}x{self.height}',
+            '-r', str(self.fps), '-i', '-', '-an', *self.codec_args, self.filename,
+        ]
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE)
+        self._thread = threading.Thread(target=self._encode_loop, daemon=True)
+        self._thread.start()
+
+    def _encode_loop(self):
+        while True:
+            slot_index = self._pending.get()
+            if slot_index is None:
+                return
+            try:
+                if self._error is None:
+                    self._process.stdin.write(self._slots[slot_index].data)
+            except BaseException as error:  # noqa
+                # ffmpeg died, keep consuming the queue so the producer never blocks
+                self._error = error
+            finally:
+                self._free_slots.put(slot_index)
+
+    def write_frame(self, rgba_buffer):
+        """
+        queue a single frame
+        :param rgba_buffer: (height x width x 4) RGBA buffer, e.g. FigureCanvasAgg.buffer_rgba()
+        """
+        if self._error is not None:
+            raise RuntimeError('ffmpeg stopped accepting frames') from self._error
+        slot_index = self._free_slots.get()
+        np.copyto(self._slots[slot_index], np.asarray(rgba_buffer))
+        self._pending.put(slot_index)
+
+    def close(self):
+        """
+        flush queued frames and wait for the encoder to finish the file
+        """
+        if self._thread is not None:
+            self._pending.put(None)
+            self._thread.join()
+            self._thread = None
+        if self._process is not None:
+            self._process.stdin.close()
+            return_code = self._process.wait()
+            self._process = None
+            if self._error is not None or return_code != 0:
+                raise RuntimeError(f'ffmpeg failed with exit code {return_code}') from self._error
+
+    def __enter__(self) -> 'FFmpegPipeWriter':
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,223 @@
+import json
+import os
+import time
+from contextlib import closing
+from typing import Callable, NamedTuple, Optional
+
+import numpy as np
+
+from .capture_file import create_capture, open_capture
+from .oscilloscope_auxiliary import WaveformPreamble
+from .serial_transport import SerialTransport
+
+# documented query of the whole record, it comes as a single definite-length block
+DATA_QUERY = b':WAVEFORM:DATA?'
+DEFAULT_CHUNK_POINTS = 16384
+PROGRESS_EXTENSION = '.progress'
+
+
+class DownloadProgress(NamedTuple):
+    points_done: int  # saved in the capture file
+    total_points: int
+    rate: float  # of the line, in points (bytes) per second, re-read points included
+    eta: float  # in seconds, with the saved points that still have to be read again
+    # the block was requested again after a dropout, and the points saved before are read
+    # past until the new ones come
+    replaying: bool = False
+    points_replayed: int = 0
+
+
+def print_progress(progress: DownloadProgress):
+    if progress.replaying:
+        done = f'replaying {progress.points_replayed}/{progress.points_done} saved points'
+    else:
+        done = f'{progress.points_done}/{progress.total_points} points'
+    print(f'{done}, {progress.rate / 1000.:.2f} kB/s, ETA {progress.eta:.1f} s')
+
+
+class ChunkedWaveformDownload:
+    """
+    downloads a long record (up to 1 MS) chunk by chunk into a capture file
+
+    the HP54645D sends the record only as a whole, in a single ':WAVEFORM:DATA?' block, so
+    by default the block is read in chunks as it arrives and every chunk goes straight into
+    its place in the preallocated, memory-mapped capture file. After each chunk the number
+    of completed ones is saved next to the capture. After a timeout or a dropped link the
+    block is requested again and the chunks already saved are only read past - also when
+    the download is started anew, in another run of the program, as long as the
+    oscilloscope still holds the same record (no ':DIGITIZE' in between).
+
+    instruments that can send a range of the record are given a 'chunk_query' instead,
+    and then each chunk is a transfer of its own - only the interrupted one is repeated
+    """
+    def __init__(
+        self, transport: SerialTransport, path: str, total_points: int,
+        chunk_points: int = DEFAULT_CHUNK_POINTS, chunk_query: Optional[bytes] = None,
+        data_query: bytes = DATA_QUERY, retries: int = 5,
+        preamble: Optional[WaveformPreamble] = None, channel: int = 1,
+        progress_callback: Optional[Callable[[DownloadProgress], None]] = print_progress,
+        reconnect: Optional[Callable[[], SerialTransport]] = None
+    ):
+        """
+        :param transport: connection to the oscilloscope
+        :param path: capture file the record is written to
+        :param total_points: length of the record
+        :param chunk_points: amount of points saved (or requested) at once
+        :param chunk_query: query template with '{start}' and '{count}' fields, returning
+            the range of the record; if omitted, the whole record is read with data_query
+        :param data_query: query returning the whole record as one block
+        :param retries: how many times in a row a single chunk may fail before giving up
+        :param preamble: scaling of the waveform, saved in the capture file
+        :param channel: channel the record comes from, saved in the capture file
+        :param progress_callback: called after every chunk, 'None' to stay silent
+        :param reconnect: called after a dropped link to get a new transport, if given
+        """
+        self.transport = transport
+        self.path = path
+        self.progress_path = path + PROGRESS_EXTENSION
+        self.total_points = total_points
+        self.chunk_points = chunk_points
+        self.chunk_query = chunk_query
+        self.data_query = data_query
+        self.retries = retries
+        self.preamble = preamble
+        self.channel = channel
+        self.progress_callback = progress_callback
+        self.reconnect = reconnect
+        self.chunks = -(-total_points // chunk_points)
+        self.failures = 0
+        self.completed_chunks = 0
+        self._session_start = 0.
+        self._session_points = 0
+
+    def _load_progress(self) -> int:
+        """
+        amount of chunks already in the capture file, if it belongs to the same download
+        """
+        if not (os.path.exists(self.progress_path) and os.path.exists(self.path)):
+            return 0
+        with open(self.progress_path, 'r') as progress_file:
+            progress = json.load(progress_file)
+        if (progress['total_points'], progress['chunk_points'], progress.get('ranges')) != \
+                (self.total_points, self.chunk_points, self.chunk_query is not None):
+            return 0
+        return progress['completed_chunks']
+
+    def _save_progress(self, completed_chunks: int):
+        # written to the side and renamed, so the file is never left half-written
+        temporary_path = self.progress_path + '.tmp'
+        with open(temporary_path, 'w') as progress_file:
+            json.dump({
+                'total_points': self.total_points,
+                'chunk_points': self.chunk_points,
+                'ranges': self.chunk_query is not None,
+                'completed_chunks': completed_chunks,
+            }, progress_file)
+        os.replace(temporary_path, self.progress_path)
+
+    def fetch_chunk(self, start: int, count: int) -> np.ndarray:
+        """
+        transfer a single range of the record, with the chunk query
+        """
+        query = self.chunk_query.replace(b'{start}', str(start).encode('ASCII'))
+        query = query.replace(b'{count}', str(count).encode('ASCII'))
+        return self.transport.query_block(query)
+
+    def _store(self, samples: np.ndarray, chunk: int, data: np.ndarray):
+        """
+        put the chunk in its place in the capture and note it in the progress file
+        """
+        start = chunk * self.chunk_points
+        count = min(self.chunk_points, self.total_points - start)
+        if len(data) != count:
+            raise ValueError(f'expected {count} points, received {len(data)}')
+        samples[start:start + count] = data
+        samples.flush()
+        self.completed_chunks = chunk + 1
+        self._save_progress(self.completed_chunks)
+        self._session_points += count
+        self._report(start + count)
+
+    def _points_done(self) -> int:
+        return min(self.completed_chunks * self.chunk_points, self.total_points)
+
+    def _report(self, position: int, replaying: bool = False):
+        """
+        call the progress callback
+        :param position: points of the record that went over the line in the current
+            transfer, whatever is after them is still to come
+        :param replaying: the last piece was saved before, and only read past
+        """
+        if self.progress_callback is None:
+            return
+        elapsed = time.monotonic() - self._session_start
+        rate = self._session_points / elapsed if elapsed > 0 else float('inf')
+        self.progress_callback(DownloadProgress(
+            self._points_done(), self.total_points, rate, (self.total_points - position) / rate,
+            replaying, position if replaying else 0,
+        ))
+
+    def _transfer_ranges(self, samples: np.ndarray):
+        while self.completed_chunks < self.chunks:
+            start = self.completed_chunks * self.chunk_points
+            count = min(self.chunk_points, self.total_points - start)
+            self._store(samples, self.completed_chunks, self.fetch_chunk(start, count))
+
+    def _transfer_block(self, samples: np.ndarray):
+        pieces = self.transport.query_block_pieces(
+            self.data_query, self.chunk_points, expected_size=self.total_points)
+        with closing(pieces):
+            for chunk, piece in enumerate(pieces):
+                if chunk >= self.completed_chunks:
+                    self._store(samples, chunk, piece)
+                    continue
+                # chunks saved before the interruption come again, there is no way to skip
+                # them; they take line time all the same, so they count for the rate
+                self._session_points += len(piece)
+                self._report(chunk * self.chunk_points + len(piece), replaying=True)
+
+    def _recover(self):
+        """
+        get the link back into a known state after a failed transfer
+        """
+        if self.reconnect is not None:
+            self.transport = self.reconnect()
+        else:
+            self.transport.reset_input()
+
+    def run(self) -> np.ndarray:
+        """
+        download the missing chunks of the record
+        :return: memory map over the downloaded samples
+        """
+        self.completed_chunks = self._load_progress()
+        if self.completed_chunks:
+            samples = open_capture(self.path, mode='r+').samples
+        else:
+            samples = create_capture(
+                self.path, self.total_points, channel=self.channel, preamble=self.preamble)
+            self._save_progress(0)
+
+        self._session_start = time.monotonic()
+        self._session_points = 0
+        failures_in_row = 0
+        while self.completed_chunks < self.chunks:
+            completed_before = self.completed_chunks
+            try:
+                if self.chunk_query is None:
+                    self._transfer_block(samples)
+                else:
+                    self._transfer_ranges(samples)
+            except (TimeoutError, ValueError, OSError) as error:
+                self.failures += 1
+                # counted from the last chunk that made it through
+                failures_in_row = 1 if self.completed_chunks > completed_before \
+                    else failures_in_row + 1
+                if failures_in_row > self.retries:
+                    raise RuntimeError(
+                        f'chunk {self.completed_chunks} failed {failures_in_row} times in a '
+                        f'row, run the download again to resume from it'
+                    ) from error
+                self._recover()
+        os.remove(self.progress_path)
+        return samples
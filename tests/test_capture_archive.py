@@ -0,0 +1,42 @@
+import os
+
+import numpy as np
+
+from hp_oscilloscope.capture_archive import INDEX_DTYPE, INDEX_FILE, CaptureArchive, chunk_name
+
+
+def test_append_after_torn_index_record(tmp_path):
+    directory = str(tmp_path / 'archive')
+    with CaptureArchive(directory, writable=True) as archive:
+        archive.append(np.arange(100, dtype=np.uint8), channel=1, timestamp=1.)
+    # crash in the middle of the next append, only a part of its index record made it
+    with open(os.path.join(directory, INDEX_FILE), 'ab') as index_file:
+        index_file.write(b'\xff' * (INDEX_DTYPE.itemsize // 2))
+
+    with CaptureArchive(directory, writable=True) as archive:
+        assert len(archive) == 1
+        archive.append(np.arange(50, dtype='<i2'), channel=2, timestamp=2.)
+    assert os.path.getsize(os.path.join(directory, INDEX_FILE)) == 2 * INDEX_DTYPE.itemsize
+
+    with CaptureArchive(directory) as archive:
+        assert len(archive) == 2
+        np.testing.assert_array_equal(archive.samples(0), np.arange(100))
+        capture = archive.capture(1)
+        assert capture.channel == 2
+        assert capture.timestamp == 2.
+        np.testing.assert_array_equal(capture.samples, np.arange(50))
+
+
+def test_append_after_torn_samples(tmp_path):
+    directory = str(tmp_path / 'archive')
+    with CaptureArchive(directory, writable=True) as archive:
+        archive.append(np.arange(100, dtype=np.uint8), timestamp=1.)
+    # samples of a crashed append, never referenced by the index
+    with open(os.path.join(directory, chunk_name(0)), 'ab') as data_file:
+        data_file.write(b'\xff' * 1000)
+
+    with CaptureArchive(directory, writable=True) as archive:
+        archive.append(np.arange(10, 20, dtype=np.uint8), timestamp=2.)
+        assert archive.find(1.5).tolist() == [1]
+        np.testing.assert_array_equal(archive.samples(0), np.arange(100))
+        np.testing.assert_array_equal(archive.samples(1), np.arange(10, 20))
@@ -0,0 +1,104 @@
+from math import log, sqrt
+
+import numpy as np
+import pytest
+
+from hp_oscilloscope.spectral_band import SpectralBand
+from hp_oscilloscope.spectral_engine import fill_store, fill_store_sliding
+from hp_oscilloscope.spectral_store import SpectralFrameStore
+
+SPAN = 512
+# (relative tolerance of real and imag, absolute tolerance of power in dB)
+TOLERANCES = {np.float64: (1e-9, 1e-8), np.float32: (1e-5, 1e-4)}
+
+
+def synthetic_signal(points: int = 2048) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    t = np.arange(points)
+    return 120. + 40. * np.sin(2 * np.pi * 0.013 * t) + 15. * np.sin(2 * np.pi * 0.21 * t) \
+        + rng.normal(0, 4, points)
+
+
+def reference_spectra(signal: np.ndarray, offsets: np.ndarray, span: int):
+    """
+    per-frame calculation of the original 'FFTAnimation.calculate_fft', limited to the
+    half of the spectrum kept by the store
+    """
+    power, real, imag = [], [], []
+    for offset in offsets:
+        f_out = np.fft.fft(signal[offset:offset + span], span)[:span // 2 + 1]
+        power.append([log(sqrt(z.real ** 2 + z.imag ** 2), 10) * 10 for z in f_out])
+        real.append([z.real for z in f_out])
+        imag.append([z.imag for z in f_out])
+    return np.array(power), np.array(real), np.array(imag)
+
+
+def assert_matches(store: SpectralFrameStore, expected, dtype, columns=slice(None)):
+    power, real, imag = (quantity[:, columns] for quantity in expected)
+    relative, power_tolerance = TOLERANCES[dtype]
+    scale = np.max(np.abs(real + 1j * imag))
+    np.testing.assert_allclose(store.power, power, rtol=0, atol=power_tolerance)
+    np.testing.assert_allclose(store.real, real, rtol=0, atol=relative * scale)
+    np.testing.assert_allclose(store.imag, imag, rtol=0, atol=relative * scale)
+
+
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+def test_fill_store_matches_per_frame_fft(dtype):
+    signal = synthetic_signal()
+    offsets = np.linspace(0, len(signal) - SPAN, 37).astype(np.intp)
+    store = SpectralFrameStore(len(offsets), SPAN // 2 + 1, dtype=dtype)
+    fill_store(store, signal, offsets, SPAN, batch_size=8)
+    assert_matches(store, reference_spectra(signal, offsets, SPAN), dtype)
+
+
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+def test_sliding_dft_matches_per_frame_fft(dtype):
+    signal = synthetic_signal()
+    # small steps are updated recursively, the long jump and the refreshes use the FFT
+    steps = np.tile([1, 2, 3, 0, 5], 30)
+    steps[70] = 200
+    offsets = np.concatenate([[0], np.cumsum(steps)]).astype(np.intp)
+    store = SpectralFrameStore(len(offsets), SPAN // 2 + 1, dtype=dtype)
+    fill_store_sliding(store, signal, offsets, SPAN, refresh_interval=64, batch_size=16)
+    assert_matches(store, reference_spectra(signal, offsets, SPAN), dtype)
+
+
+@pytest.mark.parametrize('bins', [(10, 30), (3, 200), (0, SPAN // 2)])
+def test_band_on_grid_matches_per_frame_fft(bins):
+    signal = synthetic_signal()
+    offsets = np.arange(0, len(signal) - SPAN, 97)
+    band = SpectralBand(SPAN, 1., (bins[0] / SPAN, bins[1] / SPAN))
+    assert band.direct_dft == (band.bins <= 32)
+    store = SpectralFrameStore(len(offsets), band.bins, dtype=np.float64)
+    fill_store(store, signal, offsets, SPAN, band=band)
+    assert_matches(
+        store, reference_spectra(signal, offsets, SPAN), np.float64,
+        slice(band.first_bin, band.last_bin + 1))
+
+
+def test_sliding_dft_in_band_matches_per_frame_fft():
+    signal = synthetic_signal()
+    offsets = np.arange(0, 300, 2)
+    band = SpectralBand(SPAN, 1., (5 / SPAN, 60 / SPAN))
+    store = SpectralFrameStore(len(offsets), band.bins, dtype=np.float64)
+    fill_store_sliding(store, signal, offsets, SPAN, band=band)
+    assert_matches(
+        store, reference_spectra(signal, offsets, SPAN), np.float64,
+        slice(band.first_bin, band.last_bin + 1))
+
+
+def test_zoomed_band_matches_per_frame_fft_on_the_grid():
+    signal = synthetic_signal()
+    offsets = np.arange(0, len(signal) - SPAN, 151)
+    zoom = 4
+    band = SpectralBand(SPAN, 1., (8 / SPAN, 40 / SPAN), zoom=zoom)
+    store = SpectralFrameStore(len(offsets), band.bins, dtype=np.float64)
+    fill_store(store, signal, offsets, SPAN, band=band)
+    # every zoom-th frequency of the band falls on an FFT bin
+    on_grid = SpectralFrameStore(
+        len(offsets), band.last_bin - band.first_bin + 1, dtype=np.float64)
+    for quantity in SpectralFrameStore.QUANTITIES:
+        getattr(on_grid, quantity)[:] = getattr(store, quantity)[:, ::zoom]
+    assert_matches(
+        on_grid, reference_spectra(signal, offsets, SPAN), np.float64,
+        slice(band.first_bin, band.last_bin + 1))